@@ -0,0 +1,97 @@
+"""
+Agent注册表（进程内缓存）
+Agent列表很少变化，讨论接口每次都查库没有必要。注册表在启动时加载，
+agent_service 的增删改接口提交后调用 invalidate()，下一次读取时重新加载。
+
+返回的是不可变快照：一次讨论生成过程中即使Agent被修改，也始终使用开始时的配置。
+多进程部署时其他进程的缓存靠TTL过期刷新。
+"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+from database import ReadSessionLocal, Agent
+from queries import agents_in_order
+
+load_dotenv()
+
+# 缓存最长有效期（秒），用于感知其他进程的修改
+AGENT_REGISTRY_TTL_SECONDS = float(os.getenv("AGENT_REGISTRY_TTL_SECONDS", "60"))
+
+
+@dataclass(frozen=True)
+class AgentSnapshot:
+    """Agent的不可变快照"""
+    id: int
+    name: str
+    role: str
+    system_prompt: str
+    model: Optional[str]
+    created_at: datetime
+
+    @classmethod
+    def from_model(cls, agent: Agent) -> "AgentSnapshot":
+        return cls(
+            id=agent.id,
+            name=agent.name,
+            role=agent.role,
+            system_prompt=agent.system_prompt,
+            model=agent.model,
+            created_at=agent.created_at
+        )
+
+
+class AgentRegistry:
+    """按创建顺序缓存全部Agent"""
+
+    def __init__(self, ttl_seconds: float = AGENT_REGISTRY_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._agents: Optional[Tuple[AgentSnapshot, ...]] = None
+        self._by_id: Dict[int, AgentSnapshot] = {}
+        self._loaded_at = 0.0
+        self._version = 0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._agents is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    async def load(self) -> Tuple[AgentSnapshot, ...]:
+        """从数据库加载；加载期间发生invalidate时不覆盖缓存，避免存入旧数据"""
+        version = self._version
+        async with ReadSessionLocal() as session:
+            result = await session.execute(agents_in_order())
+            agents = tuple(AgentSnapshot.from_model(agent) for agent in result.scalars().all())
+        if version == self._version:
+            self._agents = agents
+            self._by_id = {agent.id: agent for agent in agents}
+            self._loaded_at = time.monotonic()
+        return agents
+
+    async def all(self) -> Tuple[AgentSnapshot, ...]:
+        """全部Agent（按创建顺序）"""
+        if self._fresh():
+            return self._agents
+        async with self._lock:
+            if self._fresh():
+                return self._agents
+            return await self.load()
+
+    async def get(self, agent_id: int) -> Optional[AgentSnapshot]:
+        """按ID获取Agent，不存在返回None"""
+        if not self._fresh():
+            agents = await self.all()
+            return next((agent for agent in agents if agent.id == agent_id), None)
+        return self._by_id.get(agent_id)
+
+    def invalidate(self):
+        """Agent发生变化后调用"""
+        self._version += 1
+        self._agents = None
+        self._by_id = {}
+
+
+# 全局实例
+agent_registry = AgentRegistry()
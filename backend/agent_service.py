@@ -3,10 +3,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 from pydantic import BaseModel
-from database import get_db, Agent
+from database import get_write_db, Agent
 from models import AgentCreate, AgentUpdate, AgentResponse, ModelInfo
 from ai_client import SiliconFlowClient
 from init_default_agents import DEFAULT_AGENTS
+from agent_registry import agent_registry
 
 router = APIRouter(prefix="/api/agents", tags=["agents"])
 
@@ -23,25 +24,22 @@ async def get_available_models():
 
 
 @router.get("", response_model=List[AgentResponse])
-async def get_agents(db: AsyncSession = Depends(get_db)):
+async def get_agents():
     """获取所有Agent"""
-    result = await db.execute(select(Agent).order_by(Agent.created_at))
-    agents = result.scalars().all()
-    return agents
+    return list(await agent_registry.all())
 
 
 @router.get("/{agent_id}", response_model=AgentResponse)
-async def get_agent(agent_id: int, db: AsyncSession = Depends(get_db)):
+async def get_agent(agent_id: int):
     """获取单个Agent"""
-    result = await db.execute(select(Agent).where(Agent.id == agent_id))
-    agent = result.scalar_one_or_none()
+    agent = await agent_registry.get(agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     return agent
 
 
 @router.post("", response_model=AgentResponse, status_code=201)
-async def create_agent(agent_data: AgentCreate, db: AsyncSession = Depends(get_db)):
+async def create_agent(agent_data: AgentCreate, db: AsyncSession = Depends(get_write_db)):
     """创建新Agent"""
     agent = Agent(
         name=agent_data.name,
@@ -51,6 +49,7 @@ async def create_agent(agent_data: AgentCreate, db: AsyncSession = Depends(get_d
     )
     db.add(agent)
     await db.commit()
+    agent_registry.invalidate()
     await db.refresh(agent)
     return agent
 
@@ -59,7 +58,7 @@ async def create_agent(agent_data: AgentCreate, db: AsyncSession = Depends(get_d
 async def update_agent(
     agent_id: int,
     agent_data: AgentUpdate,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db)
 ):
     """更新Agent信息"""
     result = await db.execute(select(Agent).where(Agent.id == agent_id))
@@ -78,12 +77,13 @@ async def update_agent(
         agent.model = agent_data.model
     
     await db.commit()
+    agent_registry.invalidate()
     await db.refresh(agent)
     return agent
 
 
 @router.delete("/{agent_id}", status_code=204)
-async def delete_agent(agent_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_agent(agent_id: int, db: AsyncSession = Depends(get_write_db)):
     """删除Agent"""
     result = await db.execute(select(Agent).where(Agent.id == agent_id))
     agent = result.scalar_one_or_none()
@@ -92,13 +92,14 @@ async def delete_agent(agent_id: int, db: AsyncSession = Depends(get_db)):
     
     await db.delete(agent)
     await db.commit()
+    agent_registry.invalidate()
     return None
 
 
 @router.patch("/batch-update-model", response_model=List[AgentResponse])
 async def batch_update_model(
     update_data: BatchUpdateModel,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db)
 ):
     """批量更新Agent的模型"""
     if not update_data.agent_ids:
@@ -118,6 +119,7 @@ async def batch_update_model(
         agent.model = update_data.model
     
     await db.commit()
+    agent_registry.invalidate()
     
     # 刷新并返回
     for agent in agents:
@@ -127,7 +129,7 @@ async def batch_update_model(
 
 
 @router.post("/init-defaults", response_model=List[AgentResponse], status_code=201)
-async def init_default_team(db: AsyncSession = Depends(get_db)):
+async def init_default_team(db: AsyncSession = Depends(get_write_db)):
     """加载默认专业Agent团队"""
     # 检查是否已有Agent
     result = await db.execute(select(Agent))
@@ -147,6 +149,7 @@ async def init_default_team(db: AsyncSession = Depends(get_db)):
         created_agents.append(agent)
     
     await db.commit()
+    agent_registry.invalidate()
     
     # 刷新所有Agent
     for agent in created_agents:
@@ -156,7 +159,7 @@ async def init_default_team(db: AsyncSession = Depends(get_db)):
 
 
 @router.delete("/all", status_code=204)
-async def delete_all_agents(db: AsyncSession = Depends(get_db)):
+async def delete_all_agents(db: AsyncSession = Depends(get_write_db)):
     """删除所有Agent"""
     result = await db.execute(select(Agent))
     agents = result.scalars().all()
@@ -165,5 +168,6 @@ async def delete_all_agents(db: AsyncSession = Depends(get_db)):
         await db.delete(agent)
     
     await db.commit()
+    agent_registry.invalidate()
     return None
 
@@ -0,0 +1,282 @@
+"""
+冷数据归档
+长时间没有新消息的讨论，把它的全部消息压缩成一个blob存入message_archives表，并从messages表删除，
+让messages表只保留活跃数据。读取讨论详情时透明解压合并；
+讨论再次有写入（继续讨论、总结、辩论等）之前先解冻回messages表，上下文构建逻辑不需要感知归档。
+
+归档后的消息不再出现在消息全文检索中（话题和总结仍可检索）。
+
+用法：
+    python archive.py [--days 90] [--vacuum]
+"""
+import argparse
+import asyncio
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, insert, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import (
+    WriteSessionLocal, write_engine, dispose_engines, is_sqlite, DATABASE_URL,
+    Message, MessageArchive
+)
+from leases import running_discussions
+from queries import archive_by_discussion
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，未安装时使用zlib
+    zstandard = None
+
+load_dotenv()
+
+# 是否在应用内运行后台归档任务（默认关闭：归档后的消息不再能全文检索，需要显式开启）
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+# 最后一条消息超过多少天的讨论会被归档
+ARCHIVE_AFTER_DAYS = max(1, int(os.getenv("ARCHIVE_AFTER_DAYS", "90")))
+# 后台归档任务的运行间隔（小时）
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "6"))
+# 每轮最多归档的讨论数，避免一次长时间占用写连接
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "50"))
+ARCHIVE_CODEC = os.getenv("ARCHIVE_CODEC", "zstd" if zstandard else "zlib")
+
+
+# ===== 编解码 =====
+
+def compress(data: bytes, codec: str = ARCHIVE_CODEC) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("ARCHIVE_CODEC=zstd requires the zstandard package")
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    return zlib.compress(data, 9)
+
+
+def decompress(payload: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Archive is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+def pack_messages(messages) -> bytes:
+    """消息序列化为JSON：保存messages表的全部列（包括发言Agent快照）"""
+    items = []
+    for message in messages:
+        item = {column.name: getattr(message, column.name) for column in Message.__table__.columns}
+        item["created_at"] = message.created_at.isoformat() if message.created_at else None
+        items.append(item)
+    return json.dumps(items, ensure_ascii=False).encode("utf-8")
+
+
+def unpack_messages(archive: MessageArchive) -> List[dict]:
+    items = json.loads(decompress(archive.payload, archive.codec))
+    for item in items:
+        if item.get("created_at"):
+            item["created_at"] = datetime.fromisoformat(item["created_at"])
+    return items
+
+
+# ===== 读取 =====
+
+async def load_archived_messages(db: AsyncSession, discussion_id: int) -> List[dict]:
+    """讨论已归档的消息（按时间正序），未归档时返回空列表"""
+    result = await db.execute(archive_by_discussion(discussion_id))
+    archive = result.scalar_one_or_none()
+    if archive is None:
+        return []
+    return unpack_messages(archive)
+
+
+# ===== 归档与解冻 =====
+
+async def archive_discussion(session: AsyncSession, discussion_id: int) -> Optional[dict]:
+    """归档一个讨论的全部消息，返回统计；没有消息时返回None（调用方负责提交）"""
+    result = await session.execute(
+        select(Message)
+        .where(Message.discussion_id == discussion_id)
+        .order_by(Message.created_at, Message.id)
+    )
+    rows = result.scalars().all()
+    if not rows:
+        return None
+
+    raw = pack_messages(rows)
+    payload = compress(raw)
+    session.add(MessageArchive(
+        discussion_id=discussion_id,
+        codec=ARCHIVE_CODEC,
+        payload=payload,
+        message_count=len(rows),
+        raw_bytes=len(raw),
+        last_message_at=rows[-1].created_at
+    ))
+    # 只删除已打包的消息：归档过程中新写入的消息ID更大，不受影响，读取时会和归档合并
+    await session.execute(
+        delete(Message)
+        .where(Message.discussion_id == discussion_id)
+        .where(Message.id <= max(message.id for message in rows))
+    )
+    return {
+        "messages": len(rows),
+        "content_bytes": sum(len(message.content.encode("utf-8")) for message in rows),
+        "raw_bytes": len(raw),
+        "compressed_bytes": len(payload),
+    }
+
+
+async def thaw_discussion(discussion_id: int) -> int:
+    """
+    把归档的消息恢复到messages表（保留原ID和时间），返回恢复的消息数
+
+    写入讨论的接口在请求会话第一次查询之前调用（SQLite的读事务看不到之后提交的数据），
+    未归档时只是一次按唯一索引的查询
+    """
+    async with WriteSessionLocal() as session:
+        result = await session.execute(archive_by_discussion(discussion_id))
+        archive = result.scalar_one_or_none()
+        if archive is None:
+            return 0
+
+        columns = {column.name for column in Message.__table__.columns}
+        existing = set((await session.execute(
+            select(Message.id).where(Message.discussion_id == discussion_id)
+        )).scalars())
+        rows = [
+            {key: value for key, value in item.items() if key in columns}
+            for item in unpack_messages(archive)
+            if item["id"] not in existing
+        ]
+        if rows:
+            await session.execute(insert(Message), rows)
+        await session.delete(archive)
+        await session.commit()
+        return len(rows)
+
+
+async def find_idle_discussions(session: AsyncSession, cutoff: datetime, limit: int) -> List[int]:
+    """最后一条消息早于cutoff、且尚未归档的讨论"""
+    result = await session.execute(
+        select(Message.discussion_id)
+        .group_by(Message.discussion_id)
+        .having(func.max(Message.created_at) < cutoff)
+        .limit(limit)
+    )
+    return list(result.scalars())
+
+
+async def free_bytes() -> Optional[int]:
+    """SQLite空闲页占用的字节数（VACUUM后可从文件中释放），其他数据库返回None"""
+    if not is_sqlite(DATABASE_URL):
+        return None
+    async with write_engine.connect() as conn:
+        page_size = (await conn.exec_driver_sql("PRAGMA page_size")).scalar()
+        freelist = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+    return page_size * freelist
+
+
+async def compact(older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> dict:
+    """
+    归档一轮空闲讨论，返回报告
+
+    reclaimed_bytes 为消息正文减去压缩后大小（逻辑上节省的空间）；
+    SQLite删除的行会变成空闲页供后续写入复用，free_bytes 为当前可被VACUUM释放的大小
+    """
+    report = {
+        "discussions": 0, "messages": 0, "content_bytes": 0,
+        "raw_bytes": 0, "compressed_bytes": 0, "reclaimed_bytes": 0,
+        "codec": ARCHIVE_CODEC, "free_bytes": None,
+    }
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    async with WriteSessionLocal() as session:
+        candidates = await find_idle_discussions(session, cutoff, batch_size)
+
+    running = await running_discussions()
+    for discussion_id in candidates:
+        if discussion_id in running:
+            continue
+        try:
+            async with WriteSessionLocal() as session:
+                stats = await archive_discussion(session, discussion_id)
+                await session.commit()
+        except IntegrityError:
+            # 其他进程已归档
+            continue
+        if stats is None:
+            continue
+        report["discussions"] += 1
+        for key in ("messages", "content_bytes", "raw_bytes", "compressed_bytes"):
+            report[key] += stats[key]
+
+    report["reclaimed_bytes"] = report["content_bytes"] - report["compressed_bytes"]
+    report["free_bytes"] = await free_bytes()
+    return report
+
+
+def format_report(report: dict) -> str:
+    text = (
+        f"归档 {report['discussions']} 个讨论 / {report['messages']} 条消息，"
+        f"正文 {report['content_bytes'] / 1024:.1f}KB → 压缩后 {report['compressed_bytes'] / 1024:.1f}KB"
+        f"（{report['codec']}），节省 {report['reclaimed_bytes'] / 1024:.1f}KB"
+    )
+    if report["free_bytes"] is not None:
+        text += f"，数据库空闲页 {report['free_bytes'] / 1024:.1f}KB"
+    return text
+
+
+async def archive_loop():
+    """后台归档任务（在应用生命周期中运行）"""
+    while True:
+        try:
+            while True:
+                report = await compact()
+                if report["discussions"]:
+                    print(f"🗜️  {format_report(report)}")
+                if report["discussions"] < ARCHIVE_BATCH_SIZE:
+                    break
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️  归档任务失败: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="归档长时间没有新消息的讨论")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="最后一条消息超过多少天")
+    parser.add_argument("--vacuum", action="store_true", help="归档后执行VACUUM缩小数据库文件（仅SQLite）")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"冷数据归档 - 最后一条消息超过 {args.days} 天的讨论")
+    print("=" * 60)
+    try:
+        total = None
+        while True:
+            report = await compact(args.days)
+            if total is None:
+                total = report
+            else:
+                for key in ("discussions", "messages", "content_bytes", "raw_bytes", "compressed_bytes", "reclaimed_bytes"):
+                    total[key] += report[key]
+                total["free_bytes"] = report["free_bytes"]
+            if report["discussions"] < ARCHIVE_BATCH_SIZE:
+                break
+        print(f"✅ {format_report(total)}")
+
+        if args.vacuum and is_sqlite(DATABASE_URL):
+            async with write_engine.connect() as conn:
+                await conn.exec_driver_sql("VACUUM")
+            print("✅ VACUUM完成，空闲页已释放")
+    finally:
+        await dispose_engines()
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
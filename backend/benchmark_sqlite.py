@@ -0,0 +1,173 @@
+"""
+SQLite性能配置基准测试
+
+模拟多个SSE流并发写消息断点、同时有观看者读取历史、普通请求写入（用户消息等），对比三种布局：
+
+- default：SQLAlchemy默认配置，所有操作共用一个引擎
+- shared：WAL + pragma，断点走单写连接，请求写入走独立的读写连接池（与单写连接竞争SQLite写锁）
+- single-writer：WAL + pragma，所有写入都走单写连接（当前布局），请求会话只读
+
+用法：
+    python benchmark_sqlite.py [--writers 8] [--writes 200] [--readers 4] [--requests 4]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from database import Base, Discussion, Message, create_app_engine
+
+
+LAYOUTS = ("default", "shared", "single-writer")
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else 0.0
+
+
+async def run_profile(layout: str, writers: int, writes: int, readers: int, requests: int) -> dict:
+    """在临时数据库上跑一轮并发读写，返回吞吐统计"""
+    tmpdir = tempfile.mkdtemp(prefix="opinionroom-bench-")
+    url = f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    if layout == "default":
+        write_engine = read_engine = request_engine = create_app_engine(url, profile="default")
+    else:
+        write_engine = create_app_engine(url, role="writer", profile="performance")
+        read_engine = create_app_engine(url, role="reader", profile="performance")
+        # shared：请求写入使用读写都有的请求连接池；single-writer：请求写入和断点共用单写连接
+        request_engine = create_app_engine(url, profile="performance") if layout == "shared" else write_engine
+    WriteSession = async_sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False)
+    ReadSession = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    RequestSession = async_sessionmaker(request_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with write_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with WriteSession() as session:
+        discussion = Discussion(topic="benchmark", status="in_progress")
+        session.add(discussion)
+        await session.commit()
+        discussion_id = discussion.id
+
+    stats = {"writes": 0, "reads": 0, "locked": 0}
+    request_latencies = []
+    writers_done = asyncio.Event()
+
+    async def writer(index: int):
+        """每个写者模拟一个流式Agent：插入一条消息后反复更新断点"""
+        async with WriteSession() as session:
+            message = Message(
+                discussion_id=discussion_id, agent_id=None,
+                content="", message_type="agent", status="streaming"
+            )
+            session.add(message)
+            await session.commit()
+            message_id = message.id
+        content = ""
+        for i in range(writes):
+            content += f"writer {index} chunk {i} " * 4
+            try:
+                async with WriteSession() as session:
+                    await session.execute(
+                        update(Message).where(Message.id == message_id).values(content=content)
+                    )
+                    await session.commit()
+                stats["writes"] += 1
+            except OperationalError as e:
+                if "locked" in str(e):
+                    stats["locked"] += 1
+                else:
+                    raise
+
+    async def reader():
+        """观看者反复加载讨论历史"""
+        while not writers_done.is_set():
+            try:
+                async with ReadSession() as session:
+                    result = await session.execute(
+                        select(Message)
+                        .where(Message.discussion_id == discussion_id)
+                        .order_by(Message.created_at)
+                    )
+                    result.scalars().all()
+                stats["reads"] += 1
+            except OperationalError as e:
+                if "locked" in str(e):
+                    stats["locked"] += 1
+                else:
+                    raise
+            await asyncio.sleep(0)
+
+    async def request_writer():
+        """普通请求：断点写入期间不断保存短消息（如用户追问），记录每次提交的耗时"""
+        while not writers_done.is_set():
+            started = time.perf_counter()
+            try:
+                async with RequestSession() as session:
+                    session.add(Message(
+                        discussion_id=discussion_id, agent_id=None,
+                        content="user question", message_type="user"
+                    ))
+                    await session.commit()
+                request_latencies.append(time.perf_counter() - started)
+            except OperationalError as e:
+                if "locked" in str(e):
+                    stats["locked"] += 1
+                else:
+                    raise
+            await asyncio.sleep(0.005)
+
+    background = [asyncio.create_task(reader()) for _ in range(readers)]
+    background += [asyncio.create_task(request_writer()) for _ in range(requests)]
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(i) for i in range(writers)))
+    elapsed = time.perf_counter() - start
+    writers_done.set()
+    await asyncio.gather(*background)
+
+    for item in {write_engine, read_engine, request_engine}:
+        await item.dispose()
+
+    return {
+        "layout": layout,
+        "elapsed": elapsed,
+        "writes_per_sec": stats["writes"] / elapsed,
+        "reads_per_sec": stats["reads"] / elapsed,
+        "requests_per_sec": len(request_latencies) / elapsed,
+        "request_p50_ms": percentile(request_latencies, 0.5) * 1000,
+        "request_p99_ms": percentile(request_latencies, 0.99) * 1000,
+        "locked_errors": stats["locked"],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="SQLite性能配置基准测试")
+    parser.add_argument("--writers", type=int, default=8, help="并发写者数（模拟并行Agent流）")
+    parser.add_argument("--writes", type=int, default=200, help="每个写者的断点写入次数")
+    parser.add_argument("--readers", type=int, default=4, help="并发读者数（模拟观看者）")
+    parser.add_argument("--requests", type=int, default=4, help="并发的普通写请求数（模拟用户消息等）")
+    args = parser.parse_args()
+
+    print("=" * 100)
+    print(f"SQLite基准测试：{args.writers}个写者 × {args.writes}次写入，{args.readers}个读者，{args.requests}个写请求")
+    print("=" * 100)
+    print(f"{'布局':<15}{'耗时(s)':>9}{'断点/秒':>11}{'读取/秒':>11}{'请求写入/秒':>13}"
+          f"{'请求P50(ms)':>13}{'请求P99(ms)':>13}{'locked错误':>12}")
+    for layout in LAYOUTS:
+        result = await run_profile(layout, args.writers, args.writes, args.readers, args.requests)
+        print(
+            f"{result['layout']:<15}{result['elapsed']:>9.2f}"
+            f"{result['writes_per_sec']:>11.1f}{result['reads_per_sec']:>11.1f}"
+            f"{result['requests_per_sec']:>13.1f}{result['request_p50_ms']:>13.1f}"
+            f"{result['request_p99_ms']:>13.1f}{result['locked_errors']:>12}"
+        )
+    print("=" * 100)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,144 @@
+"""
+流式输出断点保存
+Agent生成过程中定期把已输出的内容写入messages表（status=streaming），
+服务重启后未完成的消息会被标记为interrupted，可在前端查看并续写
+"""
+import os
+import time
+from typing import Optional, TYPE_CHECKING
+from sqlalchemy import update, delete
+from dotenv import load_dotenv
+from database import WriteSessionLocal, Message
+from leases import running_discussions
+
+if TYPE_CHECKING:
+    from agent_registry import AgentSnapshot
+
+load_dotenv()
+
+# 每累积多少字符或经过多少秒保存一次
+CHECKPOINT_EVERY_CHARS = int(os.getenv("CHECKPOINT_EVERY_CHARS", "400"))
+CHECKPOINT_EVERY_SECONDS = float(os.getenv("CHECKPOINT_EVERY_SECONDS", "3"))
+
+# 消息状态
+STATUS_STREAMING = "streaming"
+STATUS_COMPLETED = "completed"
+STATUS_INTERRUPTED = "interrupted"
+
+
+class MessageCheckpointer:
+    """
+    单条Agent消息的断点写入器
+
+    每次写入使用单写连接上的独立短事务，不占用请求会话，
+    并行的多个Agent在写连接上排队保存进度。
+    新建消息时写入发言Agent的名称、角色和模型快照；
+    切换降级模型时修改 model 属性，随下一次保存写入
+    """
+
+    def __init__(
+        self,
+        discussion_id: int,
+        agent: Optional["AgentSnapshot"],
+        message_type: str = "agent",
+        message_id: Optional[int] = None,
+        content: str = "",
+        data_snapshot_id: Optional[str] = None
+    ):
+        self.discussion_id = discussion_id
+        self.agent = agent
+        self.model = agent.model if agent else None
+        self.message_type = message_type
+        self.message_id = message_id
+        self.content = content
+        self.data_snapshot_id = data_snapshot_id
+        self._saved_length = len(content)
+        self._saved_at = time.monotonic()
+
+    async def start(self) -> int:
+        """创建streaming状态的消息记录（续写已有消息时只更新状态）"""
+        async with WriteSessionLocal() as session:
+            if self.message_id is None:
+                message = Message(
+                    discussion_id=self.discussion_id,
+                    agent_id=self.agent.id if self.agent else None,
+                    agent_name=self.agent.name if self.agent else None,
+                    agent_role=self.agent.role if self.agent else None,
+                    model=self.model,
+                    content=self.content,
+                    message_type=self.message_type,
+                    status=STATUS_STREAMING,
+                    data_snapshot_id=self.data_snapshot_id
+                )
+                session.add(message)
+                await session.commit()
+                self.message_id = message.id
+            else:
+                await session.execute(
+                    update(Message)
+                    .where(Message.id == self.message_id)
+                    .values(status=STATUS_STREAMING, model=self.model)
+                )
+                await session.commit()
+        self._saved_at = time.monotonic()
+        return self.message_id
+
+    async def append(self, chunk: str):
+        """追加输出，达到阈值时保存断点"""
+        self.content += chunk
+        if (
+            len(self.content) - self._saved_length >= CHECKPOINT_EVERY_CHARS
+            or time.monotonic() - self._saved_at >= CHECKPOINT_EVERY_SECONDS
+        ):
+            await self.flush()
+
+    async def reset(self):
+        """丢弃已输出内容（切换降级模型重新生成时使用）"""
+        self.content = ""
+        await self.flush()
+
+    async def flush(self):
+        """立即保存当前内容"""
+        await self._write(content=self.content)
+        self._saved_length = len(self.content)
+        self._saved_at = time.monotonic()
+
+    async def finish(self, content: Optional[str] = None, status: str = STATUS_COMPLETED):
+        """保存最终内容并结束streaming状态"""
+        if content is not None:
+            self.content = content
+        await self._write(content=self.content, status=status)
+
+    async def discard(self):
+        """删除记录（没有任何输出时使用）"""
+        if self.message_id is None:
+            return
+        async with WriteSessionLocal() as session:
+            await session.execute(delete(Message).where(Message.id == self.message_id))
+            await session.commit()
+        self.message_id = None
+
+    async def _write(self, **values):
+        if self.message_id is None:
+            return
+        async with WriteSessionLocal() as session:
+            await session.execute(
+                update(Message).where(Message.id == self.message_id).values(model=self.model, **values)
+            )
+            await session.commit()
+
+
+async def finalize_interrupted_messages() -> int:
+    """
+    服务启动时把上次遗留的streaming消息标记为interrupted
+
+    多worker部署时跳过其他进程正在生成的讨论（持有运行锁）
+    """
+    running = await running_discussions()
+    query = update(Message).where(Message.status == STATUS_STREAMING)
+    if running:
+        query = query.where(Message.discussion_id.not_in(running))
+    async with WriteSessionLocal() as session:
+        result = await session.execute(query.values(status=STATUS_INTERRUPTED))
+        await session.commit()
+        return result.rowcount or 0
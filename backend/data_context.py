@@ -0,0 +1,144 @@
+"""
+数据增强的行情数据块
+把各代码的指标渲染成提示词中的数据块，按 (代码集合, 数据快照) 缓存：
+
+- 同一缓存周期内查看相同代码的请求拿到的是同一批行情对象，直接复用渲染好的数据块
+- 快照ID是渲染版本 + 数据内容的哈希，数据块和原始数据保存在 data_snapshots 表，
+  生成的消息记录 data_snapshot_id，之后可以查到当时Agent看到的数据；
+  保存失败时数据块照常使用，但不带快照ID、不进缓存（下次重新保存），消息不会引用不存在的快照
+- 数据块放在系统提示词的最前面，作为各Agent、各讨论共同的前缀，数据源一侧的提示词缓存可以复用
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Dict, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from database import WriteSessionLocal, ReadSessionLocal, DataSnapshot
+
+# 渲染格式版本：修改 render_data_context 的输出时加1，旧快照保持原样
+DATA_CONTEXT_VERSION = 1
+# 缓存的数据块数量
+DATA_CONTEXT_CACHE_SIZE = 256
+
+# 数据块之后的提问（放在消息最后，不影响前缀）
+DATA_CONTEXT_INSTRUCTION = (
+    "请基于系统提示中的实时趋势数据和技术指标，验证和调整你之前的建议。"
+    "关注趋势（1周/1月/3月）、动量和风险（波动率、回撤），不只是当天价格。"
+)
+
+
+@dataclass(frozen=True)
+class DataContextBlock:
+    """渲染好的数据块（snapshot_id 为None表示快照未能保存）"""
+    snapshot_id: Optional[str]
+    version: int
+    symbols: Tuple[str, ...]
+    content: str
+
+
+def render_data_context(stock_data: Dict[str, Dict], symbols: Tuple[str, ...]) -> str:
+    """按给定的代码顺序渲染数据块"""
+    lines = ["以下是实时股票趋势数据：", ""]
+    for symbol in symbols:
+        data = stock_data[symbol]
+        lines.append(f"**{symbol}**:")
+        lines.append(f"- 当前价格: ${data.get('current_price', 'N/A')}")
+        for period, label in (("1w", "1周"), ("1mo", "1月"), ("3mo", "3月")):
+            t = data.get(f"trend_{period}")
+            if t:
+                lines.append(f"- {label}趋势: {t['change_percent']:+.2f}% (${t['old_price']:.2f} → ${t['current_price']:.2f})")
+        if data.get('rsi') is not None:
+            lines.append(f"- RSI(14): {data['rsi']:.2f}")
+        if data.get('sma_20') is not None:
+            sma_50 = f"{data['sma_50']:.2f}" if data.get('sma_50') is not None else "N/A"
+            lines.append(f"- 均线: SMA20 ${data['sma_20']:.2f} / SMA50 ${sma_50}")
+        if data.get('macd'):
+            m = data['macd']
+            lines.append(f"- MACD(12,26,9): {m['macd']:+.3f}，信号线 {m['signal']:+.3f}，柱 {m['histogram']:+.3f}")
+        if data.get('volatility_20d') is not None:
+            lines.append(f"- 20日波动率(年化): {data['volatility_20d']:.1f}%")
+        if data.get('max_drawdown') is not None:
+            lines.append(f"- 回撤: 当前 {data['drawdown']:.2f}%，区间最大 {data['max_drawdown']:.2f}%")
+        if data.get('volume_ratio') is not None:
+            lines.append(f"- 成交量: 近5日均量为20日均量的 {data['volume_ratio']:.2f} 倍")
+        lines.append("")
+    return "\n".join(lines).rstrip() + "\n"
+
+
+class DataContextRenderer:
+    """数据块缓存：先按行情对象判断是否同一快照，再按内容哈希去重"""
+
+    def __init__(self, max_size: int = DATA_CONTEXT_CACHE_SIZE):
+        self.max_size = max_size
+        # 代码集合 -> (渲染时的行情对象, 数据块)
+        self._by_symbols: "OrderedDict[Tuple[str, ...], Tuple[tuple, DataContextBlock]]" = OrderedDict()
+        # 快照ID -> 数据块（已保存到数据库）
+        self._by_id: "OrderedDict[str, DataContextBlock]" = OrderedDict()
+
+    async def block_for(self, stock_data: Dict[str, Dict]) -> DataContextBlock:
+        """返回数据块，新快照保存到数据库；保存失败时返回不带快照ID的数据块"""
+        symbols = tuple(sorted(stock_data))
+        objects = tuple(stock_data[symbol] for symbol in symbols)
+        cached = self._by_symbols.get(symbols)
+        # 行情缓存在有效期内返回同一批对象：直接复用，不需要序列化和哈希
+        if cached is not None and all(a is b for a, b in zip(cached[0], objects)):
+            self._by_symbols.move_to_end(symbols)
+            return cached[1]
+
+        payload = json.dumps(dict(zip(symbols, objects)), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        snapshot_id = hashlib.sha256(f"{DATA_CONTEXT_VERSION}\n{payload}".encode("utf-8")).hexdigest()[:16]
+        block = self._by_id.get(snapshot_id)
+        if block is None:
+            block = DataContextBlock(snapshot_id, DATA_CONTEXT_VERSION, symbols, render_data_context(stock_data, symbols))
+            if not await self._save(block, payload):
+                return replace(block, snapshot_id=None)
+            self._by_id[snapshot_id] = block
+        self._by_id.move_to_end(snapshot_id)
+        self._by_symbols[symbols] = (objects, block)
+        self._by_symbols.move_to_end(symbols)
+        for entries in (self._by_symbols, self._by_id):
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+        return block
+
+    async def _save(self, block: DataContextBlock, payload: str) -> bool:
+        """保存快照，返回数据库中是否已有这一行"""
+        try:
+            async with WriteSessionLocal() as session:
+                if await session.get(DataSnapshot, block.snapshot_id) is None:
+                    session.add(DataSnapshot(
+                        id=block.snapshot_id,
+                        version=block.version,
+                        symbols=",".join(block.symbols),
+                        payload=payload,
+                        content=block.content
+                    ))
+                    await session.commit()
+        except IntegrityError:
+            # 其他进程同时保存了同一个快照
+            pass
+        except Exception as e:
+            print(f"⚠️  保存行情快照失败 ({block.snapshot_id}): {e}")
+            return False
+        return True
+
+
+async def load_snapshot(snapshot_id: str) -> Optional[Dict]:
+    """读取保存的快照"""
+    async with ReadSessionLocal() as session:
+        snapshot = await session.get(DataSnapshot, snapshot_id)
+    if snapshot is None:
+        return None
+    return {
+        "id": snapshot.id,
+        "version": snapshot.version,
+        "symbols": snapshot.symbols.split(","),
+        "data": json.loads(snapshot.payload),
+        "content": snapshot.content,
+        "created_at": snapshot.created_at
+    }
+
+
+# 全局实例
+data_contexts = DataContextRenderer()
@@ -2,27 +2,116 @@
 股票数据获取模块
 支持从多个数据源获取实时股票趋势数据
 """
-import httpx
+import asyncio
+import json
 import os
 import time
-from typing import Dict, List, Optional
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from database import WriteSessionLocal, ReadSessionLocal, MarketCache
+from leases import acquire_lease, release_lease, new_token
+from indicators import compute_indicators
+from ttl_cache import TTLCache
+from symbols import symbol_resolver
+from market_store import bar_span, fetch_start, save_bars, merge_closes, load_bars
+from market_providers import HttpPool, MarketProvider, ProviderChain, build_providers, RECENT_CLOSES_MAX_GAP_DAYS
 
 load_dotenv()
 
+# 行情缓存有效期（秒）
+MARKET_CACHE_TTL_SECONDS = int(os.getenv("MARKET_CACHE_TTL_SECONDS", "300"))
+# 过期后仍可直接返回（同时后台刷新）的时长（秒）
+MARKET_STALE_TTL_SECONDS = int(os.getenv("MARKET_STALE_TTL_SECONDS", "1800"))
+# 进程内缓存的最大条目数（LRU淘汰）
+MARKET_MEMORY_CACHE_SIZE = int(os.getenv("MARKET_MEMORY_CACHE_SIZE", "512"))
+# 单飞锁有效期（秒）：抓取方崩溃时其他进程最多等待这么久
+MARKET_FETCH_LEASE_SECONDS = float(os.getenv("MARKET_FETCH_LEASE_SECONDS", "15"))
+# 等待其他进程抓取结果时的轮询间隔（秒）
+MARKET_FETCH_POLL_SECONDS = 0.5
+# 单个代码的获取超时（秒），超时后使用本地已存的K线或旧缓存
+MARKET_SYMBOL_TIMEOUT_SECONDS = float(os.getenv("MARKET_SYMBOL_TIMEOUT_SECONDS", "8"))
+
 
 class StockDataFetcher:
-    """股票数据获取器（带缓存）"""
+    """
+    股票数据获取器（带缓存）
+
+    日线保存在本地（见 market_store.py），每次只从数据源增量获取新的K线。
+    计算好的指标缓存在数据库market_cache表中，多个worker共享，前面再加一层进程内LRU缓存（见 ttl_cache.py）：
+    过期不久的数据立即返回并在后台刷新，同一进程内对同一代码的并发请求只触发一次获取；
+    缓存过期时通过租约保证同一代码只有一个进程访问外部接口，其他进程等待它写回缓存。
+    多个代码并发获取，共用一个连接池，每个主机的并发请求数受 MARKET_MAX_CONCURRENCY 限制；
+    数据源按优先级故障切换（见 market_providers.py）
+    """
     
-    def __init__(self, cache_ttl: int = 300):
+    def __init__(self, cache_ttl: int = MARKET_CACHE_TTL_SECONDS, providers: Optional[List[MarketProvider]] = None):
         """
         Args:
             cache_ttl: 缓存有效期（秒），默认5分钟
+            providers: 数据源列表（按优先级），默认按 MARKET_PROVIDERS 配置创建
         """
-        self.yahoo_finance_base = "https://query1.finance.yahoo.com/v8/finance/chart"
-        self.alpha_vantage_key = os.getenv("ALPHA_VANTAGE_API_KEY")
         self.cache_ttl = cache_ttl
-        self._cache: Dict[str, tuple] = {}  # {symbol: (data, timestamp)}
+        self.cache = TTLCache(MARKET_MEMORY_CACHE_SIZE, cache_ttl, max(cache_ttl, MARKET_STALE_TTL_SECONDS))
+        self.http = HttpPool()
+        self.providers = ProviderChain(providers) if providers is not None else build_providers(self.http)
+        self._background = set()
+    
+    async def aclose(self):
+        """关闭连接池（应用关闭时调用）"""
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        await self.cache.aclose()
+        await self.providers.aclose()
+        await self.http.aclose()
+    
+    # ===== 共享缓存 =====
+    
+    @staticmethod
+    def _cache_key(symbol: str, periods: List[str]) -> str:
+        return f"trends:v2:{symbol}:{','.join(periods)}"
+    
+    async def _read_cache(self, key: str) -> Optional[Tuple[Dict, float]]:
+        """返回 (数据, 缓存时长秒)，没有缓存时返回None"""
+        async with ReadSessionLocal() as session:
+            entry = await session.get(MarketCache, key)
+        if entry is None:
+            return None
+        return json.loads(entry.payload), (datetime.utcnow() - entry.fetched_at).total_seconds()
+    
+    async def _write_cache(self, key: str, data: Dict):
+        async with WriteSessionLocal() as session:
+            await session.merge(MarketCache(
+                key=key, payload=json.dumps(data, ensure_ascii=False), fetched_at=datetime.utcnow()
+            ))
+            try:
+                await session.commit()
+            except IntegrityError:
+                # 其他进程同时写入了同一条缓存
+                await session.rollback()
+    
+    async def _fetch_shared(self, key: str, symbol: str, periods: List[str]) -> Optional[Dict]:
+        """缓存未命中：拿到单飞锁的进程负责抓取，其他进程等待共享缓存更新"""
+        lease_name = f"market:{key}"
+        owner = new_token()
+        deadline = asyncio.get_running_loop().time() + MARKET_FETCH_LEASE_SECONDS
+        while not await acquire_lease(lease_name, owner, MARKET_FETCH_LEASE_SECONDS):
+            await asyncio.sleep(MARKET_FETCH_POLL_SECONDS)
+            cached = await self._read_cache(key)
+            if cached and cached[1] < self.cache_ttl:
+                return cached[0]
+            if asyncio.get_running_loop().time() >= deadline:
+                # 等待超时，自行抓取
+                return await self._fetch_data(symbol, periods)
+        try:
+            data = await self._fetch_data(symbol, periods)
+            if data:
+                await self._write_cache(key, data)
+            return data
+        finally:
+            await release_lease(lease_name, owner)
     
     async def get_stock_trends(
         self, 
@@ -47,182 +136,175 @@ class StockDataFetcher:
                     "trend_1mo": {"change": 12.5, "change_percent": 5.2},
                     "trend_3mo": {"change": 28.3, "change_percent": 12.7},
                     "rsi": 65.2,
-                    "volume": 50000000
+                    "sma_20": 245.1, "sma_50": 238.7, "ema_12": 247.3, "ema_26": 242.0,
+                    "macd": {"macd": 5.3, "signal": 4.1, "histogram": 1.2},
+                    "volatility_20d": 48.5,
+                    "drawdown": -3.2, "max_drawdown": -18.4,
+                    "volume": 50000000, "volume_avg_20d": 42000000, "volume_ratio": 1.15
                 }
             }
         """
-        results = {}
-        current_time = time.time()
-        
-        for symbol in symbols:
-            # 检查缓存
-            if use_cache and symbol in self._cache:
-                cached_data, cache_time = self._cache[symbol]
-                if current_time - cache_time < self.cache_ttl:
-                    results[symbol] = cached_data
-                    continue
-            
-            # 缓存未命中或过期，重新获取
-            try:
-                data = await self._fetch_yahoo_data(symbol, periods)
+        results = {symbol: data async for symbol, data in self.iter_stock_trends(symbols, periods, use_cache)}
+        # 按请求的顺序返回
+        return {symbol: results[symbol] for symbol in symbols if symbol in results}
+    
+    def prefetch(self, symbols: List[str], periods: List[str] = ["1w", "1mo", "3mo"]):
+        """
+        后台获取（不等待结果），数据写入缓存
+
+        之后对同样代码的 get_stock_trends 直接命中缓存；获取还没完成时加入同一次获取
+        """
+        if not symbols:
+            return
+        task = asyncio.create_task(self.get_stock_trends(symbols, periods))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+    
+    async def iter_stock_trends(
+        self,
+        symbols: List[str],
+        periods: List[str] = ["1w", "1mo", "3mo"],
+        use_cache: bool = True
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """并发获取多个代码，按完成顺序逐个产出 (代码, 数据)；获取失败且没有缓存的代码跳过"""
+        tasks = [
+            asyncio.create_task(self._get_symbol(symbol, periods, use_cache))
+            for symbol in dict.fromkeys(symbols)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                symbol, data = await next_done
                 if data:
-                    results[symbol] = data
-                    # 更新缓存
-                    if use_cache:
-                        self._cache[symbol] = (data, current_time)
-            except Exception as e:
-                print(f"获取 {symbol} 数据失败: {e}")
-                # 如果缓存中有旧数据，使用旧数据
-                if use_cache and symbol in self._cache:
-                    cached_data, _ = self._cache[symbol]
-                    results[symbol] = cached_data
-                    print(f"使用 {symbol} 的缓存数据")
-                continue
-        
-        return results
+                    yield symbol, data
+        finally:
+            # 调用方提前停止迭代时取消剩余的获取
+            for task in tasks:
+                task.cancel()
     
-    async def _fetch_yahoo_data(
-        self, 
-        symbol: str, 
-        periods: List[str]
-    ) -> Optional[Dict]:
-        """从Yahoo Finance获取数据"""
+    async def _get_symbol(self, symbol: str, periods: List[str], use_cache: bool) -> Tuple[str, Optional[Dict]]:
+        """获取单个代码（带缓存和超时），返回 (代码, 数据)"""
+        key = self._cache_key(symbol, periods)
         try:
-            # 获取当前价格和基本信息
-            url = f"{self.yahoo_finance_base}/{symbol}"
-            params = {
-                "interval": "1d",
-                "range": "3mo",
-                "includePrePost": "false"
-            }
-            
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                if "chart" not in data or "result" not in data["chart"]:
-                    return None
-                
-                result = data["chart"]["result"][0]
-                timestamps = result.get("timestamp", [])
-                closes = result.get("indicators", {}).get("quote", [{}])[0].get("close", [])
-                
-                if not closes or not timestamps:
-                    return None
-                
-                current_price = closes[-1] if closes else None
-                
-                # 计算各周期趋势
-                trends = {}
-                period_days = {"1w": 7, "1mo": 30, "3mo": 90}
-                
-                for period in periods:
-                    days = period_days.get(period, 30)
-                    if len(closes) >= days:
-                        old_price = closes[-days] if closes[-days] else closes[0]
-                        if old_price and current_price:
-                            change = current_price - old_price
-                            change_percent = (change / old_price) * 100
-                            trends[f"trend_{period}"] = {
-                                "change": round(change, 2),
-                                "change_percent": round(change_percent, 2),
-                                "old_price": round(old_price, 2),
-                                "current_price": round(current_price, 2)
-                            }
-                
-                # 计算简单RSI（14日）
-                rsi = self._calculate_simple_rsi(closes[-14:]) if len(closes) >= 14 else None
-                
-                return {
-                    "symbol": symbol,
-                    "current_price": round(current_price, 2) if current_price else None,
-                    **trends,
-                    "rsi": round(rsi, 2) if rsi else None,
-                    "volume": result.get("indicators", {}).get("quote", [{}])[0].get("volume", [None])[-1]
-                }
-                
+            if use_cache:
+                fetch = self.cache.get(
+                    key,
+                    load=lambda: self._load_shared(key, symbol, periods),
+                    seed=lambda: self._seed_from_shared(key)
+                )
+            else:
+                fetch = self._fetch_data(symbol, periods)
+            data = await asyncio.wait_for(fetch, MARKET_SYMBOL_TIMEOUT_SECONDS)
+            if data:
+                return symbol, data
+        except asyncio.TimeoutError:
+            print(f"获取 {symbol} 数据超时")
         except Exception as e:
-            print(f"Yahoo Finance API错误 ({symbol}): {e}")
-            return None
+            print(f"获取 {symbol} 数据失败: {e}")
+        # 使用本地已存的K线，没有时使用旧缓存
+        try:
+            data = await self._from_store(symbol, periods)
+        except Exception as e:
+            print(f"读取 {symbol} 本地行情失败: {e}")
+            data = None
+        if data:
+            print(f"使用 {symbol} 的本地行情数据")
+            return symbol, data
+        cached = self.cache.peek(key)
+        if cached:
+            print(f"使用 {symbol} 的缓存数据")
+            return symbol, cached[0]
+        return symbol, None
     
-    def _calculate_simple_rsi(self, prices: List[float]) -> Optional[float]:
-        """计算简单RSI（相对强弱指标）"""
-        if len(prices) < 14:
+    async def _seed_from_shared(self, key: str) -> Optional[Tuple[Dict, float]]:
+        """进程内缓存没有时读取共享缓存，返回 (数据, 获取时间)"""
+        cached = await self._read_cache(key)
+        if cached is None:
             return None
+        return cached[0], time.time() - cached[1]
+    
+    async def _load_shared(self, key: str, symbol: str, periods: List[str]) -> Optional[Tuple[Dict, float]]:
+        data = await self._fetch_shared(key, symbol, periods)
+        return (data, time.time()) if data else None
+    
+    async def refresh_ahead(self, symbol: str, horizon: float, periods: List[str] = ["1w", "1mo", "3mo"]) -> bool:
+        """
+        预取：缓存会在horizon秒内过期时提前刷新，返回是否有可用数据
+
+        共享缓存中其他进程刚刷新过的数据直接载入内存，不访问外部接口
+        """
+        key = self._cache_key(symbol, periods)
+        entry = self.cache.peek(key)
+        if entry is not None and entry[1] + horizon < self.cache_ttl:
+            return True
         
-        gains = []
-        losses = []
-        
-        for i in range(1, len(prices)):
-            change = prices[i] - prices[i-1]
-            if change > 0:
-                gains.append(change)
-                losses.append(0)
-            else:
-                gains.append(0)
-                losses.append(abs(change))
+        async def load() -> Optional[Tuple[Dict, float]]:
+            cached = await self._read_cache(key)
+            if cached and cached[1] + horizon < self.cache_ttl:
+                return cached[0], time.time() - cached[1]
+            return await self._load_shared(key, symbol, periods)
         
-        if not gains or not losses:
+        return await self.cache.refresh(key, load) is not None
+    
+    async def _fetch_data(self, symbol: str, periods: List[str]) -> Optional[Dict]:
+        """从数据源增量更新本地日线，再由本地K线计算指标"""
+        try:
+            await self._refresh_bars(symbol)
+        except Exception as e:
+            print(f"行情数据源错误 ({symbol}): {e}")
             return None
-        
-        avg_gain = sum(gains) / len(gains)
-        avg_loss = sum(losses) / len(losses)
-        
-        if avg_loss == 0:
-            return 100
-        
-        rs = avg_gain / avg_loss
-        rsi = 100 - (100 / (1 + rs))
-        
-        return rsi
+        return await self._from_store(symbol, periods)
+    
+    async def _refresh_bars(self, symbol: str):
+        """
+        按优先级从数据源更新本地日线，出错时切换到下一个数据源
+
+        已有足够历史且落后不多的代码优先通过批量报价只更新已存交易日的收盘价；
+        批量报价出现新的交易日时（收盘价照常更新）继续请求完整K线，新交易日带上开高低和成交量。
+        其他代码（首次获取、长时间未更新、批量接口没有返回）直接请求完整K线。
+        所有数据源都出错时抛出异常；只是没有数据（代码不存在）时直接返回
+        """
+        span = await bar_span(symbol)
+        start = fetch_start(span)
+        incremental = (
+            span is not None and start == span[2]
+            and time.time() - start <= RECENT_CLOSES_MAX_GAP_DAYS * 86400
+        )
+        errors = []
+        for provider in self.providers.ordered():
+            try:
+                if incremental and provider.batch_closes:
+                    closes = await self.providers.call(provider, provider.recent_closes, symbol)
+                    if closes:
+                        await merge_closes(symbol, closes)
+                        if all(bar["day"] <= span[1] for bar in closes):
+                            return
+                bars = await self.providers.call(provider, provider.fetch_bars, symbol, start)
+            except Exception as e:
+                errors.append(f"{provider.name}: {e}")
+                continue
+            if bars:
+                await save_bars(symbol, bars)
+                return
+        if errors:
+            raise RuntimeError("; ".join(errors))
+    
+    async def _from_store(self, symbol: str, periods: List[str]) -> Optional[Dict]:
+        """由本地K线计算指标，没有数据时返回None"""
+        bars = await load_bars(symbol)
+        if not bars["timestamp"]:
+            return None
+        indicators = compute_indicators(bars["timestamp"], bars["close"], bars["volume"], periods)
+        if indicators is None:
+            return None
+        return {"symbol": symbol, **indicators}
     
     def extract_stock_symbols(self, text: str) -> List[str]:
         """
-        从文本中提取股票代码
+        从文本中提取股票代码（按置信度排序）
         
-        支持：
-        - 美股代码：TSLA, AAPL, MSFT
-        - 中文名称映射：特斯拉→TSLA, 苹果→AAPL
+        支持美股、中概股、港股、A股的代码、中英文名称和拼音，见 symbols.py
         """
-        # 美股代码映射（常见股票）
-        stock_map = {
-            "特斯拉": "TSLA",
-            "苹果": "AAPL",
-            "微软": "MSFT",
-            "英伟达": "NVDA",
-            "谷歌": "GOOGL",
-            "亚马逊": "AMZN",
-            "Meta": "META",
-            "脸书": "META",
-            "Netflix": "NFLX",
-            "奈飞": "NFLX",
-            "阿里巴巴": "BABA",
-            "腾讯": "TCEHY",
-            "比亚迪": "BYDDF",
-            "蔚来": "NIO",
-            "理想": "LI",
-            "小鹏": "XPEV"
-        }
-        
-        import re
-        
-        # 提取美股代码（大写字母，2-5个字符）
-        pattern = r'\b([A-Z]{2,5})\b'
-        codes = re.findall(pattern, text.upper())
-        
-        # 过滤常见单词
-        common_words = {"THE", "AND", "FOR", "ARE", "BUT", "NOT", "YOU", "ALL", "CAN", "HER", "WAS", "ONE", "OUR", "OUT", "DAY", "GET", "HAS", "HIM", "HIS", "HOW", "ITS", "MAY", "NEW", "NOW", "OLD", "SEE", "TWO", "WAY", "WHO", "BOY", "DID", "ITS", "LET", "PUT", "SAY", "SHE", "TOO", "USE"}
-        codes = [c for c in codes if c not in common_words and len(c) >= 2]
-        
-        # 提取中文名称并映射
-        for chinese_name, symbol in stock_map.items():
-            if chinese_name in text:
-                if symbol not in codes:
-                    codes.append(symbol)
-        
-        # 去重并返回
-        return list(set(codes))
+        return symbol_resolver.extract(text)
 
 
 # 全局实例
@@ -1,14 +1,27 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import (
+    create_engine, event, Column, Integer, BigInteger, Float, String, Text, Date, DateTime, ForeignKey, Index, LargeBinary
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from datetime import datetime
+from typing import Tuple
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./opinionroom.db")
+
+def normalize_database_url(url: str) -> str:
+    """PostgreSQL地址统一使用asyncpg驱动（兼容 postgres:// 和 postgresql:// 写法）"""
+    for prefix in ("postgres://", "postgresql://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+DATABASE_URL = normalize_database_url(os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./opinionroom.db"))
 
 Base = declarative_base()
 
@@ -21,7 +34,7 @@ class Agent(Base):
     role = Column(String(200), nullable=False)
     system_prompt = Column(Text, nullable=False)
     model = Column(String(200), default="Qwen/Qwen2.5-7B-Instruct")  # AI模型
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     messages = relationship("Message", back_populates="agent")
 
@@ -33,9 +46,10 @@ class Discussion(Base):
     topic = Column(String(500), nullable=False)
     status = Column(String(20), default="in_progress")  # in_progress, paused, completed
     summary = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     messages = relationship("Message", back_populates="discussion", cascade="all, delete-orphan")
+    archive = relationship("MessageArchive", uselist=False, cascade="all, delete-orphan")
 
 
 class Message(Base):
@@ -44,26 +58,285 @@ class Message(Base):
     id = Column(Integer, primary_key=True, index=True)
     discussion_id = Column(Integer, ForeignKey("discussions.id"), nullable=False)
     agent_id = Column(Integer, ForeignKey("agents.id"), nullable=True)
+    # 发言时的Agent快照，Agent被修改或删除后历史消息不受影响
+    agent_name = Column(String(100), nullable=True)
+    agent_role = Column(String(200), nullable=True)
+    model = Column(String(200), nullable=True)  # 实际生成使用的模型
     content = Column(Text, nullable=False)
     message_type = Column(String(20), default="user")  # user, agent, summary
+    status = Column(String(20), default="completed")  # streaming, completed, interrupted
+    # 数据增强时使用的行情快照（见 data_context.py），用于复现当时的提示词
+    data_snapshot_id = Column(String(32), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     discussion = relationship("Discussion", back_populates="messages")
     agent = relationship("Agent", back_populates="messages")
 
+    __table_args__ = (
+        # 历史加载：按讨论过滤、按时间排序
+        Index("ix_messages_discussion_created", "discussion_id", "created_at"),
+        # 总结等只取某类消息的查询
+        Index("ix_messages_discussion_type_created", "discussion_id", "message_type", "created_at"),
+    )
+
+
+class MessageArchive(Base):
+    """冷数据归档：一个讨论的全部消息压缩成一个blob（见archive.py）"""
+    __tablename__ = "message_archives"
+
+    id = Column(Integer, primary_key=True, index=True)
+    discussion_id = Column(Integer, ForeignKey("discussions.id"), nullable=False, unique=True)
+    codec = Column(String(10), nullable=False)  # zlib, zstd
+    payload = Column(LargeBinary, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    raw_bytes = Column(Integer, nullable=False)  # 压缩前大小
+    last_message_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Lease(Base):
+    """跨进程租约（见leases.py）：讨论生成的运行锁、行情抓取的单飞锁"""
+    __tablename__ = "leases"
+
+    name = Column(String(200), primary_key=True)
+    owner = Column(String(100), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class MarketCache(Base):
+    """多个worker共享的行情缓存"""
+    __tablename__ = "market_cache"
+
+    key = Column(String(100), primary_key=True)
+    payload = Column(Text, nullable=False)  # JSON
+    fetched_at = Column(DateTime, nullable=False)
+
+
+class MarketBar(Base):
+    """日线行情（OHLCV），每个代码每个交易日一行，增量更新"""
+    __tablename__ = "market_bars"
+
+    symbol = Column(String(20), primary_key=True)
+    day = Column(Date, primary_key=True)  # 交易所当地日期
+    timestamp = Column(BigInteger, nullable=False)  # 数据源给出的K线时间戳（秒）
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Float)
+    fetched_at = Column(DateTime, nullable=False)
+
+
+class DataSnapshot(Base):
+    """数据增强的行情快照：渲染好的提示词数据块和原始数据，按内容哈希去重"""
+    __tablename__ = "data_snapshots"
+
+    id = Column(String(32), primary_key=True)
+    version = Column(Integer, nullable=False)  # 渲染格式版本
+    symbols = Column(String(500), nullable=False)  # 逗号分隔，按代码排序
+    payload = Column(Text, nullable=False)  # JSON：各代码的指标数据
+    content = Column(Text, nullable=False)  # 渲染后的数据块
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ===== SQLite性能配置 =====
+# performance: WAL + 调优的pragma + 读写分离的连接池；default: SQLAlchemy默认行为
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "performance")
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # 负数单位为KB，即64MB
+    "temp_store": "MEMORY",
+}
+# 只读连接池大小（WAL模式下读不阻塞写，可以有多个；不溢出，只用于短查询，推流期间不能占用）
+SQLITE_READER_POOL_SIZE = int(os.getenv("SQLITE_READER_POOL_SIZE", "8"))
+# 请求会话连接池（只读；流式接口会长时间持有会话，溢出上限需要足够大）
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+SQLITE_POOL_OVERFLOW = int(os.getenv("SQLITE_POOL_OVERFLOW", "50"))
+
+
+# ===== PostgreSQL连接池 =====
+# 多进程部署时每个worker各有一个连接池，数据库总连接预算按worker数分摊
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "80"))  # 留出余量，低于服务端max_connections
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
 
-# 异步数据库引擎
-engine = create_async_engine(DATABASE_URL, echo=False)
+
+def is_postgres(url: str) -> bool:
+    return url.startswith("postgresql")
+
+
+def pool_budget(workers: int = WEB_CONCURRENCY, max_connections: int = DB_MAX_CONNECTIONS) -> Tuple[int, int]:
+    """单个worker的 (pool_size, max_overflow)：常驻一半，另一半作为溢出应对流式接口的峰值"""
+    per_worker = max(2, max_connections // workers)
+    pool_size = max(1, per_worker // 2)
+    return pool_size, per_worker - pool_size
+
+
+def _apply_sqlite_pragmas(dbapi_connection, pragmas: dict, query_only: bool = False):
+    """在每个新连接上执行pragma"""
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    if query_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def create_app_engine(url: str = DATABASE_URL, role: str = "default", profile: str = SQLITE_PROFILE):
+    """
+    创建异步引擎
+    
+    Args:
+        role: default（读写都有，用于临时库和工具脚本）、writer（单连接，串行化短写事务）、
+              reader（只读连接池）、request（请求会话，只读，连接池可溢出）
+        profile: performance 或 default，仅对SQLite生效
+    
+    PostgreSQL不区分角色，连接池大小由 DB_MAX_CONNECTIONS / WEB_CONCURRENCY 决定
+    """
+    if is_postgres(url):
+        pool_size, max_overflow = pool_budget()
+        return create_async_engine(
+            url,
+            echo=False,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True  # 数据库重启或连接被回收后自动重连
+        )
+    
+    if not is_sqlite(url) or profile != "performance":
+        return create_async_engine(url, echo=False)
+    
+    in_memory = ":memory:" in url or url.rstrip("/").endswith("sqlite+aiosqlite:")
+    pragmas = dict(SQLITE_PRAGMAS)
+    if in_memory:
+        pragmas.pop("journal_mode")
+        pragmas.pop("mmap_size")
+    
+    kwargs = {"echo": False}
+    if not in_memory:
+        # aiosqlite默认NullPool，每次会话都重新打开文件并重新执行pragma，这里改为复用连接
+        kwargs["poolclass"] = AsyncAdaptedQueuePool
+        if role == "writer":
+            # 单写连接：写请求在连接池上排队，而不是在SQLite锁上忙等
+            kwargs.update(pool_size=1, max_overflow=0)
+        elif role == "reader":
+            kwargs.update(pool_size=SQLITE_READER_POOL_SIZE, max_overflow=0)
+        else:
+            # default 和 request 共用请求会话连接池的大小
+            kwargs.update(pool_size=SQLITE_POOL_SIZE, max_overflow=SQLITE_POOL_OVERFLOW)
+    
+    new_engine = create_async_engine(url, **kwargs)
+    
+    @event.listens_for(new_engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        _apply_sqlite_pragmas(dbapi_connection, pragmas, query_only=(role in ("reader", "request")))
+    
+    return new_engine
+
+
+# 读写分离：所有写入（请求中的写操作、流式断点、后台任务、迁移）走单连接写引擎，
+# 在连接池上排队而不是在SQLite写锁上忙等；请求会话（engine）和历史查询（read_engine）只读
+if is_sqlite(DATABASE_URL) and SQLITE_PROFILE == "performance":
+    write_engine = create_app_engine(DATABASE_URL, role="writer")
+    read_engine = create_app_engine(DATABASE_URL, role="reader")
+    engine = create_app_engine(DATABASE_URL, role="request")
+else:
+    engine = create_app_engine(DATABASE_URL)
+    write_engine = engine
+    read_engine = engine
 AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+WriteSessionLocal = async_sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+# ===== 全文检索（SQLite FTS5）=====
+# 外部内容表：索引只存倒排数据，正文仍在messages/discussions表中，由触发器保持同步。
+# trigram分词对中英文混排都能做子串匹配（查询词至少3个字符）。
+# 正在生成的消息（streaming）不入索引，避免每次断点保存都重建该行索引，结束时统一写入。
+FTS_TABLES = {
+    "messages_fts": (
+        "CREATE VIRTUAL TABLE messages_fts USING fts5("
+        "content, content='messages', content_rowid='id', tokenize='trigram')"
+    ),
+    "discussions_fts": (
+        "CREATE VIRTUAL TABLE discussions_fts USING fts5("
+        "topic, summary, content='discussions', content_rowid='id', tokenize='trigram')"
+    ),
+}
+FTS_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages
+    WHEN new.status IS NOT 'streaming' BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages
+    WHEN old.status IS NOT 'streaming' BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    # 同一事件的多个触发器执行顺序不确定，先删后插必须放在同一个触发器里
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content, status ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content)
+        SELECT 'delete', old.id, old.content WHERE old.status IS NOT 'streaming';
+        INSERT INTO messages_fts(rowid, content)
+        SELECT new.id, new.content WHERE new.status IS NOT 'streaming';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS discussions_fts_ai AFTER INSERT ON discussions BEGIN
+        INSERT INTO discussions_fts(rowid, topic, summary) VALUES (new.id, new.topic, new.summary);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS discussions_fts_ad AFTER DELETE ON discussions BEGIN
+        INSERT INTO discussions_fts(discussions_fts, rowid, topic, summary)
+        VALUES ('delete', old.id, old.topic, old.summary);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS discussions_fts_au AFTER UPDATE OF topic, summary ON discussions BEGIN
+        INSERT INTO discussions_fts(discussions_fts, rowid, topic, summary)
+        VALUES ('delete', old.id, old.topic, old.summary);
+        INSERT INTO discussions_fts(rowid, topic, summary) VALUES (new.id, new.topic, new.summary);
+    END""",
+]
+# 首次建表时把已有数据写入索引
+FTS_BACKFILL = {
+    "messages_fts": (
+        "INSERT INTO messages_fts(rowid, content) "
+        "SELECT id, content FROM messages WHERE status IS NOT 'streaming'"
+    ),
+    "discussions_fts": (
+        "INSERT INTO discussions_fts(rowid, topic, summary) "
+        "SELECT id, topic, summary FROM discussions"
+    ),
+}
 
 
-# 初始化数据库
-async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+def ensure_search_index(sync_conn) -> list:
+    """创建全文索引表和同步触发器（已存在则跳过），返回本次新建并回填的表名"""
+    created = []
+    for name, ddl in FTS_TABLES.items():
+        exists = sync_conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)
+        ).first()
+        if exists:
+            continue
+        sync_conn.exec_driver_sql(ddl)
+        sync_conn.exec_driver_sql(FTS_BACKFILL[name])
+        created.append(name)
+    for ddl in FTS_TRIGGERS:
+        sync_conn.exec_driver_sql(ddl)
+    return created
 
 
-# 获取数据库会话
+# 初始化数据库：执行所有未应用的迁移，返回本次应用的版本号
+async def init_db() -> list:
+    from migrations import run_migrations  # migrations依赖本模块的模型定义，延迟导入
+    return await run_migrations(write_engine)
+
+
+# 获取请求数据库会话（SQLite performance配置下只读，写入使用 get_write_db 或 WriteSessionLocal）
 async def get_db():
     async with AsyncSessionLocal() as session:
         try:
@@ -71,3 +344,27 @@ async def get_db():
         finally:
             await session.close()
 
+
+# 获取写数据库会话（短写事务接口，占用单写连接直到请求结束，不能用于流式接口）
+async def get_write_db():
+    async with WriteSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+# 获取只读数据库会话（用于纯查询接口；只读连接池不溢出，不能用于流式接口，流式接口在短会话中查询）
+async def get_read_db():
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+# 关闭所有引擎
+async def dispose_engines():
+    for item in {engine, write_engine, read_engine}:
+        await item.dispose()
+
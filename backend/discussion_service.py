@@ -1,18 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from typing import List, Dict, Tuple, AsyncGenerator
+from sqlalchemy import select, update
+from typing import List, Dict, Tuple, AsyncGenerator, Optional
 from pydantic import BaseModel
 import json
 import asyncio
-from database import get_db, Discussion, Message, Agent
+from database import get_db, get_read_db, get_write_db, WriteSessionLocal, ReadSessionLocal, Discussion, Message
 from models import (
-    DiscussionCreate, DiscussionResponse, DiscussionDetail,
-    MessageCreate, MessageResponse
+    DiscussionCreate, DiscussionResponse, DiscussionDetail, DiscussionPage,
+    MessageCreate, MessageResponse, MessageDelta
 )
 from ai_client import ai_client
 from data_fetcher import stock_fetcher
+from data_context import data_contexts, DATA_CONTEXT_INSTRUCTION
+from live_hub import live_hub, HEARTBEAT_FRAME
+from live_relay import relay_checkpoints, running_elsewhere
+from checkpoint import MessageCheckpointer, STATUS_STREAMING, STATUS_INTERRUPTED
+from archive import load_archived_messages, thaw_discussion
+from agent_registry import agent_registry, AgentSnapshot
+from leases import hold_lease, run_lock_name, LeaseBusy
+from retention import purge_discussions
+from queries import (
+    discussion_by_id, discussions_page, message_history,
+    recent_message_history, messages_since, encode_cursor, decode_cursor
+)
 
 router = APIRouter(prefix="/api/discussions", tags=["discussions"])
 
@@ -27,20 +39,36 @@ class DebateRequest(BaseModel):
 
 
 class EnhanceWithDataRequest(BaseModel):
-    symbols: List[str]  # 股票代码列表
+    symbols: List[str] = []  # 股票代码列表，为空时从讨论主题和发言中识别
+
+
+# 自动识别时最多使用的股票代码数
+AUTO_SYMBOLS_MAX = 10
+
+
+def detect_symbols(topic: str, messages: List) -> List[str]:
+    """从讨论主题和Agent/用户发言中识别股票代码，主题中的代码在前"""
+    symbols = stock_fetcher.extract_stock_symbols(topic)
+    for msg in messages:
+        if msg.message_type in ("agent", "user"):
+            symbols += stock_fetcher.extract_stock_symbols(msg.content)
+    return list(dict.fromkeys(symbols))[:AUTO_SYMBOLS_MAX]
 
 
 # ===== 并行处理辅助函数 =====
 
 async def process_agent_response(
-    agent: Agent,
+    agent: AgentSnapshot,
     messages: List[Dict[str, str]],
     discussion_id: int,
-    db: AsyncSession
+    data_snapshot_id: Optional[str] = None
 ) -> Tuple[int, str, bool]:
     """
     并行处理单个Agent的回复，带模型降级策略
     
+    生成过程中定期保存断点（status=streaming），服务重启不会丢失已输出内容；
+    数据增强的回复记录所用的行情快照（data_snapshot_id）
+    
     Returns:
         (agent_id, content, success): Agent ID、回复内容、是否成功
     """
@@ -54,29 +82,33 @@ async def process_agent_response(
     # 去重，避免重复尝试相同模型
     fallback_models = list(dict.fromkeys(fallback_models))
     
+    checkpointer = MessageCheckpointer(discussion_id, agent, data_snapshot_id=data_snapshot_id)
+    await checkpointer.start()
+    
     last_error = None
     for model_to_try in fallback_models:
         try:
-            full_content = ""
+            checkpointer.model = model_to_try
+            if checkpointer.content:
+                await checkpointer.reset()
             async for chunk in ai_client.chat_completion_stream(messages, model=model_to_try):
-                full_content += chunk
+                await checkpointer.append(chunk)
             
+            full_content = checkpointer.content
             if not full_content.strip():
                 if model_to_try != fallback_models[-1]:  # 不是最后一个模型，继续尝试
                     continue
+                await checkpointer.discard()
                 return (agent.id, "错误: 模型没有返回内容", False)
             
-            # 成功，保存到数据库
-            message = Message(
-                discussion_id=discussion_id,
-                agent_id=agent.id,
-                content=full_content,
-                message_type="agent"
-            )
-            db.add(message)
-            await db.commit()
+            # 成功，保存最终内容
+            await checkpointer.finish()
             
             return (agent.id, full_content, True)
+        except asyncio.CancelledError:
+            # 请求被中断（暂停/断开），保留已输出内容
+            await asyncio.shield(checkpointer.finish(status=STATUS_INTERRUPTED))
+            raise
         except Exception as e:
             last_error = e
             # 如果不是最后一个模型，继续尝试下一个
@@ -88,71 +120,240 @@ async def process_agent_response(
     # 所有模型都失败，保存错误消息
     error_msg = f"错误: {str(last_error)} (已尝试{len(fallback_models)}个模型)"
     try:
-        message = Message(
-            discussion_id=discussion_id,
-            agent_id=agent.id,
-            content=error_msg,
-            message_type="agent"
-        )
-        db.add(message)
-        await db.commit()
+        await checkpointer.finish(error_msg)
     except:
         pass
     return (agent.id, error_msg, False)
 
 
-@router.get("", response_model=List[DiscussionResponse])
-async def get_discussions(db: AsyncSession = Depends(get_db)):
-    """获取所有讨论"""
-    result = await db.execute(
-        select(Discussion).order_by(Discussion.created_at.desc())
+async def discussion_run_lock(discussion_id: int):
+    """
+    生成类接口的运行锁：同一讨论同一时刻只允许一次生成（跨worker生效），
+    流式响应结束后释放
+    """
+    try:
+        async with hold_lease(run_lock_name(discussion_id)):
+            yield
+    except LeaseBusy:
+        raise HTTPException(status_code=409, detail="Discussion is already generating")
+
+
+async def save_message(message: Message) -> Message:
+    """在单写连接的短事务中保存消息（请求会话只读）"""
+    async with WriteSessionLocal() as session:
+        session.add(message)
+        await session.commit()
+    return message
+
+
+def to_message_response(message: Message) -> MessageResponse:
+    return MessageResponse(
+        id=message.id,
+        discussion_id=message.discussion_id,
+        agent_id=message.agent_id,
+        agent_name=message.agent_name,
+        agent_role=message.agent_role,
+        model=message.model,
+        content=message.content,
+        message_type=message.message_type,
+        status=message.status or "completed",
+        data_snapshot_id=message.data_snapshot_id,
+        created_at=message.created_at
     )
+
+
+def sync_cursor_for(messages: List[MessageResponse], since_message_id: int = 0) -> int:
+    """增量同步起点：停在第一条仍在生成的消息之前，保证它完成后会被再次同步"""
+    streaming_ids = [m.id for m in messages if m.status == STATUS_STREAMING]
+    if streaming_ids:
+        return max(min(streaming_ids) - 1, since_message_id)
+    return max([m.id for m in messages] + [since_message_id])
+
+
+def parse_cursor(cursor: Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate_messages(
+    messages: List[MessageResponse],
+    limit: Optional[int],
+    cursor: Optional[Tuple]
+) -> Tuple[List[MessageResponse], Optional[str]]:
+    """对按时间正序的消息列表做和SQL查询一致的游标分页（用于归档消息）"""
+    if cursor is not None:
+        messages = [m for m in messages if (m.created_at, m.id) < cursor]
+    if limit is None or len(messages) <= limit:
+        return messages, None
+    page = messages[-limit:]
+    return page, encode_cursor(page[0].created_at, page[0].id)
+
+
+async def load_history_window(db: AsyncSession, discussion_id: int, limit: int, *conditions) -> List:
+    """滑动窗口：只查询最近limit条已完成的消息，按时间正序返回"""
+    query = recent_message_history(discussion_id, limit)
+    for condition in conditions:
+        query = query.where(condition)
+    result = await db.execute(query)
+    return list(reversed(result.scalars().all()))
+
+
+@router.get("", response_model=DiscussionPage)
+async def get_discussions(
+    limit: int = Query(30, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """获取讨论列表（按时间倒序，游标分页）"""
+    result = await db.execute(discussions_page(limit, parse_cursor(cursor)))
     discussions = result.scalars().all()
-    return discussions
+    
+    next_cursor = None
+    if len(discussions) > limit:
+        discussions = discussions[:limit]
+        last = discussions[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    
+    return DiscussionPage(
+        items=[DiscussionResponse.model_validate(d) for d in discussions],
+        next_cursor=next_cursor
+    )
 
 
 @router.get("/{discussion_id}", response_model=DiscussionDetail)
-async def get_discussion(discussion_id: int, db: AsyncSession = Depends(get_db)):
-    """获取讨论详情（包含所有消息）"""
+async def get_discussion(
+    discussion_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    获取讨论详情
+    
+    不传limit时返回全部消息；传limit时返回最近的limit条，
+    next_cursor用于继续加载更早的消息
+    """
     # 获取讨论
-    result = await db.execute(
-        select(Discussion).where(Discussion.id == discussion_id)
-    )
+    result = await db.execute(discussion_by_id(discussion_id))
     discussion = result.scalar_one_or_none()
     if not discussion:
         raise HTTPException(status_code=404, detail="Discussion not found")
     
+    # 已归档的讨论：解压后和messages表中的消息合并，在内存中分页
+    archived = await load_archived_messages(db, discussion_id)
+    if archived:
+        result = await db.execute(message_history(discussion_id, include_streaming=True))
+        messages = [MessageResponse(**item) for item in archived]
+        messages += [to_message_response(message) for message in result.scalars().all()]
+        messages.sort(key=lambda m: (m.created_at, m.id))
+        messages, next_cursor = paginate_messages(messages, limit, parse_cursor(cursor))
+        return DiscussionDetail(
+            discussion=DiscussionResponse.model_validate(discussion),
+            messages=messages,
+            next_cursor=next_cursor,
+            sync_cursor=sync_cursor_for(messages)
+        )
+    
     # 获取消息
-    result = await db.execute(
-        select(Message, Agent.name)
-        .outerjoin(Agent, Message.agent_id == Agent.id)
-        .where(Message.discussion_id == discussion_id)
-        .order_by(Message.created_at)
-    )
-    rows = result.all()
-    
-    messages = []
-    for message, agent_name in rows:
-        messages.append(MessageResponse(
-            id=message.id,
-            discussion_id=message.discussion_id,
-            agent_id=message.agent_id,
-            agent_name=agent_name,
-            content=message.content,
-            message_type=message.message_type,
-            created_at=message.created_at
+    next_cursor = None
+    if limit is None:
+        result = await db.execute(message_history(discussion_id, include_streaming=True))
+        rows = result.scalars().all()
+    else:
+        result = await db.execute(recent_message_history(
+            discussion_id, limit + 1, include_streaming=True, cursor=parse_cursor(cursor)
         ))
+        rows = result.scalars().all()
+        if len(rows) > limit:
+            rows = rows[:limit]
+            oldest = rows[-1]
+            next_cursor = encode_cursor(oldest.created_at, oldest.id)
+        rows.reverse()
+    
+    messages = [to_message_response(message) for message in rows]
     
     return DiscussionDetail(
-        discussion=DiscussionResponse.from_orm(discussion),
-        messages=messages
+        discussion=DiscussionResponse.model_validate(discussion),
+        messages=messages,
+        next_cursor=next_cursor,
+        sync_cursor=sync_cursor_for(messages)
+    )
+
+
+@router.get("/{discussion_id}/messages", response_model=MessageDelta)
+async def get_new_messages(
+    discussion_id: int,
+    since_message_id: int = Query(0, ge=0),
+    limit: int = Query(200, ge=1, le=500),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """增量同步：只返回since_message_id之后的新消息"""
+    result = await db.execute(discussion_by_id(discussion_id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Discussion not found")
+    
+    result = await db.execute(messages_since(discussion_id, since_message_id, limit))
+    messages = [to_message_response(message) for message in result.scalars().all()]
+    archived = [
+        MessageResponse(**item)
+        for item in await load_archived_messages(db, discussion_id)
+        if item["id"] > since_message_id
+    ]
+    if archived:
+        messages = sorted(archived + messages, key=lambda m: (m.created_at, m.id))[:limit]
+    
+    return MessageDelta(
+        messages=messages,
+        sync_cursor=sync_cursor_for(messages, since_message_id)
     )
 
 
+@router.get("/{discussion_id}/live")
+async def watch_discussion_live(discussion_id: int):
+    """
+    观看讨论直播 - 多个观看者共享同一次生成，不会重复触发Agent
+
+    直播可能持续很久，不使用请求级会话（会话到响应结束才释放）：
+    只在短会话中确认讨论存在，推流期间不占用数据库连接
+    """
+    async with ReadSessionLocal() as session:
+        found = await session.scalar(select(Discussion.id).where(Discussion.id == discussion_id))
+    if found is None:
+        raise HTTPException(status_code=404, detail="Discussion not found")
+    
+    async def generate():
+        """
+        先告知当前是否在生成，再持续转发广播事件；
+        讨论在其他worker上生成时改为转播断点（等待期间每次心跳检查一次）
+        """
+        relay = await running_elsewhere(discussion_id)
+        live = relay or live_hub.is_live(discussion_id)
+        yield f"data: {json.dumps({'type': 'live_status', 'live': live, 'relay': relay, 'viewers': live_hub.subscriber_count(discussion_id) + 1})}\n\n"
+        if not relay:
+            listener = live_hub.listen(discussion_id)
+            try:
+                async for frame in listener:
+                    yield frame
+                    if frame == HEARTBEAT_FRAME and await running_elsewhere(discussion_id):
+                        break
+                else:
+                    return
+            finally:
+                await listener.aclose()
+        async for frame in relay_checkpoints(discussion_id):
+            yield frame
+    
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
 @router.post("", response_model=DiscussionResponse, status_code=201)
 async def create_discussion(
     discussion_data: DiscussionCreate,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db)
 ):
     """创建新讨论"""
     discussion = Discussion(
@@ -162,42 +363,43 @@ async def create_discussion(
     db.add(discussion)
     await db.commit()
     await db.refresh(discussion)
+    # 后台预取主题中股票的行情，开始讨论和数据增强时直接命中缓存
+    stock_fetcher.prefetch(stock_fetcher.extract_stock_symbols(discussion.topic))
     return discussion
 
 
 @router.post("/{discussion_id}/start")
-async def start_discussion(discussion_id: int, db: AsyncSession = Depends(get_db)):
+async def start_discussion(
+    discussion_id: int,
+    auto_enhance: bool = Query(False, description="辩论结束后自动进行数据增强"),
+    _run_lock: None = Depends(discussion_run_lock),
+    db: AsyncSession = Depends(get_db)
+):
     """开始讨论 - 并行处理所有Agent回复"""
+    # 恢复已归档的消息
+    await thaw_discussion(discussion_id)
+    
     # 获取讨论
-    result = await db.execute(
-        select(Discussion).where(Discussion.id == discussion_id)
-    )
+    result = await db.execute(discussion_by_id(discussion_id))
     discussion = result.scalar_one_or_none()
     if not discussion:
         raise HTTPException(status_code=404, detail="Discussion not found")
     
     # 获取所有Agent
-    result = await db.execute(select(Agent).order_by(Agent.created_at))
-    agents = result.scalars().all()
+    agents = await agent_registry.all()
     
     if not agents:
         raise HTTPException(status_code=400, detail="No agents available")
     
     async def generate():
         """并行处理所有Agent的回复，但按顺序输出"""
+        # 第一轮发言的同时在后台获取主题中股票的行情（创建时已预取则直接命中缓存）
+        stock_fetcher.prefetch(stock_fetcher.extract_stock_symbols(discussion.topic))
+        
         # 准备所有Agent的消息上下文
         # 获取之前的对话记录（所有Agent共享）
-        result = await db.execute(
-            select(Message, Agent.name)
-            .outerjoin(Agent, Message.agent_id == Agent.id)
-            .where(Message.discussion_id == discussion_id)
-            .order_by(Message.created_at)
-        )
-        previous_messages = result.all()
-        
-        # 滑动窗口：只保留最近15条
-        if len(previous_messages) > 15:
-            previous_messages = previous_messages[-15:]
+        # 滑动窗口：只取最近15条
+        previous_messages = await load_history_window(db, discussion_id, 15)
         
         # 为每个Agent构建消息上下文
         agent_messages_map = {}
@@ -209,16 +411,16 @@ async def start_discussion(discussion_id: int, db: AsyncSession = Depends(get_db
             
             if previous_messages:
                 context = "\n\n以下是其他分析师的观点：\n"
-                for msg, agent_name in previous_messages:
-                    if msg.message_type == "agent" and agent_name:
-                        context += f"\n【{agent_name}】：{msg.content}\n"
+                for msg in previous_messages:
+                    if msg.message_type == "agent" and msg.agent_name:
+                        context += f"\n【{msg.agent_name}】：{msg.content}\n"
                 messages.append({"role": "user", "content": context})
             
             agent_messages_map[agent.id] = messages
         
         # 并行执行所有Agent的回复
         tasks = [
-            process_agent_response(agent, agent_messages_map[agent.id], discussion_id, db)
+            process_agent_response(agent, agent_messages_map[agent.id], discussion_id)
             for agent in agents
         ]
         results = await asyncio.gather(*tasks, return_exceptions=True)
@@ -255,16 +457,8 @@ async def start_discussion(discussion_id: int, db: AsyncSession = Depends(get_db
             yield f"data: {json.dumps({'type': 'round_start', 'round': round_num})}\n\n"
             
             # 获取最新历史消息
-            result = await db.execute(
-                select(Message, Agent.name)
-                .outerjoin(Agent, Message.agent_id == Agent.id)
-                .where(Message.discussion_id == discussion_id)
-                .order_by(Message.created_at)
-            )
-            history_messages = result.all()
-            
-            if len(history_messages) > 15:
-                history_messages = history_messages[-15:]
+            # 滑动窗口：只取最近15条
+            history_messages = await load_history_window(db, discussion_id, 15)
             
             # 为每个Agent构建辩论消息
             debate_tasks = []
@@ -272,14 +466,14 @@ async def start_discussion(discussion_id: int, db: AsyncSession = Depends(get_db
                 messages = [{"role": "system", "content": agent.system_prompt}]
                 messages.append({"role": "user", "content": f"讨论主题：{discussion.topic}"})
                 
-                for msg, agent_name in history_messages:
+                for msg in history_messages:
                     if msg.message_type == "user":
                         messages.append({"role": "user", "content": msg.content})
-                    elif msg.message_type == "agent" and agent_name:
-                        if agent_name == agent.name:
+                    elif msg.message_type == "agent" and msg.agent_name:
+                        if msg.agent_id == agent.id:
                             messages.append({"role": "assistant", "content": f"【你之前的观点】{msg.content}"})
                         else:
-                            messages.append({"role": "assistant", "content": f"【{agent_name}的观点】{msg.content}"})
+                            messages.append({"role": "assistant", "content": f"【{msg.agent_name}的观点】{msg.content}"})
                 
                 if round_num == 1:
                     debate_prompt = "\n\n请基于其他分析师的观点，进行回应：你可以同意并补充，可以反驳并提出理由，也可以提出新问题。"
@@ -287,7 +481,7 @@ async def start_discussion(discussion_id: int, db: AsyncSession = Depends(get_db
                     debate_prompt = f"\n\n这是第{round_num}轮辩论，请基于之前的讨论继续深入：回应反驳、补充观点或提出新问题。"
                 messages.append({"role": "user", "content": debate_prompt})
                 
-                debate_tasks.append(process_agent_response(agent, messages, discussion_id, db))
+                debate_tasks.append(process_agent_response(agent, messages, discussion_id))
             
             # 并行执行辩论轮次
             debate_results = await asyncio.gather(*debate_tasks, return_exceptions=True)
@@ -314,44 +508,55 @@ async def start_discussion(discussion_id: int, db: AsyncSession = Depends(get_db
             yield f"data: {json.dumps({'type': 'round_end', 'round': round_num})}\n\n"
         
         yield f"data: {json.dumps({'type': 'debate_done'})}\n\n"
+        
+        if auto_enhance:
+            history_messages = await load_history_window(db, discussion_id, 15)
+            symbols = detect_symbols(discussion.topic, history_messages)
+            if symbols:
+                async for event in enhance_events(discussion, agents, symbols, db):
+                    yield event
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return StreamingResponse(
+        live_hub.broadcast(discussion_id, generate()),
+        media_type="text/event-stream"
+    )
 
 
 @router.post("/{discussion_id}/continue")
 async def continue_discussion(
     discussion_id: int,
     message_data: MessageCreate,
+    _run_lock: None = Depends(discussion_run_lock),
     db: AsyncSession = Depends(get_db)
 ):
     """继续讨论 - 用户追问，Agent们继续回答"""
+    # 恢复已归档的消息
+    await thaw_discussion(discussion_id)
+    
     # 获取讨论
-    result = await db.execute(
-        select(Discussion).where(Discussion.id == discussion_id)
-    )
+    result = await db.execute(discussion_by_id(discussion_id))
     discussion = result.scalar_one_or_none()
     if not discussion:
         raise HTTPException(status_code=404, detail="Discussion not found")
     
     # 保存用户消息
-    user_message = Message(
+    user_message = await save_message(Message(
         discussion_id=discussion_id,
         agent_id=None,
         content=message_data.content,
         message_type="user"
-    )
-    db.add(user_message)
-    await db.commit()
+    ))
     
     # 获取所有Agent
-    result = await db.execute(select(Agent).order_by(Agent.created_at))
-    agents = result.scalars().all()
+    agents = await agent_registry.all()
     
     if not agents:
         raise HTTPException(status_code=400, detail="No agents available")
     
     async def generate():
         """流式生成所有Agent的回复"""
+        yield f"data: {json.dumps({'type': 'user_message', 'content': message_data.content})}\n\n"
+        
         for agent in agents:
             # 发送Agent开始标记
             yield f"data: {json.dumps({'type': 'agent_start', 'agent_id': agent.id, 'agent_name': agent.name, 'agent_role': agent.role})}\n\n"
@@ -360,47 +565,40 @@ async def continue_discussion(
             messages = [{"role": "system", "content": agent.system_prompt}]
             
             # 获取所有历史消息
-            result = await db.execute(
-                select(Message, Agent.name)
-                .outerjoin(Agent, Message.agent_id == Agent.id)
-                .where(Message.discussion_id == discussion_id)
-                .order_by(Message.created_at)
-            )
-            history_messages = result.all()
-            
-            # 滑动窗口：只保留最近30条
-            if len(history_messages) > 30:
-                history_messages = history_messages[-30:]
+            # 滑动窗口：只取最近30条
+            history_messages = await load_history_window(db, discussion_id, 30)
             
             # 构建对话上下文
             messages.append({"role": "user", "content": f"讨论主题：{discussion.topic}"})
             
-            for msg, agent_name in history_messages:
+            for msg in history_messages:
                 if msg.message_type == "user":
                     messages.append({"role": "user", "content": msg.content})
-                elif msg.message_type == "agent" and agent_name:
+                elif msg.message_type == "agent" and msg.agent_name:
                     # 简化：将其他Agent的观点作为助手回复
-                    messages.append({"role": "assistant", "content": f"【{agent_name}的观点】{msg.content}"})
+                    messages.append({"role": "assistant", "content": f"【{msg.agent_name}的观点】{msg.content}"})
             
-            # 流式获取AI回复（使用Agent指定的模型）
-            full_content = ""
+            # 流式获取AI回复（使用Agent指定的模型），边生成边保存断点
+            checkpointer = MessageCheckpointer(discussion_id, agent)
+            await checkpointer.start()
             try:
                 async for chunk in ai_client.chat_completion_stream(messages, model=agent.model):
-                    full_content += chunk
+                    await checkpointer.append(chunk)
                     yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
+            except (asyncio.CancelledError, GeneratorExit):
+                # 客户端中断（暂停/断开），保留已输出内容
+                await asyncio.shield(checkpointer.finish(status=STATUS_INTERRUPTED))
+                raise
             except Exception as e:
+                if checkpointer.content.strip():
+                    await checkpointer.finish(status=STATUS_INTERRUPTED)
+                else:
+                    await checkpointer.discard()
                 yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
                 continue
             
-            # 保存消息到数据库
-            message = Message(
-                discussion_id=discussion_id,
-                agent_id=agent.id,
-                content=full_content,
-                message_type="agent"
-            )
-            db.add(message)
-            await db.commit()
+            # 保存最终内容
+            await checkpointer.finish()
             
             # 发送Agent结束标记
             yield f"data: {json.dumps({'type': 'agent_end', 'agent_id': agent.id})}\n\n"
@@ -408,37 +606,39 @@ async def continue_discussion(
         # 所有Agent发言完毕
         yield f"data: {json.dumps({'type': 'all_done'})}\n\n"
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return StreamingResponse(
+        live_hub.broadcast(discussion_id, generate()),
+        media_type="text/event-stream"
+    )
 
 
 @router.post("/{discussion_id}/summarize")
-async def summarize_discussion(discussion_id: int, db: AsyncSession = Depends(get_db)):
+async def summarize_discussion(
+    discussion_id: int,
+    _run_lock: None = Depends(discussion_run_lock),
+    db: AsyncSession = Depends(get_db)
+):
     """生成讨论总结"""
+    # 恢复已归档的消息
+    await thaw_discussion(discussion_id)
+    
     # 获取讨论
-    result = await db.execute(
-        select(Discussion).where(Discussion.id == discussion_id)
-    )
+    result = await db.execute(discussion_by_id(discussion_id))
     discussion = result.scalar_one_or_none()
     if not discussion:
         raise HTTPException(status_code=404, detail="Discussion not found")
     
     # 获取所有消息
-    result = await db.execute(
-        select(Message, Agent.name)
-        .outerjoin(Agent, Message.agent_id == Agent.id)
-        .where(Message.discussion_id == discussion_id)
-        .where(Message.message_type == "agent")
-        .order_by(Message.created_at)
-    )
-    messages = result.all()
+    result = await db.execute(message_history(discussion_id, message_type="agent"))
+    messages = result.scalars().all()
     
     if not messages:
         raise HTTPException(status_code=400, detail="No messages to summarize")
     
     # 构建总结提示
     content = f"请总结以下关于「{discussion.topic}」的讨论，提取关键观点、共识和分歧：\n\n"
-    for msg, agent_name in messages:
-        content += f"【{agent_name}】：{msg.content}\n\n"
+    for msg in messages:
+        content += f"【{msg.agent_name}】：{msg.content}\n\n"
     
     summary_prompt = [
         {"role": "system", "content": "你是一个专业的讨论总结助手，擅长提取关键信息和共识。"},
@@ -454,29 +654,39 @@ async def summarize_discussion(discussion_id: int, db: AsyncSession = Depends(ge
                 yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
             
             # 保存总结
-            discussion.summary = full_summary
-            discussion.status = "completed"
-            await db.commit()
+            async with WriteSessionLocal() as session:
+                await session.execute(
+                    update(Discussion)
+                    .where(Discussion.id == discussion_id)
+                    .values(summary=full_summary, status="completed")
+                )
+                await session.commit()
             
             yield f"data: {json.dumps({'type': 'done'})}\n\n"
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return StreamingResponse(
+        live_hub.broadcast(discussion_id, generate()),
+        media_type="text/event-stream"
+    )
 
 
 @router.delete("/{discussion_id}", status_code=204)
-async def delete_discussion(discussion_id: int, db: AsyncSession = Depends(get_db)):
-    """删除讨论"""
-    result = await db.execute(
-        select(Discussion).where(Discussion.id == discussion_id)
-    )
+async def delete_discussion(
+    discussion_id: int,
+    _run_lock: None = Depends(discussion_run_lock),
+    db: AsyncSession = Depends(get_db)
+):
+    """删除讨论（正在生成时返回409）"""
+    result = await db.execute(discussion_by_id(discussion_id))
     discussion = result.scalar_one_or_none()
     if not discussion:
         raise HTTPException(status_code=404, detail="Discussion not found")
+    await db.close()
     
-    await db.delete(discussion)
-    await db.commit()
+    # 集合删除消息、归档和讨论，消息很多时分批提交
+    await purge_discussions([discussion_id])
     return None
 
 
@@ -484,37 +694,36 @@ async def delete_discussion(discussion_id: int, db: AsyncSession = Depends(get_d
 async def ask_specific_agent(
     discussion_id: int,
     request: AskAgentRequest,
+    _run_lock: None = Depends(discussion_run_lock),
     db: AsyncSession = Depends(get_db)
 ):
     """向特定Agent提问（@提及功能）"""
+    # 恢复已归档的消息
+    await thaw_discussion(discussion_id)
+    
     # 获取讨论
-    result = await db.execute(
-        select(Discussion).where(Discussion.id == discussion_id)
-    )
+    result = await db.execute(discussion_by_id(discussion_id))
     discussion = result.scalar_one_or_none()
     if not discussion:
         raise HTTPException(status_code=404, detail="Discussion not found")
     
     # 获取指定Agent
-    result = await db.execute(
-        select(Agent).where(Agent.id == request.agent_id)
-    )
-    agent = result.scalar_one_or_none()
+    agent = await agent_registry.get(request.agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
     
     # 保存用户消息
-    user_message = Message(
+    user_message = await save_message(Message(
         discussion_id=discussion_id,
         agent_id=None,
         content=f"@{agent.name} {request.content}",
         message_type="user"
-    )
-    db.add(user_message)
-    await db.commit()
+    ))
     
     async def generate():
         """流式生成特定Agent的回复"""
+        yield f"data: {json.dumps({'type': 'user_message', 'content': user_message.content})}\n\n"
+        
         # 发送Agent开始标记
         yield f"data: {json.dumps({'type': 'agent_start', 'agent_id': agent.id, 'agent_name': agent.name, 'agent_role': agent.role})}\n\n"
         
@@ -522,79 +731,146 @@ async def ask_specific_agent(
         messages = [{"role": "system", "content": agent.system_prompt}]
         
         # 获取所有历史消息
-        result = await db.execute(
-            select(Message, Agent.name)
-            .outerjoin(Agent, Message.agent_id == Agent.id)
-            .where(Message.discussion_id == discussion_id)
-            .order_by(Message.created_at)
-        )
-        history_messages = result.all()
-        
-        # 滑动窗口：只保留最近15条
-        if len(history_messages) > 15:
-            history_messages = history_messages[-15:]
+        # 滑动窗口：只取最近15条
+        history_messages = await load_history_window(db, discussion_id, 15)
         
         # 构建对话上下文
         messages.append({"role": "user", "content": f"讨论主题：{discussion.topic}"})
         
         # 添加历史对话
-        for msg, agent_name in history_messages:
+        for msg in history_messages:
             if msg.message_type == "user":
                 # 如果是@提及，保留原样
                 messages.append({"role": "user", "content": msg.content})
-            elif msg.message_type == "agent" and agent_name:
-                messages.append({"role": "assistant", "content": f"【{agent_name}的观点】{msg.content}"})
+            elif msg.message_type == "agent" and msg.agent_name:
+                messages.append({"role": "assistant", "content": f"【{msg.agent_name}的观点】{msg.content}"})
         
         # 添加当前问题
         messages.append({"role": "user", "content": request.content})
         
-        # 流式获取AI回复（使用Agent指定的模型）
-        full_content = ""
+        # 流式获取AI回复（使用Agent指定的模型），边生成边保存断点
+        checkpointer = MessageCheckpointer(discussion_id, agent)
+        await checkpointer.start()
         try:
             async for chunk in ai_client.chat_completion_stream(messages, model=agent.model):
-                full_content += chunk
+                await checkpointer.append(chunk)
                 yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
+            await checkpointer.finish()
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端中断（暂停/断开），保留已输出内容
+            await asyncio.shield(checkpointer.finish(status=STATUS_INTERRUPTED))
+            raise
         except Exception as e:
-            error_msg = f"错误: {str(e)}"
-            full_content = error_msg
+            # 保存错误信息（即使出错也保存）
+            await checkpointer.finish(f"错误: {str(e)}")
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
         
-        # 保存消息到数据库（即使出错也保存）
-        if full_content.strip():
-            message = Message(
-                discussion_id=discussion_id,
-                agent_id=agent.id,
-                content=full_content,
-                message_type="agent"
-            )
-            db.add(message)
-            await db.commit()
-        
         # 发送Agent结束标记
         yield f"data: {json.dumps({'type': 'agent_end', 'agent_id': agent.id})}\n\n"
         yield f"data: {json.dumps({'type': 'all_done'})}\n\n"
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return StreamingResponse(
+        live_hub.broadcast(discussion_id, generate()),
+        media_type="text/event-stream"
+    )
+
+
+@router.post("/{discussion_id}/messages/{message_id}/resume")
+async def resume_interrupted_message(
+    discussion_id: int,
+    message_id: int,
+    _run_lock: None = Depends(discussion_run_lock),
+    db: AsyncSession = Depends(get_db)
+):
+    """续写被中断的Agent消息（服务重启或暂停导致输出不完整时）"""
+    # 恢复已归档的消息
+    await thaw_discussion(discussion_id)
+    
+    result = await db.execute(discussion_by_id(discussion_id))
+    discussion = result.scalar_one_or_none()
+    if not discussion:
+        raise HTTPException(status_code=404, detail="Discussion not found")
+    
+    result = await db.execute(
+        select(Message)
+        .where(Message.id == message_id)
+        .where(Message.discussion_id == discussion_id)
+    )
+    message = result.scalar_one_or_none()
+    if not message:
+        raise HTTPException(status_code=404, detail="Message not found")
+    if message.status != STATUS_INTERRUPTED:
+        raise HTTPException(status_code=400, detail="Message is not interrupted")
+    
+    agent = await agent_registry.get(message.agent_id)
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    
+    async def generate():
+        """从中断处继续流式输出，内容追加到原消息"""
+        yield f"data: {json.dumps({'type': 'agent_start', 'agent_id': agent.id, 'agent_name': agent.name, 'agent_role': agent.role, 'message_id': message.id})}\n\n"
+        
+        messages = [{"role": "system", "content": agent.system_prompt}]
+        messages.append({"role": "user", "content": f"讨论主题：{discussion.topic}"})
+        
+        # 只取中断消息之前的历史（滑动窗口：最近15条）
+        history_messages = await load_history_window(
+            db, discussion_id, 15, Message.id < message.id
+        )
+        
+        for msg in history_messages:
+            if msg.message_type == "user":
+                messages.append({"role": "user", "content": msg.content})
+            elif msg.message_type == "agent" and msg.agent_name:
+                messages.append({"role": "assistant", "content": f"【{msg.agent_name}的观点】{msg.content}"})
+        
+        messages.append({"role": "assistant", "content": message.content})
+        messages.append({"role": "user", "content": "你的上一条回答在输出过程中被中断了，请从中断处直接继续输出，不要重复已经输出的内容。"})
+        
+        checkpointer = MessageCheckpointer(
+            discussion_id, agent, message_id=message.id, content=message.content
+        )
+        await checkpointer.start()
+        try:
+            async for chunk in ai_client.chat_completion_stream(messages, model=agent.model):
+                await checkpointer.append(chunk)
+                yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
+            await checkpointer.finish()
+        except (asyncio.CancelledError, GeneratorExit):
+            await asyncio.shield(checkpointer.finish(status=STATUS_INTERRUPTED))
+            raise
+        except Exception as e:
+            await checkpointer.finish(status=STATUS_INTERRUPTED)
+            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        
+        yield f"data: {json.dumps({'type': 'agent_end', 'agent_id': agent.id, 'message_id': message.id})}\n\n"
+        yield f"data: {json.dumps({'type': 'all_done'})}\n\n"
+    
+    return StreamingResponse(
+        live_hub.broadcast(discussion_id, generate()),
+        media_type="text/event-stream"
+    )
 
 
 @router.post("/{discussion_id}/debate")
 async def start_debate(
     discussion_id: int,
     debate_data: DebateRequest,
+    _run_lock: None = Depends(discussion_run_lock),
     db: AsyncSession = Depends(get_db)
 ):
     """开始辩论 - Agent基于其他Agent的观点进行多轮讨论"""
+    # 恢复已归档的消息
+    await thaw_discussion(discussion_id)
+    
     # 获取讨论
-    result = await db.execute(
-        select(Discussion).where(Discussion.id == discussion_id)
-    )
+    result = await db.execute(discussion_by_id(discussion_id))
     discussion = result.scalar_one_or_none()
     if not discussion:
         raise HTTPException(status_code=404, detail="Discussion not found")
     
     # 获取所有Agent
-    result = await db.execute(select(Agent).order_by(Agent.created_at))
-    agents = result.scalars().all()
+    agents = await agent_registry.all()
     
     if not agents:
         raise HTTPException(status_code=400, detail="No agents available")
@@ -606,17 +882,8 @@ async def start_debate(
             yield f"data: {json.dumps({'type': 'round_start', 'round': round_num})}\n\n"
             
             # 获取所有历史消息（包括之前的轮次）
-            result = await db.execute(
-                select(Message, Agent.name)
-                .outerjoin(Agent, Message.agent_id == Agent.id)
-                .where(Message.discussion_id == discussion_id)
-                .order_by(Message.created_at)
-            )
-            history_messages = result.all()
-            
-            # 滑动窗口：只保留最近15条
-            if len(history_messages) > 15:
-                history_messages = history_messages[-15:]
+            # 滑动窗口：只取最近15条
+            history_messages = await load_history_window(db, discussion_id, 15)
             
             # 为每个Agent构建辩论消息
             debate_tasks = []
@@ -624,14 +891,14 @@ async def start_debate(
                 messages = [{"role": "system", "content": agent.system_prompt}]
                 messages.append({"role": "user", "content": f"讨论主题：{discussion.topic}"})
                 
-                for msg, agent_name in history_messages:
+                for msg in history_messages:
                     if msg.message_type == "user":
                         messages.append({"role": "user", "content": msg.content})
-                    elif msg.message_type == "agent" and agent_name:
-                        if agent_name == agent.name:
+                    elif msg.message_type == "agent" and msg.agent_name:
+                        if msg.agent_id == agent.id:
                             messages.append({"role": "assistant", "content": f"【你之前的观点】{msg.content}"})
                         else:
-                            messages.append({"role": "assistant", "content": f"【{agent_name}的观点】{msg.content}"})
+                            messages.append({"role": "assistant", "content": f"【{msg.agent_name}的观点】{msg.content}"})
                 
                 # 添加辩论提示
                 if round_num == 1:
@@ -640,7 +907,7 @@ async def start_debate(
                     debate_prompt = f"\n\n这是第{round_num}轮辩论，请基于之前的讨论继续深入：回应反驳、补充观点或提出新问题。"
                 messages.append({"role": "user", "content": debate_prompt})
                 
-                debate_tasks.append(process_agent_response(agent, messages, discussion_id, db))
+                debate_tasks.append(process_agent_response(agent, messages, discussion_id))
             
             # 并行执行辩论轮次
             debate_results = await asyncio.gather(*debate_tasks, return_exceptions=True)
@@ -670,114 +937,109 @@ async def start_debate(
         # 所有辩论轮次完毕
         yield f"data: {json.dumps({'type': 'debate_done'})}\n\n"
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return StreamingResponse(
+        live_hub.broadcast(discussion_id, generate()),
+        media_type="text/event-stream"
+    )
 
 
 @router.post("/{discussion_id}/enhance-with-data")
 async def enhance_with_data(
     discussion_id: int,
     request: EnhanceWithDataRequest,
+    _run_lock: None = Depends(discussion_run_lock),
     db: AsyncSession = Depends(get_db)
 ):
     """基于讨论内容获取实时数据并增强分析（两阶段分析）"""
-    result = await db.execute(
-        select(Discussion).where(Discussion.id == discussion_id)
-    )
+    # 恢复已归档的消息
+    await thaw_discussion(discussion_id)
+    
+    result = await db.execute(discussion_by_id(discussion_id))
     discussion = result.scalar_one_or_none()
     if not discussion:
         raise HTTPException(status_code=404, detail="Discussion not found")
     
-    result = await db.execute(select(Agent).order_by(Agent.created_at))
-    agents = result.scalars().all()
+    agents = await agent_registry.all()
     
     if not agents:
         raise HTTPException(status_code=400, detail="No agents available")
     
-    stock_data = await stock_fetcher.get_stock_trends(request.symbols)
+    symbols = request.symbols
+    if not symbols:
+        symbols = detect_symbols(discussion.topic, await load_history_window(db, discussion_id, 15))
+        if not symbols:
+            raise HTTPException(status_code=400, detail="No stock symbols detected")
     
-    async def generate():
-        yield f"data: {json.dumps({'type': 'data_loaded', 'symbols': list(stock_data.keys())})}\n\n"
-        
-        # 获取历史消息
-        result = await db.execute(
-            select(Message, Agent.name)
-            .outerjoin(Agent, Message.agent_id == Agent.id)
-            .where(Message.discussion_id == discussion_id)
-            .order_by(Message.created_at)
-        )
-        history_messages = result.all()
-        
-        if len(history_messages) > 15:
-            history_messages = history_messages[-15:]
-        
-        # 构建数据上下文
-        data_context = "\n\n以下是实时股票趋势数据，请基于这些数据验证和调整你的建议：\n\n"
-        for symbol, data in stock_data.items():
-            data_context += f"**{symbol}**:\n"
-            data_context += f"- 当前价格: ${data.get('current_price', 'N/A')}\n"
-            if 'trend_1w' in data:
-                t = data['trend_1w']
-                data_context += f"- 1周趋势: {t['change_percent']:+.2f}% (${t['old_price']:.2f} → ${t['current_price']:.2f})\n"
-            if 'trend_1mo' in data:
-                t = data['trend_1mo']
-                data_context += f"- 1月趋势: {t['change_percent']:+.2f}% (${t['old_price']:.2f} → ${t['current_price']:.2f})\n"
-            if 'trend_3mo' in data:
-                t = data['trend_3mo']
-                data_context += f"- 3月趋势: {t['change_percent']:+.2f}% (${t['old_price']:.2f} → ${t['current_price']:.2f})\n"
-            if data.get('rsi'):
-                data_context += f"- RSI: {data['rsi']:.2f}\n"
-            data_context += "\n"
-        
-        data_context += "\n请基于以上实时趋势数据，验证和调整你之前的建议。关注趋势（1周/1月/3月），不只是当天价格。"
+    return StreamingResponse(
+        live_hub.broadcast(discussion_id, enhance_events(discussion, agents, symbols, db)),
+        media_type="text/event-stream"
+    )
+
+
+async def enhance_events(
+    discussion: Discussion,
+    agents: List[AgentSnapshot],
+    symbols: List[str],
+    db: AsyncSession
+) -> AsyncGenerator[str, None]:
+    """数据增强阶段：获取行情（通常已预取），各Agent基于数据验证和调整建议"""
+    discussion_id = discussion.id
+    # 在流中获取数据，连接建立后各代码并发获取
+    stock_data = await stock_fetcher.get_stock_trends(symbols)
+    # 同一快照的数据块只渲染一次；放在系统提示词最前面，作为各Agent共同的前缀
+    block = await data_contexts.block_for(stock_data) if stock_data else None
+    snapshot_id = block.snapshot_id if block else None
+    yield f"data: {json.dumps({'type': 'data_loaded', 'symbols': list(stock_data.keys()), 'snapshot_id': snapshot_id})}\n\n"
+    
+    # 获取历史消息
+    # 滑动窗口：只取最近15条
+    history_messages = await load_history_window(db, discussion_id, 15)
+    
+    # 为每个Agent构建消息
+    enhance_tasks = []
+    for agent in agents:
+        system_prompt = f"{block.content}\n---\n\n{agent.system_prompt}" if block else agent.system_prompt
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.append({"role": "user", "content": f"讨论主题：{discussion.topic}"})
         
-        # 为每个Agent构建消息
-        enhance_tasks = []
-        for agent in agents:
-            messages = [{"role": "system", "content": agent.system_prompt}]
-            messages.append({"role": "user", "content": f"讨论主题：{discussion.topic}"})
-            
-            for msg, agent_name in history_messages:
-                if msg.message_type == "user":
-                    messages.append({"role": "user", "content": msg.content})
-                elif msg.message_type == "agent" and agent_name:
-                    messages.append({"role": "assistant", "content": f"【{agent_name}的观点】{msg.content}"})
-            
-            messages.append({"role": "user", "content": data_context})
-            enhance_tasks.append(process_agent_response(agent, messages, discussion_id, db))
+        for msg in history_messages:
+            if msg.message_type == "user":
+                messages.append({"role": "user", "content": msg.content})
+            elif msg.message_type == "agent" and msg.agent_name:
+                messages.append({"role": "assistant", "content": f"【{msg.agent_name}的观点】{msg.content}"})
         
-        # 并行执行数据增强
-        enhance_results = await asyncio.gather(*enhance_tasks, return_exceptions=True)
+        messages.append({"role": "user", "content": DATA_CONTEXT_INSTRUCTION})
+        enhance_tasks.append(process_agent_response(agent, messages, discussion_id, snapshot_id))
+    
+    # 并行执行数据增强
+    enhance_results = await asyncio.gather(*enhance_tasks, return_exceptions=True)
+    
+    # 按顺序输出结果
+    for i, agent in enumerate(agents):
+        yield f"data: {json.dumps({'type': 'agent_start', 'agent_id': agent.id, 'agent_name': agent.name, 'agent_role': agent.role})}\n\n"
         
-        # 按顺序输出结果
-        for i, agent in enumerate(agents):
-            yield f"data: {json.dumps({'type': 'agent_start', 'agent_id': agent.id, 'agent_name': agent.name, 'agent_role': agent.role})}\n\n"
-            
-            if isinstance(enhance_results[i], Exception):
-                error_msg = f"错误: {str(enhance_results[i])}"
-                yield f"data: {json.dumps({'type': 'error', 'message': str(enhance_results[i])})}\n\n"
-                yield f"data: {json.dumps({'type': 'content', 'content': error_msg})}\n\n"
-            else:
-                agent_id, content, success = enhance_results[i]
-                chunk_size = 50
-                for j in range(0, len(content), chunk_size):
-                    chunk = content[j:j+chunk_size]
-                    yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
-                if not success:
-                    yield f"data: {json.dumps({'type': 'error', 'message': content})}\n\n"
-            
-            yield f"data: {json.dumps({'type': 'agent_end', 'agent_id': agent.id})}\n\n"
+        if isinstance(enhance_results[i], Exception):
+            error_msg = f"错误: {str(enhance_results[i])}"
+            yield f"data: {json.dumps({'type': 'error', 'message': str(enhance_results[i])})}\n\n"
+            yield f"data: {json.dumps({'type': 'content', 'content': error_msg})}\n\n"
+        else:
+            agent_id, content, success = enhance_results[i]
+            chunk_size = 50
+            for j in range(0, len(content), chunk_size):
+                chunk = content[j:j+chunk_size]
+                yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
+            if not success:
+                yield f"data: {json.dumps({'type': 'error', 'message': content})}\n\n"
         
-        yield f"data: {json.dumps({'type': 'enhance_done'})}\n\n"
+        yield f"data: {json.dumps({'type': 'agent_end', 'agent_id': agent.id})}\n\n"
     
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    yield f"data: {json.dumps({'type': 'enhance_done'})}\n\n"
 
 
 @router.post("/{discussion_id}/pause")
-async def pause_discussion(discussion_id: int, db: AsyncSession = Depends(get_db)):
+async def pause_discussion(discussion_id: int, db: AsyncSession = Depends(get_write_db)):
     """暂停讨论"""
-    result = await db.execute(
-        select(Discussion).where(Discussion.id == discussion_id)
-    )
+    result = await db.execute(discussion_by_id(discussion_id))
     discussion = result.scalar_one_or_none()
     if not discussion:
         raise HTTPException(status_code=404, detail="Discussion not found")
@@ -790,11 +1052,9 @@ async def pause_discussion(discussion_id: int, db: AsyncSession = Depends(get_db
 
 
 @router.post("/{discussion_id}/resume")
-async def resume_discussion(discussion_id: int, db: AsyncSession = Depends(get_db)):
+async def resume_discussion(discussion_id: int, db: AsyncSession = Depends(get_write_db)):
     """继续讨论"""
-    result = await db.execute(
-        select(Discussion).where(Discussion.id == discussion_id)
-    )
+    result = await db.execute(discussion_by_id(discussion_id))
     discussion = result.scalar_one_or_none()
     if not discussion:
         raise HTTPException(status_code=404, detail="Discussion not found")
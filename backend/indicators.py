@@ -0,0 +1,190 @@
+"""
+技术指标计算（NumPy）
+对整段日线数组一次性计算，不逐根K线循环：
+
+- 区间涨跌：按日历天数定位起点K线（交易日K线不能直接用 closes[-天数]）
+- 均线：SMA20/50、EMA12/26
+- RSI(14)：Wilder平滑
+- MACD(12, 26, 9)
+- 20日已实现波动率（年化）
+- 回撤：当前回撤、区间最大回撤
+- 成交量趋势：近5日均量 / 近20日均量
+
+缺失的K线（停牌、数据源返回null）收盘价沿用前一根，成交量按缺失处理
+"""
+import math
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+TRADING_DAYS_PER_YEAR = 252
+
+# 区间 -> 日历天数
+PERIOD_DAYS = {"1w": 7, "1mo": 30, "3mo": 90, "6mo": 182, "1y": 365}
+
+RSI_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+VOLATILITY_WINDOW = 20
+VOLUME_SHORT_WINDOW, VOLUME_LONG_WINDOW = 5, 20
+
+
+def _array(values: Sequence[Optional[float]]) -> np.ndarray:
+    """None -> NaN"""
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """用前一个有效值填充NaN（开头的NaN保持不变）"""
+    valid = ~np.isnan(values)
+    index = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(index, out=index)
+    filled = values[index]
+    filled[:np.argmax(valid) if valid.any() else len(values)] = np.nan
+    return filled
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    """简单移动平均，不足window根时为NaN"""
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        cumsum = np.cumsum(np.insert(values, 0, 0.0))
+        result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+
+def ema(values: np.ndarray, alpha: float, initial: Optional[float] = None) -> np.ndarray:
+    """
+    指数移动平均 y[t] = (1-alpha)*y[t-1] + alpha*x[t]，initial为y[-1]（默认取x[0]）
+
+    递推式展开为 y[s+k] = d^k * (d*y[s-1] + alpha * Σ x[s+j] / d^j)，按块用cumsum计算，
+    块长度保证 d^-k 不溢出
+    """
+    result = np.empty(len(values))
+    if len(values) == 0:
+        return result
+    decay = 1.0 - alpha
+    block = max(1, int(27 / -math.log(decay))) if 0 < decay < 1 else 1
+    previous = values[0] if initial is None else initial
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        powers = decay ** np.arange(len(chunk))
+        result[start:start + len(chunk)] = powers * (decay * previous + alpha * np.cumsum(chunk / powers))
+        previous = result[start + len(chunk) - 1]
+    return result
+
+
+def rsi(closes: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """Wilder RSI：前period个涨跌幅的简单平均作为初值，之后按 1/period 平滑"""
+    result = np.full(len(closes), np.nan)
+    if len(closes) <= period:
+        return result
+    changes = np.diff(closes)
+    gains = np.clip(changes, 0, None)
+    losses = np.clip(-changes, 0, None)
+    alpha = 1.0 / period
+    avg_gain = np.concatenate(([gains[:period].mean()], ema(gains[period:], alpha, gains[:period].mean())))
+    avg_loss = np.concatenate(([losses[:period].mean()], ema(losses[period:], alpha, losses[:period].mean())))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    # 没有下跌时RSI为100，完全没有波动时为50
+    values = np.where(avg_loss == 0, np.where(avg_gain == 0, 50.0, 100.0), values)
+    result[period:] = values
+    return result
+
+
+def macd(closes: np.ndarray) -> Dict[str, np.ndarray]:
+    fast = ema(closes, 2.0 / (MACD_FAST + 1))
+    slow = ema(closes, 2.0 / (MACD_SLOW + 1))
+    line = fast - slow
+    signal = ema(line, 2.0 / (MACD_SIGNAL + 1))
+    return {"macd": line, "signal": signal, "histogram": line - signal}
+
+
+def realized_volatility(closes: np.ndarray, window: int = VOLATILITY_WINDOW) -> Optional[float]:
+    """最近window个交易日对数收益率的年化标准差（%）"""
+    if len(closes) <= window:
+        return None
+    returns = np.diff(np.log(closes[-(window + 1):]))
+    return float(np.std(returns, ddof=1) * math.sqrt(TRADING_DAYS_PER_YEAR) * 100)
+
+
+def drawdowns(closes: np.ndarray) -> np.ndarray:
+    """相对历史最高收盘价的回撤（%，非正数）"""
+    return (closes / np.maximum.accumulate(closes) - 1.0) * 100
+
+
+def period_start_index(timestamps: np.ndarray, days: int) -> Optional[int]:
+    """最后一根K线往前days个日历日时的K线下标，数据不够长时返回None"""
+    target = timestamps[-1] - days * SECONDS_PER_DAY
+    index = int(np.searchsorted(timestamps, target, side="right")) - 1
+    return index if index >= 0 else None
+
+
+def _round(value, digits: int = 2) -> Optional[float]:
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else round(value, digits)
+
+
+def compute_indicators(
+    timestamps: Sequence[int],
+    closes: Sequence[Optional[float]],
+    volumes: Sequence[Optional[float]],
+    periods: List[str]
+) -> Optional[Dict]:
+    """
+    由日线数据计算指标，返回可直接JSON序列化的字典；没有有效收盘价时返回None
+
+    Args:
+        timestamps: K线时间戳（秒，升序）
+        closes: 收盘价，缺失为None
+        volumes: 成交量，缺失为None
+        periods: 需要计算涨跌的区间，如 ["1w", "1mo", "3mo"]
+    """
+    close_array = forward_fill(_array(closes))
+    valid = ~np.isnan(close_array)
+    if not valid.any():
+        return None
+    # 去掉开头没有价格的K线
+    first = int(np.argmax(valid))
+    close_array = close_array[first:]
+    time_array = np.array(timestamps[first:], dtype=float)
+    volume_array = _array(volumes)[first:]
+    current_price = close_array[-1]
+
+    result = {"current_price": _round(current_price)}
+
+    for period in periods:
+        start = period_start_index(time_array, PERIOD_DAYS.get(period, 30))
+        if start is None:
+            continue
+        old_price = close_array[start]
+        change = current_price - old_price
+        result[f"trend_{period}"] = {
+            "change": _round(change),
+            "change_percent": _round(change / old_price * 100),
+            "old_price": _round(old_price),
+            "current_price": _round(current_price)
+        }
+
+    result["rsi"] = _round(rsi(close_array)[-1])
+    result["sma_20"] = _round(sma(close_array, 20)[-1])
+    result["sma_50"] = _round(sma(close_array, 50)[-1])
+    result["ema_12"] = _round(ema(close_array, 2.0 / (MACD_FAST + 1))[-1])
+    result["ema_26"] = _round(ema(close_array, 2.0 / (MACD_SLOW + 1))[-1])
+    if len(close_array) >= MACD_SLOW + MACD_SIGNAL:
+        result["macd"] = {key: _round(values[-1], 3) for key, values in macd(close_array).items()}
+    result["volatility_20d"] = _round(realized_volatility(close_array))
+    drawdown = drawdowns(close_array)
+    result["drawdown"] = _round(drawdown[-1])
+    result["max_drawdown"] = _round(drawdown.min())
+
+    # 成交量：最后一根K线的成交量，以及短期/长期均量之比
+    result["volume"] = _round(volume_array[-1], 0) if len(volume_array) else None
+    if np.count_nonzero(~np.isnan(volume_array[-VOLUME_LONG_WINDOW:])) >= VOLUME_SHORT_WINDOW:
+        short_avg = np.nanmean(volume_array[-VOLUME_SHORT_WINDOW:])
+        long_avg = np.nanmean(volume_array[-VOLUME_LONG_WINDOW:])
+        result["volume_avg_20d"] = _round(long_avg, 0)
+        result["volume_ratio"] = _round(short_avg / long_avg) if long_avg else None
+    return result
@@ -4,7 +4,7 @@
 """
 import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import AsyncSessionLocal, Agent, init_db
+from database import WriteSessionLocal, Agent, init_db
 
 DEFAULT_MODEL = "deepseek-ai/DeepSeek-V3.2-Exp"
 
@@ -351,7 +351,7 @@ async def init_default_agents():
     """初始化默认Agent团队"""
     await init_db()
     
-    async with AsyncSessionLocal() as db:
+    async with WriteSessionLocal() as db:
         # 检查是否已有Agent
         from sqlalchemy import select
         result = await db.execute(select(Agent))
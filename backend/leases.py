@@ -0,0 +1,126 @@
+"""
+跨进程租约
+多worker部署时各进程不共享内存，需要互斥的操作通过数据库leases表协调：
+- 讨论生成的运行锁：同一讨论同一时刻只有一次生成（避免不同worker上重复开始讨论）
+- 行情抓取的单飞锁：同一代码只有一个进程访问外部接口，其他进程等待共享缓存
+
+租约带过期时间，持有期间后台续期；进程崩溃后租约过期即可被其他进程接管
+"""
+import asyncio
+import os
+import socket
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Set
+from dotenv import load_dotenv
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from database import WriteSessionLocal, ReadSessionLocal, Lease
+
+load_dotenv()
+
+# 运行锁有效期（秒），持有期间每 1/3 有效期续期一次
+RUN_LOCK_TTL_SECONDS = float(os.getenv("RUN_LOCK_TTL_SECONDS", "60"))
+
+# 当前进程标识，写入owner便于排查
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+RUN_LOCK_PREFIX = "run:discussion:"
+
+
+class LeaseBusy(Exception):
+    """租约被其他持有者占用"""
+
+
+def run_lock_name(discussion_id: int) -> str:
+    return f"{RUN_LOCK_PREFIX}{discussion_id}"
+
+
+def new_token() -> str:
+    """每次获取使用独立的owner，同一进程内的两个请求也互斥"""
+    return f"{PROCESS_ID}:{uuid.uuid4().hex[:8]}"
+
+
+async def acquire_lease(name: str, owner: str, ttl_seconds: float) -> bool:
+    """获取租约，已被占用且未过期时返回False"""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    async with WriteSessionLocal() as session:
+        # 接管已过期的租约
+        result = await session.execute(
+            update(Lease)
+            .where(Lease.name == name)
+            .where(Lease.expires_at < now)
+            .values(owner=owner, expires_at=expires_at)
+        )
+        if result.rowcount:
+            await session.commit()
+            return True
+        session.add(Lease(name=name, owner=owner, expires_at=expires_at))
+        try:
+            await session.commit()
+            return True
+        except IntegrityError:
+            await session.rollback()
+            return False
+
+
+async def renew_lease(name: str, owner: str, ttl_seconds: float) -> bool:
+    """续期，租约已丢失（过期后被接管）时返回False"""
+    async with WriteSessionLocal() as session:
+        result = await session.execute(
+            update(Lease)
+            .where(Lease.name == name)
+            .where(Lease.owner == owner)
+            .values(expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds))
+        )
+        await session.commit()
+        return bool(result.rowcount)
+
+
+async def release_lease(name: str, owner: str):
+    async with WriteSessionLocal() as session:
+        await session.execute(delete(Lease).where(Lease.name == name).where(Lease.owner == owner))
+        await session.commit()
+
+
+async def active_lease_names(prefix: str) -> Set[str]:
+    """未过期的租约名称"""
+    async with ReadSessionLocal() as session:
+        result = await session.execute(
+            select(Lease.name)
+            .where(Lease.name.startswith(prefix))
+            .where(Lease.expires_at >= datetime.utcnow())
+        )
+        return set(result.scalars())
+
+
+async def _keep_alive(name: str, owner: str, ttl_seconds: float):
+    while True:
+        await asyncio.sleep(ttl_seconds / 3)
+        try:
+            if not await renew_lease(name, owner, ttl_seconds):
+                print(f"⚠️  租约 {name} 已丢失")
+                return
+        except Exception as e:
+            print(f"⚠️  租约 {name} 续期失败: {e}")
+
+
+@asynccontextmanager
+async def hold_lease(name: str, ttl_seconds: float = RUN_LOCK_TTL_SECONDS) -> AsyncIterator[str]:
+    """持有租约直到退出上下文（后台自动续期），被占用时抛出LeaseBusy"""
+    owner = new_token()
+    if not await acquire_lease(name, owner, ttl_seconds):
+        raise LeaseBusy(name)
+    keep_alive = asyncio.create_task(_keep_alive(name, owner, ttl_seconds))
+    try:
+        yield owner
+    finally:
+        keep_alive.cancel()
+        await asyncio.shield(release_lease(name, owner))
+
+
+async def running_discussions() -> Set[int]:
+    """所有进程中正在生成的讨论ID"""
+    return {int(name[len(RUN_LOCK_PREFIX):]) for name in await active_lease_names(RUN_LOCK_PREFIX)}
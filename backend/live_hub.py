@@ -0,0 +1,175 @@
+"""
+讨论直播广播中心
+一次生成的SSE事件扇出给任意数量的观看者，每个观看者有独立的有界缓冲区
+
+广播中心在进程内存中，多worker部署时其他worker上的生成见 live_relay.py
+"""
+import asyncio
+import os
+from collections import deque
+from typing import AsyncGenerator, AsyncIterator, Deque, Dict, Optional, Set
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 每个观看者最多缓冲的事件数，超出视为慢消费者并断开
+LIVE_SUBSCRIBER_BUFFER = int(os.getenv("LIVE_SUBSCRIBER_BUFFER", "256"))
+# 新观看者加入时补发的最近事件数（让中途加入的人看到当前进度）
+LIVE_BACKLOG_SIZE = int(os.getenv("LIVE_BACKLOG_SIZE", "512"))
+# 空闲时的心跳间隔（秒），防止代理断开长连接
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+
+HEARTBEAT_FRAME = ": keepalive\n\n"
+DROPPED_FRAME = 'data: {"type": "live_dropped", "reason": "slow_consumer"}\n\n'
+SHUTDOWN_FRAME = 'data: {"type": "live_closed", "reason": "shutdown"}\n\n'
+
+
+class LiveSubscriber:
+    """单个观看者：有界队列 + 是否已被丢弃"""
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    def offer(self, frame: str) -> bool:
+        """非阻塞投递，队列满返回False"""
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self, final_frame: Optional[str] = None):
+        """清空积压并投递结束标记（None）"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        if final_frame:
+            self.queue.put_nowait(final_frame)
+        self.queue.put_nowait(None)
+
+
+class LiveChannel:
+    """单个讨论的广播频道"""
+
+    def __init__(self, backlog_size: int):
+        self.subscribers: Set[LiveSubscriber] = set()
+        self.backlog: Deque[str] = deque(maxlen=backlog_size)
+        self.active_runs = 0
+
+
+class LiveHub:
+    """按讨论ID管理广播频道"""
+
+    def __init__(
+        self,
+        subscriber_buffer: int = LIVE_SUBSCRIBER_BUFFER,
+        backlog_size: int = LIVE_BACKLOG_SIZE
+    ):
+        self.subscriber_buffer = max(2, subscriber_buffer)
+        self.backlog_size = backlog_size
+        self._channels: Dict[int, LiveChannel] = {}
+        self.dropped_count = 0
+        self.draining = False
+
+    def _channel(self, discussion_id: int) -> LiveChannel:
+        channel = self._channels.get(discussion_id)
+        if channel is None:
+            channel = LiveChannel(self.backlog_size)
+            self._channels[discussion_id] = channel
+        return channel
+
+    def _cleanup(self, discussion_id: int):
+        channel = self._channels.get(discussion_id)
+        if channel and not channel.subscribers and not channel.active_runs:
+            del self._channels[discussion_id]
+
+    def is_live(self, discussion_id: int) -> bool:
+        channel = self._channels.get(discussion_id)
+        return bool(channel and channel.active_runs)
+
+    def subscriber_count(self, discussion_id: int) -> int:
+        channel = self._channels.get(discussion_id)
+        return len(channel.subscribers) if channel else 0
+
+    def publish(self, discussion_id: int, frame: str):
+        """把一帧SSE数据扇出给所有观看者，慢消费者直接断开"""
+        channel = self._channels.get(discussion_id)
+        if channel is None:
+            return
+        channel.backlog.append(frame)
+        for subscriber in list(channel.subscribers):
+            if not subscriber.offer(frame):
+                subscriber.dropped = True
+                channel.subscribers.discard(subscriber)
+                subscriber.close(DROPPED_FRAME)
+                self.dropped_count += 1
+
+    async def broadcast(
+        self,
+        discussion_id: int,
+        frames: AsyncIterator[str]
+    ) -> AsyncGenerator[str, None]:
+        """
+        包装一次生成：原请求照常收到每一帧，同时扇出给直播观看者
+
+        生成仍由发起请求驱动，发起方中断（暂停）时所有观看者一起结束
+        """
+        channel = self._channel(discussion_id)
+        if not channel.active_runs:
+            channel.backlog.clear()
+        channel.active_runs += 1
+        self.publish(discussion_id, f'data: {{"type": "live_start", "discussion_id": {discussion_id}}}\n\n')
+        try:
+            async for frame in frames:
+                self.publish(discussion_id, frame)
+                yield frame
+        finally:
+            channel.active_runs -= 1
+            self.publish(discussion_id, f'data: {{"type": "live_end", "discussion_id": {discussion_id}}}\n\n')
+            self._cleanup(discussion_id)
+
+    async def listen(self, discussion_id: int) -> AsyncGenerator[str, None]:
+        """订阅讨论直播：先补发当前进度，再持续推送新事件"""
+        if self.draining:
+            yield SHUTDOWN_FRAME
+            return
+        channel = self._channel(discussion_id)
+        subscriber = LiveSubscriber(self.subscriber_buffer)
+        # 补发积压事件（只补发缓冲区能容纳的最近部分）
+        for frame in list(channel.backlog)[-(self.subscriber_buffer - 1):]:
+            subscriber.offer(frame)
+        channel.subscribers.add(subscriber)
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(
+                        subscriber.queue.get(), timeout=LIVE_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT_FRAME
+                    continue
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            channel.subscribers.discard(subscriber)
+            self._cleanup(discussion_id)
+
+    def close_all(self, final_frame: Optional[str] = None):
+        """关闭所有观看者连接（应用关闭时调用）"""
+        for channel in self._channels.values():
+            for subscriber in list(channel.subscribers):
+                subscriber.close(final_frame)
+            channel.subscribers.clear()
+
+    def begin_drain(self):
+        """
+        开始优雅关闭：观看者连接不会自行结束，先断开它们；
+        进行中的生成不受影响，由服务器等待其完成
+        """
+        self.draining = True
+        self.close_all(SHUTDOWN_FRAME)
+
+
+# 全局实例
+live_hub = LiveHub()
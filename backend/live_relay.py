@@ -0,0 +1,106 @@
+"""
+跨worker直播转播
+live_hub 的广播只在发起生成的进程内，多worker部署时观看者可能连到其他worker
+（uvicorn多进程共用一个监听socket，无法把请求路由到指定worker）。
+这时按运行锁（leases表）判断讨论正在其他进程生成，轮询messages表中的断点转播给观看者
+"""
+import asyncio
+import json
+import os
+import time
+from typing import AsyncGenerator, Dict, Set
+from dotenv import load_dotenv
+from sqlalchemy import select, func
+from database import ReadSessionLocal, Message
+from checkpoint import STATUS_STREAMING
+from leases import running_discussions
+from live_hub import live_hub, HEARTBEAT_FRAME, SHUTDOWN_FRAME, LIVE_HEARTBEAT_SECONDS
+
+load_dotenv()
+
+# 转播时轮询断点的间隔（秒）
+LIVE_RELAY_POLL_SECONDS = float(os.getenv("LIVE_RELAY_POLL_SECONDS", "1"))
+
+
+async def running_elsewhere(discussion_id: int) -> bool:
+    """讨论正在生成，但不在本进程的广播中心"""
+    return not live_hub.is_live(discussion_id) and discussion_id in await running_discussions()
+
+
+def _event(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def relay_checkpoints(
+    discussion_id: int,
+    poll_seconds: float = LIVE_RELAY_POLL_SECONDS
+) -> AsyncGenerator[str, None]:
+    """
+    转播其他进程中进行的生成：轮询该讨论的消息断点，把新增内容转成
+    agent_start / content / agent_end 事件（带message_id，区分并行输出的Agent），运行锁释放后发送live_end
+
+    粒度取决于断点保存频率（CHECKPOINT_EVERY_CHARS / CHECKPOINT_EVERY_SECONDS）
+    """
+    yield _event({"type": "live_start", "discussion_id": discussion_id, "relay": True})
+    async with ReadSessionLocal() as session:
+        # 从最早的未完成消息开始（没有时从下一条新消息开始）
+        floor = await session.scalar(
+            select(func.min(Message.id))
+            .where(Message.discussion_id == discussion_id)
+            .where(Message.status == STATUS_STREAMING)
+        )
+        if floor is None:
+            floor = (await session.scalar(
+                select(func.max(Message.id)).where(Message.discussion_id == discussion_id)
+            ) or 0) + 1
+
+    sent: Dict[int, int] = {}  # 消息ID -> 已转发的字符数
+    ended: Set[int] = set()
+    last_frame_at = time.monotonic()
+    while not live_hub.draining:
+        # 先判断是否还在生成，再读取断点：生成结束后最后一次读取能拿到完整内容
+        running = discussion_id in await running_discussions()
+        async with ReadSessionLocal() as session:
+            rows = (await session.execute(
+                select(
+                    Message.id, Message.agent_id, Message.agent_name, Message.agent_role,
+                    Message.message_type, Message.content, Message.status
+                )
+                .where(Message.discussion_id == discussion_id)
+                .where(Message.id >= floor)
+                .order_by(Message.id)
+            )).all()
+
+        frames = []
+        for row in rows:
+            if row.id not in sent:
+                sent[row.id] = 0
+                frames.append(_event({
+                    "type": "agent_start", "message_id": row.id, "agent_id": row.agent_id,
+                    "agent_name": row.agent_name, "agent_role": row.agent_role, "message_type": row.message_type
+                }))
+            content = row.content or ""
+            if len(content) > sent[row.id]:
+                frames.append(_event({"type": "content", "message_id": row.id, "content": content[sent[row.id]:]}))
+                sent[row.id] = len(content)
+            if row.status != STATUS_STREAMING and row.id not in ended:
+                ended.add(row.id)
+                frames.append(_event({"type": "agent_end", "message_id": row.id, "agent_id": row.agent_id}))
+        if rows:
+            streaming = [row.id for row in rows if row.status == STATUS_STREAMING]
+            floor = min(streaming) if streaming else rows[-1].id + 1
+            sent = {message_id: length for message_id, length in sent.items() if message_id >= floor}
+            ended = {message_id for message_id in ended if message_id >= floor}
+
+        for frame in frames:
+            yield frame
+        if frames:
+            last_frame_at = time.monotonic()
+        elif time.monotonic() - last_frame_at >= LIVE_HEARTBEAT_SECONDS:
+            yield HEARTBEAT_FRAME
+            last_frame_at = time.monotonic()
+        if not running:
+            yield _event({"type": "live_end", "discussion_id": discussion_id, "relay": True})
+            return
+        await asyncio.sleep(poll_seconds)
+    yield SHUTDOWN_FRAME
@@ -3,22 +3,52 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
 import os
 
-from database import init_db
+from database import init_db, dispose_engines
 from agent_service import router as agent_router
 from discussion_service import router as discussion_router
+from search_service import router as search_router
+from transfer_service import router as transfer_router
+from market_service import router as market_router
+from live_hub import live_hub
+from checkpoint import finalize_interrupted_messages
+from archive import archive_loop, ARCHIVE_ENABLED
+from retention import retention_loop, RETENTION_ENABLED
+from agent_registry import agent_registry
+from data_fetcher import stock_fetcher
+from prefetcher import market_prefetcher, MARKET_PREFETCH_ENABLED
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用启动和关闭时的生命周期管理"""
     # 启动时初始化数据库
-    await init_db()
+    applied = await init_db()
+    if applied:
+        print(f"🔄 已应用数据库迁移: {', '.join(applied)}")
     print("✅ 数据库初始化完成")
+    interrupted = await finalize_interrupted_messages()
+    if interrupted:
+        print(f"⚠️  {interrupted} 条消息在上次运行中被中断，已标记为 interrupted，可在前端续写")
+    agents = await agent_registry.load()
+    print(f"✅ 已加载 {len(agents)} 个Agent")
+    # 后台归档长时间没有新消息的讨论
+    archive_task = asyncio.create_task(archive_loop()) if ARCHIVE_ENABLED else None
+    # 后台按保留策略删除过期讨论
+    retention_task = asyncio.create_task(retention_loop()) if RETENTION_ENABLED else None
+    # 后台预取关注列表的行情
+    prefetch_task = asyncio.create_task(market_prefetcher.loop()) if MARKET_PREFETCH_ENABLED else None
     yield
-    # 关闭时的清理工作（如果需要）
+    for task in (archive_task, retention_task, prefetch_task):
+        if task:
+            task.cancel()
+    # 关闭时断开所有直播观看者
+    live_hub.close_all()
+    await stock_fetcher.aclose()
+    await dispose_engines()
     print("👋 应用关闭")
 
 
@@ -41,6 +71,9 @@ app.add_middleware(
 # 注册路由
 app.include_router(agent_router)
 app.include_router(discussion_router)
+app.include_router(search_router)
+app.include_router(transfer_router)
+app.include_router(market_router)
 
 # 静态文件服务
 frontend_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend")
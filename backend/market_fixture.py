@@ -0,0 +1,186 @@
+"""
+本地行情模拟服务
+模拟Yahoo Finance的K线接口和批量报价（spark）接口，返回确定的日线数据，
+用于在不访问外部接口的情况下验证行情获取（增量更新、批量合并请求）。
+
+- /v8/finance/chart/{symbol}  单个代码的日线，支持 period1/period2
+- /v8/finance/spark           多个代码最近的收盘价，支持 symbols/range
+- 代码 BAD 返回404，模拟不存在的代码
+
+用法：
+    python market_fixture.py --port 9200      # 启动服务，设置 YAHOO_FINANCE_BASE_URL=http://127.0.0.1:9200
+    python market_fixture.py --check          # 在临时数据库上检查批量获取的请求数
+"""
+import argparse
+import asyncio
+import math
+import os
+import shutil
+import socket
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+import uvicorn
+from fastapi import FastAPI, HTTPException
+
+# 模拟美东交易所：开盘时间 14:30 UTC，夏令时偏移 -4 小时
+SESSION_OPEN_SECONDS = 14 * 3600 + 1800
+GMT_OFFSET = -4 * 3600
+UNKNOWN_SYMBOLS = {"BAD"}
+RANGE_DAYS = {"5d": 5, "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366}
+
+app = FastAPI(title="Market Fixture")
+# 各接口收到的请求数，检查时用来确认是否走了批量接口
+requests = Counter()
+
+
+def _price(symbol: str, day_index: int) -> float:
+    """按代码和日期生成确定的价格"""
+    base = 50 + sum(ord(ch) for ch in symbol) % 200
+    return round(base * (1 + 0.1 * math.sin(day_index / 9 + len(symbol))), 2)
+
+
+def daily_bars(symbol: str, start: int, end: int) -> List[Dict]:
+    """[start, end] 区间内每个工作日的日线"""
+    bars = []
+    day_index = max(start, 0) // 86400
+    while True:
+        timestamp = day_index * 86400 + SESSION_OPEN_SECONDS
+        if timestamp > end:
+            break
+        # 1970-01-01 是周四，(day_index + 3) % 7 >= 5 为周末
+        if timestamp >= start and (day_index + 3) % 7 < 5:
+            close = _price(symbol, day_index)
+            bars.append({
+                "timestamp": timestamp,
+                "open": round(close * 0.99, 2),
+                "high": round(close * 1.01, 2),
+                "low": round(close * 0.98, 2),
+                "close": close,
+                "volume": 1_000_000 + day_index % 17 * 10_000
+            })
+        day_index += 1
+    return bars
+
+
+@app.get("/v8/finance/chart/{symbol}")
+async def chart(symbol: str, period1: int = 0, period2: Optional[int] = None, interval: str = "1d"):
+    requests["chart"] += 1
+    if symbol in UNKNOWN_SYMBOLS:
+        raise HTTPException(status_code=404, detail="No data found, symbol may be delisted")
+    bars = daily_bars(symbol, period1, period2 or int(time.time()))
+    return {
+        "chart": {
+            "result": [{
+                "meta": {"symbol": symbol, "gmtoffset": GMT_OFFSET},
+                "timestamp": [bar["timestamp"] for bar in bars],
+                "indicators": {"quote": [{
+                    field: [bar[field] for bar in bars] for field in ("open", "high", "low", "close", "volume")
+                }]}
+            }],
+            "error": None
+        }
+    }
+
+
+@app.get("/v8/finance/spark")
+async def spark(symbols: str, range: str = "1mo", interval: str = "1d"):
+    requests["spark"] += 1
+    end = int(time.time())
+    start = end - RANGE_DAYS.get(range, 31) * 86400
+    result = {}
+    for symbol in symbols.split(","):
+        if not symbol or symbol in UNKNOWN_SYMBOLS:
+            continue
+        bars = daily_bars(symbol, start, end)
+        result[symbol] = {
+            "symbol": symbol,
+            "timestamp": [bar["timestamp"] for bar in bars],
+            "close": [bar["close"] for bar in bars]
+        }
+    return result
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def check():
+    """在临时数据库上检查：首次获取逐个请求K线，再次获取合并为一次批量请求"""
+    port = _free_port()
+    tmpdir = tempfile.mkdtemp(prefix="opinionroom-market-")
+    # 模块导入时读取配置，必须先设置环境变量
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'market.db')}"
+    os.environ["YAHOO_FINANCE_BASE_URL"] = f"http://127.0.0.1:{port}"
+    from migrations import run_migrations
+    from data_fetcher import stock_fetcher
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    symbols = ["AAPL", "MSFT", "NVDA", "TSLA", "AMZN", "GOOGL", "META", "AMD", "BABA", "NFLX"]
+    ok = True
+    try:
+        await run_migrations()
+
+        requests.clear()
+        started = time.perf_counter()
+        results = await stock_fetcher.get_stock_trends(symbols, use_cache=False)
+        cold = time.perf_counter() - started
+        cold_requests = dict(requests)
+        print(f"首次获取 {len(symbols)} 个代码: {cold * 1000:.0f}ms，请求 {cold_requests}")
+        if len(results) != len(symbols) or cold_requests.get("chart") != len(symbols):
+            ok = False
+
+        # 不使用缓存，再次访问数据源：本地已有K线的代码合并为一次批量请求
+        requests.clear()
+        started = time.perf_counter()
+        results = await stock_fetcher.get_stock_trends(symbols + ["BAD"], use_cache=False)
+        warm = time.perf_counter() - started
+        warm_requests = dict(requests)
+        print(f"再次获取 {len(symbols)} 个代码 + 1 个无效代码: {warm * 1000:.0f}ms，请求 {warm_requests}")
+        if len(results) != len(symbols) or warm_requests.get("spark") != 1:
+            ok = False
+        # 无效代码没有本地K线，仍走单个代码的K线接口
+        if warm_requests.get("chart") != 1:
+            ok = False
+
+        sample = results.get("AAPL") or {}
+        print(f"AAPL 当前价格 {sample.get('current_price')}，RSI {sample.get('rsi')}，成交量 {sample.get('volume')}")
+        if sample.get("current_price") is None or sample.get("sma_50") is None:
+            ok = False
+    finally:
+        await stock_fetcher.aclose()
+        server.should_exit = True
+        await serve_task
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print("✅ 批量获取检查通过" if ok else "❌ 批量获取检查失败")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地行情模拟服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=9200, help="监听端口")
+    parser.add_argument("--check", action="store_true", help="在临时数据库上检查批量获取")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("📈 本地行情模拟服务")
+    print("=" * 60)
+    if args.check:
+        if not asyncio.run(check()):
+            raise SystemExit(1)
+        return
+    print(f"YAHOO_FINANCE_BASE_URL=http://{args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,555 @@
+"""
+行情数据源
+日线数据可以来自多个数据源，按 MARKET_PROVIDERS 的顺序依次尝试：
+
+- yahoo          Yahoo Finance（K线接口 + 批量报价接口）
+- alpha_vantage  Alpha Vantage（需要 ALPHA_VANTAGE_API_KEY）
+- local          本地CSV文件（MARKET_OFFLINE_DIR 目录下的 {代码}.csv），用于离线运行和基准测试
+
+每个数据源单独统计成功/失败次数和延迟；连续失败 MARKET_PROVIDER_MAX_FAILURES 次后
+暂停使用 MARKET_PROVIDER_COOLDOWN_SECONDS 秒，期间直接尝试下一个数据源。
+代码不存在（数据源正常响应但没有数据）不计为失败。
+
+用法：
+    python market_providers.py --write-fixtures ./data/market   # 生成离线CSV（确定的模拟数据）
+    python market_providers.py --benchmark                       # 用离线数据源测试数据增强的行情获取
+"""
+import abc
+import argparse
+import asyncio
+import csv
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from datetime import date, datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 数据源优先级（逗号分隔），未配置的数据源（没有API密钥、没有离线目录）自动跳过
+MARKET_PROVIDERS = [
+    name.strip() for name in os.getenv("MARKET_PROVIDERS", "yahoo,alpha_vantage,local").split(",") if name.strip()
+]
+# 连续失败多少次后暂停使用该数据源，以及暂停时长（秒）
+MARKET_PROVIDER_MAX_FAILURES = int(os.getenv("MARKET_PROVIDER_MAX_FAILURES", "3"))
+MARKET_PROVIDER_COOLDOWN_SECONDS = float(os.getenv("MARKET_PROVIDER_COOLDOWN_SECONDS", "60"))
+# 每个数据源主机同时进行的请求数（同时也是连接池大小）
+MARKET_MAX_CONCURRENCY = int(os.getenv("MARKET_MAX_CONCURRENCY", "8"))
+# 数据源地址（本地测试时可指向 market_fixture.py 启动的模拟服务）
+YAHOO_FINANCE_BASE_URL = os.getenv("YAHOO_FINANCE_BASE_URL", "https://query1.finance.yahoo.com").rstrip("/")
+ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY", "")
+ALPHA_VANTAGE_BASE_URL = os.getenv("ALPHA_VANTAGE_BASE_URL", "https://www.alphavantage.co").rstrip("/")
+# 离线数据目录，每个代码一个CSV文件（列：Date,Open,High,Low,Close[,Adj Close],Volume）
+MARKET_OFFLINE_DIR = os.getenv("MARKET_OFFLINE_DIR", "")
+# 批量报价（spark接口）：一次请求的最大代码数、收集同一批代码的等待时间（毫秒）
+MARKET_SPARK_BATCH_SIZE = int(os.getenv("MARKET_SPARK_BATCH_SIZE", "20"))
+MARKET_SPARK_WINDOW_MS = float(os.getenv("MARKET_SPARK_WINDOW_MS", "20"))
+# 批量报价返回的历史长度；本地数据落后超过 RECENT_CLOSES_MAX_GAP_DAYS 天时改用完整K线
+MARKET_SPARK_RANGE = "1mo"
+RECENT_CLOSES_MAX_GAP_DAYS = 25
+
+# K线字段（另有 day 和 timestamp）
+BAR_FIELDS = ("open", "high", "low", "close", "volume")
+
+# 延迟统计保留最近多少次请求
+LATENCY_WINDOW = 100
+
+
+class HttpPool:
+    """数据源共用的HTTP客户端，按主机限制并发请求数"""
+
+    def __init__(self, max_concurrency: int = MARKET_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+
+    def client(self) -> httpx.AsyncClient:
+        """共享的HTTP客户端（首次使用时创建），复用连接"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(10.0, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency * 2,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+        return self._client
+
+    def slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._slots:
+            self._slots[host] = asyncio.Semaphore(self.max_concurrency)
+        return self._slots[host]
+
+    async def get(self, url: str, params: Dict) -> httpx.Response:
+        async with self.slot(url):
+            return await self.client().get(url, params=params)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._slots.clear()
+
+
+class RequestBatcher:
+    """
+    把短时间内的单个请求合并成批量请求
+
+    submit(key) 等待 window 秒收集其他key（或凑满 max_size 立即发出），
+    然后调用一次 flush(keys)，各调用方拿到自己key的结果；批量请求失败时结果为None
+    """
+
+    def __init__(self, flush: Callable[[List[str]], Awaitable[Dict[str, object]]], max_size: int, window: float):
+        self._flush = flush
+        self.max_size = max_size
+        self.window = window
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running = set()
+
+    async def submit(self, key: str):
+        loop = asyncio.get_running_loop()
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = loop.create_future()
+        if len(self._pending) >= self.max_size:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_now)
+        # shield：调用方超时取消时不影响同一批的其他调用方
+        return await asyncio.shield(future)
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: Dict[str, asyncio.Future]):
+        try:
+            results = await self._flush(list(batch))
+        except Exception as e:
+            print(f"批量请求失败 ({len(batch)} 个): {e}")
+            results = {}
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
+    async def aclose(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for future in self._pending.values():
+            future.cancel()
+        self._pending = {}
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+
+# ===== 数据源 =====
+
+
+class MarketProvider(abc.ABC):
+    """
+    数据源接口（子类必须实现 fetch_bars，缺少时实例化即报错）
+
+    K线为字典列表，每根包含 day（交易所当地日期）、timestamp（秒）和 BAR_FIELDS，缺失的字段为None。
+    代码不存在时返回空列表；网络错误、限流等数据源故障抛出异常
+    """
+
+    name = ""
+    # 是否支持 recent_closes（批量获取最近收盘价）
+    batch_closes = False
+
+    def configured(self) -> bool:
+        return True
+
+    @abc.abstractmethod
+    async def fetch_bars(self, symbol: str, start: int) -> List[Dict]:
+        """start 时间戳之后（含start所在交易日）的日线"""
+
+    async def recent_closes(self, symbol: str) -> Optional[List[Dict]]:
+        """最近约一个月只有收盘价的K线（可与其他代码合并请求），不支持或没有数据时返回None"""
+        return None
+
+    async def aclose(self):
+        pass
+
+
+class YahooProvider(MarketProvider):
+    name = "yahoo"
+    batch_closes = True
+
+    def __init__(self, http: HttpPool, base_url: str = YAHOO_FINANCE_BASE_URL):
+        self.http = http
+        self.chart_url = f"{base_url}/v8/finance/chart"
+        self.spark_url = f"{base_url}/v8/finance/spark"
+        self._batcher = RequestBatcher(self._fetch_spark, MARKET_SPARK_BATCH_SIZE, MARKET_SPARK_WINDOW_MS / 1000)
+
+    async def fetch_bars(self, symbol: str, start: int) -> List[Dict]:
+        params = {
+            "interval": "1d",
+            "period1": start,
+            "period2": int(time.time()),
+            "includePrePost": "false"
+        }
+        response = await self.http.get(f"{self.chart_url}/{symbol}", params)
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        data = response.json()
+
+        results = (data.get("chart") or {}).get("result")
+        if not results:
+            raise ValueError((data.get("chart") or {}).get("error") or "empty chart result")
+        return self.parse_chart_bars(results[0])
+
+    async def recent_closes(self, symbol: str) -> Optional[List[Dict]]:
+        return await self._batcher.submit(symbol)
+
+    async def _fetch_spark(self, symbols: List[str]) -> Dict[str, List[Dict]]:
+        """一次请求获取多个代码最近的收盘价，返回 {代码: K线列表}"""
+        params = {"symbols": ",".join(symbols), "range": MARKET_SPARK_RANGE, "interval": "1d"}
+        response = await self.http.get(self.spark_url, params)
+        response.raise_for_status()
+        return self.parse_spark(response.json())
+
+    async def aclose(self):
+        await self._batcher.aclose()
+
+    @classmethod
+    def parse_spark(cls, data: Dict) -> Dict[str, List[Dict]]:
+        """
+        解析spark结果，兼容两种格式：
+        - {"TSLA": {"timestamp": [...], "close": [...]}, ...}
+        - {"spark": {"result": [{"symbol": "TSLA", "response": [chart结果]}]}}
+        """
+        results = {}
+        if isinstance(data.get("spark"), dict):
+            for item in data["spark"].get("result") or []:
+                response = item.get("response") or []
+                if item.get("symbol") and response:
+                    results[item["symbol"]] = cls.parse_chart_bars(response[0])
+            return results
+        for symbol, item in data.items():
+            if not isinstance(item, dict) or not item.get("timestamp"):
+                continue
+            # 没有时区信息时按UTC日期归档：日线时间戳是开盘时间，美股、港股、A股的UTC日期与当地日期一致
+            results[symbol] = cls.parse_chart_bars({
+                "timestamp": item["timestamp"],
+                "meta": {"gmtoffset": item.get("gmtoffset") or 0},
+                "indicators": {"quote": [{"close": item.get("close") or []}]}
+            })
+        return {symbol: bars for symbol, bars in results.items() if bars}
+
+    @staticmethod
+    def parse_chart_bars(result: Dict) -> List[Dict]:
+        """Yahoo chart结果 -> K线列表，按交易所当地日期归到交易日（同一天有多根时取最后一根）"""
+        timestamps = result.get("timestamp") or []
+        quote = (result.get("indicators", {}).get("quote") or [{}])[0]
+        offset = (result.get("meta") or {}).get("gmtoffset") or 0
+        bars = {}
+        for index, timestamp in enumerate(timestamps):
+            day = datetime.utcfromtimestamp(timestamp + offset).date()
+            bars[day] = {"day": day, "timestamp": timestamp}
+            for field in BAR_FIELDS:
+                values = quote.get(field) or []
+                bars[day][field] = values[index] if index < len(values) else None
+        return list(bars.values())
+
+
+class AlphaVantageProvider(MarketProvider):
+    """
+    Alpha Vantage 日线（TIME_SERIES_DAILY）
+
+    免费额度只提供最近100个交易日（outputsize=compact），足够计算3月涨跌和SMA50；
+    限流提示（Note/Information）按失败处理，触发暂停
+    """
+
+    name = "alpha_vantage"
+    # Yahoo代码后缀 -> Alpha Vantage后缀
+    SUFFIXES = {".SS": ".SHH", ".SZ": ".SHZ"}
+
+    def __init__(self, http: HttpPool, api_key: str = ALPHA_VANTAGE_API_KEY, base_url: str = ALPHA_VANTAGE_BASE_URL):
+        self.http = http
+        self.api_key = api_key
+        self.url = f"{base_url}/query"
+
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    @classmethod
+    def to_provider_symbol(cls, symbol: str) -> str:
+        for suffix, replacement in cls.SUFFIXES.items():
+            if symbol.endswith(suffix):
+                return symbol[:-len(suffix)] + replacement
+        # BRK-B -> BRK.B
+        return symbol.replace("-", ".")
+
+    async def fetch_bars(self, symbol: str, start: int) -> List[Dict]:
+        params = {
+            "function": "TIME_SERIES_DAILY",
+            "symbol": self.to_provider_symbol(symbol),
+            "outputsize": "compact",
+            "apikey": self.api_key
+        }
+        response = await self.http.get(self.url, params)
+        response.raise_for_status()
+        data = response.json()
+        if "Error Message" in data:
+            return []
+        series = data.get("Time Series (Daily)")
+        if series is None:
+            raise ValueError(data.get("Note") or data.get("Information") or "missing time series")
+        start_day = datetime.utcfromtimestamp(start).date()
+        return parse_daily_rows(
+            ({"date": day, **{key.split(". ", 1)[-1]: value for key, value in row.items()}}
+             for day, row in series.items()),
+            start_day
+        )
+
+
+class LocalFileProvider(MarketProvider):
+    """本地CSV日线（Yahoo下载格式），文件修改后自动重新读取"""
+
+    name = "local"
+
+    def __init__(self, directory: str = MARKET_OFFLINE_DIR):
+        self.directory = directory
+        self._files: Dict[str, tuple] = {}
+
+    def configured(self) -> bool:
+        return bool(self.directory) and os.path.isdir(self.directory)
+
+    async def fetch_bars(self, symbol: str, start: int) -> List[Dict]:
+        path = os.path.join(self.directory, f"{symbol}.csv")
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return []
+        cached = self._files.get(symbol)
+        if cached is None or cached[0] != mtime:
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = [{key.strip().lower(): value for key, value in row.items() if key} for row in csv.DictReader(f)]
+            cached = self._files[symbol] = (mtime, parse_daily_rows(rows, date.min))
+        start_day = datetime.utcfromtimestamp(start).date()
+        return [bar for bar in cached[1] if bar["day"] >= start_day]
+
+
+def parse_daily_rows(rows, start_day: date) -> List[Dict]:
+    """按日期的行（date + open/high/low/close/volume，值可以是字符串）-> K线列表，按日期升序"""
+    bars = []
+    for row in rows:
+        try:
+            day = date.fromisoformat(str(row["date"])[:10])
+        except (KeyError, ValueError):
+            continue
+        if day < start_day:
+            continue
+        # 没有交易时间信息，时间戳取当天0点（UTC）
+        bar = {"day": day, "timestamp": int((datetime(day.year, day.month, day.day) - datetime(1970, 1, 1)).total_seconds())}
+        for field in BAR_FIELDS:
+            try:
+                bar[field] = float(row[field])
+            except (KeyError, TypeError, ValueError):
+                bar[field] = None
+        if bar["close"] is not None:
+            bars.append(bar)
+    bars.sort(key=lambda bar: bar["day"])
+    return bars
+
+
+# ===== 故障切换 =====
+
+
+class ProviderHealth:
+    """单个数据源的健康状态和延迟统计"""
+
+    def __init__(self):
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.paused_until = 0.0
+        self.last_error: Optional[str] = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.paused_until
+
+    def record_success(self, latency: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.paused_until = 0.0
+        self.latencies.append(latency)
+
+    def record_failure(self, latency: float, error: Exception):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = f"{error.__class__.__name__}: {error}"[:200]
+        self.latencies.append(latency)
+        if self.consecutive_failures >= MARKET_PROVIDER_MAX_FAILURES:
+            self.paused_until = time.monotonic() + MARKET_PROVIDER_COOLDOWN_SECONDS
+
+    def stats(self) -> Dict:
+        latencies = sorted(self.latencies)
+        return {
+            "available": self.available(),
+            "paused_seconds": round(max(self.paused_until - time.monotonic(), 0), 1),
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "latency_avg_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            "latency_p95_ms": round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000, 1)
+            if latencies else None
+        }
+
+
+class ProviderChain:
+    """按优先级排列的数据源，跳过暂停中的数据源"""
+
+    def __init__(self, providers: List[MarketProvider]):
+        self.providers = providers
+        self.health = {provider.name: ProviderHealth() for provider in providers}
+
+    def ordered(self) -> List[MarketProvider]:
+        """可用的数据源；全部暂停时仍按优先级全部尝试，避免完全没有数据"""
+        available = [provider for provider in self.providers if self.health[provider.name].available()]
+        return available or list(self.providers)
+
+    async def call(self, provider: MarketProvider, method: Callable[..., Awaitable], *args):
+        """调用数据源并记录延迟和成功/失败"""
+        health = self.health[provider.name]
+        started = time.perf_counter()
+        try:
+            result = await method(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            health.record_failure(time.perf_counter() - started, e)
+            raise
+        health.record_success(time.perf_counter() - started)
+        return result
+
+    def stats(self) -> List[Dict]:
+        return [{"name": provider.name, **self.health[provider.name].stats()} for provider in self.providers]
+
+    async def aclose(self):
+        for provider in self.providers:
+            await provider.aclose()
+
+
+PROVIDER_CLASSES = {
+    "yahoo": YahooProvider,
+    "alpha_vantage": AlphaVantageProvider,
+    "local": LocalFileProvider,
+}
+
+
+def build_providers(http: HttpPool, names: List[str] = MARKET_PROVIDERS) -> ProviderChain:
+    """按名称创建数据源，跳过未知和未配置的数据源"""
+    providers = []
+    for name in names:
+        provider_class = PROVIDER_CLASSES.get(name)
+        if provider_class is None:
+            print(f"⚠️  未知的行情数据源: {name}")
+            continue
+        provider = provider_class() if provider_class is LocalFileProvider else provider_class(http)
+        if provider.configured():
+            providers.append(provider)
+    return ProviderChain(providers)
+
+
+# ===== 离线数据 =====
+
+
+def write_fixtures(directory: str, symbols: List[str], days: int = 200):
+    """用 market_fixture.py 的确定数据为每个代码生成CSV"""
+    from market_fixture import daily_bars
+
+    os.makedirs(directory, exist_ok=True)
+    end = int(time.time())
+    for symbol in symbols:
+        with open(os.path.join(directory, f"{symbol}.csv"), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Date", "Open", "High", "Low", "Close", "Volume"])
+            for bar in daily_bars(symbol, end - days * 86400, end):
+                day = datetime.utcfromtimestamp(bar["timestamp"]).date().isoformat()
+                writer.writerow([day] + [bar[field] for field in BAR_FIELDS])
+
+
+BENCHMARK_SYMBOLS = ["AAPL", "MSFT", "NVDA", "TSLA", "AMZN", "GOOGL", "META", "AMD", "BABA", "NFLX"]
+
+
+async def benchmark(rounds: int):
+    """离线数据源 + 临时数据库，测量数据增强的行情获取（首次、增量、缓存命中）"""
+    tmpdir = tempfile.mkdtemp(prefix="opinionroom-offline-")
+    # 模块导入时读取配置，必须先设置环境变量
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tmpdir, 'market.db')}"
+    offline_dir = MARKET_OFFLINE_DIR or os.path.join(tmpdir, "market")
+    if not MARKET_OFFLINE_DIR:
+        write_fixtures(offline_dir, BENCHMARK_SYMBOLS)
+    from migrations import run_migrations
+    from data_fetcher import StockDataFetcher
+
+    fetcher = StockDataFetcher(providers=[LocalFileProvider(offline_dir)])
+    symbols = [name[:-4] for name in sorted(os.listdir(offline_dir)) if name.endswith(".csv")]
+    try:
+        await run_migrations()
+        print(f"离线数据: {offline_dir}（{len(symbols)} 个代码）")
+
+        started = time.perf_counter()
+        results = await fetcher.get_stock_trends(symbols, use_cache=False)
+        print(f"首次获取（写入日线）: {(time.perf_counter() - started) * 1000:.1f}ms，{len(results)} 个代码有数据")
+
+        for label, use_cache in (("增量刷新", False), ("缓存命中", True)):
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                await fetcher.get_stock_trends(symbols, use_cache=use_cache)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            print(f"{label}: 中位数 {timings[len(timings) // 2] * 1000:.1f}ms，最慢 {timings[-1] * 1000:.1f}ms（{rounds} 轮）")
+        for stats in fetcher.providers.stats():
+            print(f"数据源 {stats['name']}: 成功 {stats['successes']}，失败 {stats['failures']}，"
+                  f"平均 {stats['latency_avg_ms']}ms，P95 {stats['latency_p95_ms']}ms")
+    finally:
+        await fetcher.aclose()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="行情数据源工具")
+    parser.add_argument("--write-fixtures", metavar="DIR", help="生成离线CSV数据")
+    parser.add_argument("--symbols", default=",".join(BENCHMARK_SYMBOLS), help="生成离线数据的代码（逗号分隔）")
+    parser.add_argument("--benchmark", action="store_true", help="用离线数据源测试行情获取")
+    parser.add_argument("--rounds", type=int, default=20, help="基准测试轮数")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("📈 行情数据源")
+    print("=" * 60)
+    if args.write_fixtures:
+        symbols = [symbol.strip().upper() for symbol in args.symbols.split(",") if symbol.strip()]
+        write_fixtures(args.write_fixtures, symbols)
+        print(f"✅ 已生成 {len(symbols)} 个代码的离线数据: {args.write_fixtures}")
+    elif args.benchmark:
+        asyncio.run(benchmark(args.rounds))
+    else:
+        for provider in build_providers(HttpPool()).providers:
+            print(f"- {provider.name}")
+
+
+if __name__ == "__main__":
+    main()
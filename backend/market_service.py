@@ -0,0 +1,40 @@
+"""
+行情相关接口
+"""
+from fastapi import APIRouter, HTTPException
+from data_fetcher import stock_fetcher
+from data_context import load_snapshot
+from prefetcher import market_prefetcher, watchlist, MARKET_PREFETCH_ENABLED
+
+router = APIRouter(prefix="/api/market", tags=["market"])
+
+
+@router.get("/cache/stats")
+async def market_cache_stats():
+    """进程内行情缓存的命中、刷新统计（多worker时为当前进程的统计）"""
+    return stock_fetcher.cache.stats()
+
+
+@router.get("/providers")
+async def market_providers():
+    """各行情数据源（按优先级）的可用状态、成功/失败次数和延迟（当前进程的统计）"""
+    return stock_fetcher.providers.stats()
+
+
+@router.get("/watchlist")
+async def market_watchlist():
+    """当前关注列表和上一次预取的结果"""
+    return {
+        "enabled": MARKET_PREFETCH_ENABLED,
+        "symbols": await watchlist(),
+        "last_run": market_prefetcher.last_run
+    }
+
+
+@router.get("/snapshots/{snapshot_id}")
+async def market_snapshot(snapshot_id: str):
+    """数据增强使用的行情快照（消息的 data_snapshot_id），包含原始数据和渲染后的数据块"""
+    snapshot = await load_snapshot(snapshot_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return snapshot
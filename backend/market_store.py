@@ -0,0 +1,108 @@
+"""
+日线行情本地存储
+K线按 (代码, 交易日) 保存在 market_bars 表中，多个worker共享，重启后不需要重新下载：
+
+- 第一次获取某个代码时下载最近 MARKET_HISTORY_DAYS 天的日线
+- 之后只请求最后一根已存K线之后的数据（最后一根可能是盘中未收盘的K线，一并刷新）
+- 批量报价只更新已有交易日的收盘价；新的交易日通过完整K线写入，开高低和成交量不会缺失
+- 指标直接由库中的K线计算，数据源不可用时仍可使用已存的数据
+"""
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, insert, update, func, or_
+from database import WriteSessionLocal, ReadSessionLocal, MarketBar
+from market_providers import BAR_FIELDS
+
+load_dotenv()
+
+# 计算指标使用的历史长度（日历日），3月涨跌、SMA50和MACD都需要足够的K线
+MARKET_HISTORY_DAYS = int(os.getenv("MARKET_HISTORY_DAYS", "182"))
+
+
+async def bar_span(symbol: str) -> Optional[Tuple[date, date, int]]:
+    """
+    已存完整K线的 (第一个交易日, 最后一个交易日, 最后一根的时间戳)，没有数据时返回None
+
+    只有收盘价的K线（旧版本由批量报价插入）不计入，之后的增量请求会用完整K线覆盖它们
+    """
+    async with ReadSessionLocal() as session:
+        first_day, last_day, last_timestamp = (await session.execute(
+            select(func.min(MarketBar.day), func.max(MarketBar.day), func.max(MarketBar.timestamp))
+            .where(MarketBar.symbol == symbol)
+            .where(or_(*(getattr(MarketBar, field).isnot(None) for field in BAR_FIELDS if field != "close")))
+        )).one()
+    if first_day is None:
+        return None
+    return first_day, last_day, last_timestamp
+
+
+def fetch_start(span: Optional[Tuple[date, date, int]], history_days: int = MARKET_HISTORY_DAYS) -> int:
+    """需要从数据源请求的起始时间戳：已存数据覆盖了历史长度时只请求最后一根完整K线之后的部分"""
+    now = datetime.utcnow()
+    history_start = now - timedelta(days=history_days)
+    if span is not None and span[0] <= history_start.date() + timedelta(days=7):
+        return span[2]
+    return int((history_start - datetime(1970, 1, 1)).total_seconds())
+
+
+async def save_bars(symbol: str, bars: List[Dict]):
+    """
+    写入K线（每根包含 day、timestamp 和 OHLCV）
+
+    新数据覆盖同一交易日及之后的已存K线：先删除再批量插入，在一个短事务中完成
+    """
+    if not bars:
+        return
+    fetched_at = datetime.utcnow()
+    rows = [{"symbol": symbol, "fetched_at": fetched_at, **bar} for bar in bars]
+    async with WriteSessionLocal() as session:
+        await session.execute(
+            delete(MarketBar)
+            .where(MarketBar.symbol == symbol)
+            .where(MarketBar.day >= min(bar["day"] for bar in bars))
+        )
+        await session.execute(insert(MarketBar.__table__), rows)
+        await session.commit()
+
+
+async def merge_closes(symbol: str, bars: List[Dict]):
+    """
+    用只有收盘价的K线（批量报价接口只返回收盘价）更新已存交易日的收盘价和时间戳，保留开高低和成交量
+
+    库中没有的交易日不插入：由调用方请求完整K线，避免新交易日缺少开高低和成交量
+    """
+    if not bars:
+        return
+    fetched_at = datetime.utcnow()
+    async with WriteSessionLocal() as session:
+        existing = set((await session.execute(
+            select(MarketBar.day)
+            .where(MarketBar.symbol == symbol)
+            .where(MarketBar.day >= min(bar["day"] for bar in bars))
+        )).scalars())
+        updates = [
+            {"symbol": symbol, "day": bar["day"], "timestamp": bar["timestamp"],
+             "close": bar["close"], "fetched_at": fetched_at}
+            for bar in bars if bar["day"] in existing and bar["close"] is not None
+        ]
+        if updates:
+            await session.execute(update(MarketBar), updates)
+            await session.commit()
+
+
+async def load_bars(symbol: str, history_days: int = MARKET_HISTORY_DAYS) -> Dict[str, list]:
+    """最近history_days天的K线，按列返回 {"timestamp": [...], "open": [...], ...}"""
+    since = (datetime.utcnow() - timedelta(days=history_days)).date()
+    columns = [MarketBar.timestamp] + [getattr(MarketBar, field) for field in BAR_FIELDS]
+    async with ReadSessionLocal() as session:
+        result = await session.execute(
+            select(*columns)
+            .where(MarketBar.symbol == symbol)
+            .where(MarketBar.day >= since)
+            .order_by(MarketBar.day)
+        )
+        rows = result.all()
+    names = ("timestamp",) + BAR_FIELDS
+    return {name: [row[index] for row in rows] for index, name in enumerate(names)}
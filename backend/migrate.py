@@ -0,0 +1,39 @@
+"""
+数据库迁移工具
+对 DATABASE_URL 指向的数据库（SQLite或PostgreSQL）执行未应用的迁移，
+替代原来各自独立的 migrate_add_*.py 脚本
+
+用法：
+    python migrate.py            # 执行未应用的迁移
+    python migrate.py --status   # 只查看迁移状态
+"""
+import argparse
+import asyncio
+from database import write_engine, DATABASE_URL, dispose_engines
+from migrations import run_migrations, migration_status
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="数据库迁移工具")
+    parser.add_argument("--status", action="store_true", help="只查看迁移状态，不执行")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"数据库迁移工具 - {write_engine.url.render_as_string(hide_password=True)}")
+    print("=" * 60)
+    try:
+        if not args.status:
+            applied = await run_migrations(write_engine)
+            if applied:
+                print(f"✅ 已应用 {len(applied)} 个迁移")
+            else:
+                print("✅ 数据库已是最新版本，无需迁移")
+        for version, description, is_applied in await migration_status(write_engine):
+            print(f"  {'✅' if is_applied else '⏳'} {version}  {description}")
+    finally:
+        await dispose_engines()
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
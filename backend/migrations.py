@@ -0,0 +1,198 @@
+"""
+版本化数据库迁移
+schema_migrations 表记录已应用的版本，启动时（init_db）和 migrate.py 都会执行未应用的迁移。
+
+每个迁移都必须可重复执行：0001 用 create_all 建出当前完整结构，
+之后的迁移负责把旧数据库补齐到同样的结构，在新库上不做任何改动。
+新增表结构变更时，在文件末尾追加一个新版本号的迁移即可。
+"""
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import MetaData, Table, Column, String, DateTime, inspect, select, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from database import Base, MessageArchive, Lease, MarketCache, MarketBar, DataSnapshot, write_engine as default_engine, ensure_search_index
+
+DEFAULT_MODEL = "Qwen/Qwen2.5-7B-Instruct"
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", String(32), primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# (版本号, 说明, 迁移函数)，迁移函数在同步连接上执行
+MIGRATIONS: List[Tuple[str, str, Callable]] = []
+
+
+def migration(version: str, description: str):
+    """注册迁移"""
+    def decorator(func: Callable) -> Callable:
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+# ===== 工具函数 =====
+
+def column_names(sync_conn, table: str) -> set:
+    return {column["name"] for column in inspect(sync_conn).get_columns(table)}
+
+
+def add_column_if_missing(sync_conn, table: str, column: str, ddl: str) -> bool:
+    """列不存在时添加，返回是否新增"""
+    if column in column_names(sync_conn, table):
+        return False
+    sync_conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+    return True
+
+
+def create_missing_indexes(sync_conn) -> list:
+    """创建模型中声明但数据库中缺失的索引，返回新建的索引名"""
+    created = []
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {item["name"] for item in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(sync_conn)
+                created.append(index.name)
+    return created
+
+
+# ===== 迁移 =====
+
+@migration("0001", "初始表结构")
+def initial_schema(sync_conn):
+    Base.metadata.create_all(sync_conn)
+
+
+@migration("0002", "agents.model 字段")
+def agent_model(sync_conn):
+    if add_column_if_missing(sync_conn, "agents", "model", f"VARCHAR(200) DEFAULT '{DEFAULT_MODEL}'"):
+        sync_conn.exec_driver_sql(f"UPDATE agents SET model = '{DEFAULT_MODEL}' WHERE model IS NULL")
+
+
+@migration("0003", "messages.status 字段（流式断点）")
+def message_status(sync_conn):
+    if add_column_if_missing(sync_conn, "messages", "status", "VARCHAR(20) DEFAULT 'completed'"):
+        sync_conn.exec_driver_sql("UPDATE messages SET status = 'completed' WHERE status IS NULL")
+
+
+@migration("0004", "历史查询复合索引")
+def query_indexes(sync_conn):
+    if create_missing_indexes(sync_conn):
+        # 更新统计信息，让查询规划器选择新索引
+        sync_conn.exec_driver_sql("ANALYZE")
+
+
+@migration("0005", "全文检索索引")
+def search_index(sync_conn):
+    dialect = sync_conn.dialect.name
+    if dialect == "sqlite":
+        ensure_search_index(sync_conn)
+    elif dialect == "postgresql":
+        # pg_trgm的GIN索引支持 ILIKE '%词%' 子串匹配，和SQLite trigram分词的语义一致
+        sync_conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        sync_conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_messages_content_trgm "
+            "ON messages USING GIN (content gin_trgm_ops)"
+        )
+        sync_conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_discussions_topic_trgm "
+            "ON discussions USING GIN (topic gin_trgm_ops)"
+        )
+        sync_conn.exec_driver_sql(
+            "CREATE INDEX IF NOT EXISTS ix_discussions_summary_trgm "
+            "ON discussions USING GIN (summary gin_trgm_ops)"
+        )
+
+
+@migration("0006", "message_archives 冷数据归档表")
+def message_archives(sync_conn):
+    MessageArchive.__table__.create(sync_conn, checkfirst=True)
+
+
+@migration("0007", "messages 发言Agent快照字段")
+def message_agent_snapshot(sync_conn):
+    added = [
+        add_column_if_missing(sync_conn, "messages", column, ddl)
+        for column, ddl in (
+            ("agent_name", "VARCHAR(100)"),
+            ("agent_role", "VARCHAR(200)"),
+            ("model", "VARCHAR(200)"),
+        )
+    ]
+    if any(added):
+        # 旧消息没有记录发言时的配置，用Agent当前的名称、角色和模型回填；已删除的Agent无法回填
+        sync_conn.exec_driver_sql(
+            "UPDATE messages SET "
+            "agent_name = (SELECT name FROM agents WHERE agents.id = messages.agent_id), "
+            "agent_role = (SELECT role FROM agents WHERE agents.id = messages.agent_id), "
+            "model = (SELECT model FROM agents WHERE agents.id = messages.agent_id) "
+            "WHERE agent_id IS NOT NULL AND agent_name IS NULL"
+        )
+
+
+@migration("0008", "leases、market_cache 多进程共享状态表")
+def shared_state(sync_conn):
+    Lease.__table__.create(sync_conn, checkfirst=True)
+    MarketCache.__table__.create(sync_conn, checkfirst=True)
+
+
+@migration("0009", "market_bars 日线行情存储")
+def market_bars(sync_conn):
+    MarketBar.__table__.create(sync_conn, checkfirst=True)
+
+
+
+@migration("0010", "data_snapshots 行情快照表、messages.data_snapshot_id 字段")
+def data_snapshots(sync_conn):
+    DataSnapshot.__table__.create(sync_conn, checkfirst=True)
+    add_column_if_missing(sync_conn, "messages", "data_snapshot_id", "VARCHAR(32)")
+
+
+# ===== 执行 =====
+
+def applied_versions(sync_conn) -> set:
+    schema_migrations.create(sync_conn, checkfirst=True)
+    return set(sync_conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+async def migration_status(target_engine: AsyncEngine = default_engine) -> List[Tuple[str, str, bool]]:
+    """返回 (版本号, 说明, 是否已应用) 列表"""
+    async with target_engine.begin() as conn:
+        applied = await conn.run_sync(applied_versions)
+    return [(version, description, version in applied) for version, description, _ in MIGRATIONS]
+
+
+async def run_migrations(target_engine: AsyncEngine = default_engine) -> List[str]:
+    """
+    按版本顺序执行未应用的迁移，返回本次应用的版本号
+
+    每个迁移和它的版本记录在同一个事务中提交。多个worker同时启动时，
+    先插入版本记录抢占该版本：SQLite上拿到写锁，PostgreSQL上主键冲突会等待对方提交，
+    抢占失败（IntegrityError）说明其他进程已经应用过，直接跳过
+    """
+    async with target_engine.begin() as conn:
+        applied = await conn.run_sync(applied_versions)
+
+    newly_applied = []
+    for version, description, func in sorted(MIGRATIONS, key=lambda item: item[0]):
+        if version in applied:
+            continue
+        async with target_engine.connect() as conn:
+            try:
+                await conn.execute(insert(schema_migrations).values(
+                    version=version, description=description, applied_at=datetime.utcnow()
+                ))
+            except IntegrityError:
+                await conn.rollback()
+                continue
+            # 迁移失败时退出上下文会回滚，版本记录一起撤销
+            await conn.run_sync(func)
+            await conn.commit()
+        newly_applied.append(version)
+    return newly_applied
@@ -64,18 +64,36 @@ class MessageResponse(BaseModel):
     discussion_id: int
     agent_id: Optional[int] = None
     agent_name: Optional[str] = None
+    agent_role: Optional[str] = None
+    model: Optional[str] = None
     content: str
     message_type: str
+    status: str = "completed"  # streaming, completed, interrupted
+    data_snapshot_id: Optional[str] = None  # 数据增强使用的行情快照
     created_at: datetime
 
     class Config:
         from_attributes = True
 
 
+# 讨论列表分页
+class DiscussionPage(BaseModel):
+    items: List[DiscussionResponse]
+    next_cursor: Optional[str] = None  # 为空表示没有更多
+
+
 # 讨论详情（包含消息）
 class DiscussionDetail(BaseModel):
     discussion: DiscussionResponse
     messages: List[MessageResponse]
+    next_cursor: Optional[str] = None  # 更早消息的游标，为空表示已到最早
+    sync_cursor: int = 0  # 增量同步起点，传给 since_message_id
+
+
+# 增量消息
+class MessageDelta(BaseModel):
+    messages: List[MessageResponse]
+    sync_cursor: int  # 下一次增量同步的起点
 
 
 # AI响应流式数据
@@ -83,3 +101,22 @@ class StreamChunk(BaseModel):
     content: str
     done: bool = False
 
+
+
+# 全文检索结果
+class SearchHit(BaseModel):
+    discussion_id: int
+    topic: str  # 已转义HTML，命中部分用<mark>包裹
+    message_id: Optional[int] = None  # scope=discussions时为空
+    agent_name: Optional[str] = None
+    message_type: Optional[str] = None
+    snippet: Optional[str] = None  # 已转义HTML的命中片段
+    score: float  # bm25相关度，越大越相关
+    created_at: datetime
+
+
+class SearchResults(BaseModel):
+    query: str
+    scope: str
+    items: List[SearchHit]
+    next_offset: Optional[int] = None  # 为空表示没有更多
@@ -0,0 +1,108 @@
+"""
+行情预取
+在应用生命周期中定期刷新关注列表中的代码，数据增强请求直接命中进程内缓存：
+
+- 关注列表 = MARKET_WATCHLIST 配置的代码 + 最近 MARKET_WATCHLIST_RECENT_DAYS 天讨论话题中出现的代码
+- 每 MARKET_PREFETCH_INTERVAL_SECONDS 秒运行一次，只刷新在下一次运行前会过期的代码
+- 请求按 MARKET_PREFETCH_RATE（每秒请求数）间隔发出，不占满数据源的限额
+
+每个worker都运行预取以预热自己的进程内缓存；数据经共享缓存和抓取租约协调，
+同一代码在一个周期内只有一个进程访问外部接口
+"""
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+from dotenv import load_dotenv
+from sqlalchemy import select
+from database import ReadSessionLocal, Discussion
+from data_fetcher import stock_fetcher
+
+load_dotenv()
+
+MARKET_PREFETCH_ENABLED = os.getenv("MARKET_PREFETCH_ENABLED", "false").lower() == "true"
+# 固定关注的代码（逗号分隔）
+MARKET_WATCHLIST = [
+    symbol.strip().upper() for symbol in os.getenv("MARKET_WATCHLIST", "").split(",") if symbol.strip()
+]
+# 从最近多少天的讨论话题中自动加入代码，0表示不自动加入
+MARKET_WATCHLIST_RECENT_DAYS = int(os.getenv("MARKET_WATCHLIST_RECENT_DAYS", "7"))
+# 关注列表最多包含的代码数（固定代码优先）
+MARKET_WATCHLIST_MAX = int(os.getenv("MARKET_WATCHLIST_MAX", "30"))
+# 运行间隔（秒），建议为行情缓存有效期的一半
+MARKET_PREFETCH_INTERVAL_SECONDS = float(os.getenv("MARKET_PREFETCH_INTERVAL_SECONDS", "150"))
+# 预取请求的发送速率（每秒）
+MARKET_PREFETCH_RATE = float(os.getenv("MARKET_PREFETCH_RATE", "2"))
+
+# 扫描的最近讨论数上限
+RECENT_TOPICS_LIMIT = 200
+
+
+async def recent_topic_symbols(days: int = MARKET_WATCHLIST_RECENT_DAYS) -> List[str]:
+    """最近讨论话题中出现的代码，按最近讨论的顺序"""
+    if days <= 0:
+        return []
+    since = datetime.utcnow() - timedelta(days=days)
+    async with ReadSessionLocal() as session:
+        result = await session.execute(
+            select(Discussion.topic)
+            .where(Discussion.created_at >= since)
+            .order_by(Discussion.created_at.desc())
+            .limit(RECENT_TOPICS_LIMIT)
+        )
+        topics = result.scalars().all()
+    symbols = []
+    for topic in topics:
+        symbols += stock_fetcher.extract_stock_symbols(topic)
+    return list(dict.fromkeys(symbols))
+
+
+async def watchlist() -> List[str]:
+    """当前关注列表：固定代码在前，然后是最近讨论中的代码"""
+    symbols = list(dict.fromkeys(MARKET_WATCHLIST + await recent_topic_symbols()))
+    return symbols[:MARKET_WATCHLIST_MAX]
+
+
+class MarketPrefetcher:
+    """定期预取关注列表"""
+
+    def __init__(self):
+        self.last_run: Dict = {}
+
+    async def run_once(self) -> Dict:
+        """刷新一轮，返回统计"""
+        started = time.monotonic()
+        symbols = await watchlist()
+        # 下一次运行前会过期的才刷新；其他进程本周期已刷新的代码直接从共享缓存载入
+        horizon = MARKET_PREFETCH_INTERVAL_SECONDS
+        tasks = []
+        for symbol in symbols:
+            tasks.append(asyncio.create_task(stock_fetcher.refresh_ahead(symbol, horizon)))
+            await asyncio.sleep(1.0 / MARKET_PREFETCH_RATE if MARKET_PREFETCH_RATE > 0 else 0)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        failed = [symbol for symbol, ok in zip(symbols, results) if ok is not True]
+        self.last_run = {
+            "finished_at": datetime.utcnow().isoformat(),
+            "symbols": symbols,
+            "failed": failed,
+            "seconds": round(time.monotonic() - started, 2)
+        }
+        return self.last_run
+
+    async def loop(self):
+        """后台预取任务（在应用生命周期中运行）"""
+        while True:
+            try:
+                report = await self.run_once()
+                if report["failed"]:
+                    print(f"⚠️  行情预取失败: {', '.join(report['failed'])}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  行情预取任务失败: {e}")
+            await asyncio.sleep(MARKET_PREFETCH_INTERVAL_SECONDS)
+
+
+# 全局实例
+market_prefetcher = MarketPrefetcher()
@@ -0,0 +1,127 @@
+"""
+热点查询
+讨论和Agent接口反复使用的查询集中在这里，
+query_plan_audit.py 对同一批语句做执行计划检查，保证都能走索引
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import select, tuple_
+from database import Discussion, Message, Agent, MessageArchive
+from checkpoint import STATUS_STREAMING
+
+
+# ===== 游标（keyset分页）=====
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """把 (created_at, id) 编码为不透明游标"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游标，格式错误时抛出ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def discussion_by_id(discussion_id: int):
+    """按主键获取讨论"""
+    return select(Discussion).where(Discussion.id == discussion_id)
+
+
+def discussions_newest_first():
+    """讨论列表（最新的在前）"""
+    return select(Discussion).order_by(Discussion.created_at.desc(), Discussion.id.desc())
+
+
+def discussions_page(limit: int, cursor: Optional[Tuple[datetime, int]] = None):
+    """讨论列表的一页（多取一条用于判断是否还有下一页）"""
+    query = discussions_newest_first()
+    if cursor is not None:
+        query = query.where(tuple_(Discussion.created_at, Discussion.id) < tuple_(*cursor))
+    return query.limit(limit + 1)
+
+
+def agents_in_order():
+    """Agent列表（按创建顺序）"""
+    return select(Agent).order_by(Agent.created_at)
+
+
+def message_history(
+    discussion_id: int,
+    message_type: Optional[str] = None,
+    include_streaming: bool = False
+):
+    """
+    讨论的消息历史
+
+    Args:
+        message_type: 只取某一类消息（user/agent/summary）
+        include_streaming: 是否包含正在生成的消息；构建Agent上下文时不包含
+    """
+    return _message_rows(discussion_id, message_type, include_streaming).order_by(
+        Message.created_at, Message.id
+    )
+
+
+def recent_message_history(
+    discussion_id: int,
+    limit: int,
+    message_type: Optional[str] = None,
+    include_streaming: bool = False,
+    cursor: Optional[Tuple[datetime, int]] = None
+):
+    """
+    最近的limit条消息（最新的在前，调用方自行反转）
+
+    用于上下文滑动窗口和历史消息分页，cursor为上一页最早一条消息的 (created_at, id)
+    """
+    query = _message_rows(discussion_id, message_type, include_streaming)
+    if cursor is not None:
+        query = query.where(tuple_(Message.created_at, Message.id) < tuple_(*cursor))
+    return query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit)
+
+
+def messages_since(discussion_id: int, since_message_id: int, limit: int):
+    """增量同步：ID大于since_message_id的消息"""
+    return message_history(discussion_id, include_streaming=True).where(
+        Message.id > since_message_id
+    ).limit(limit)
+
+
+def archive_by_discussion(discussion_id: int):
+    """讨论的归档记录"""
+    return select(MessageArchive).where(MessageArchive.discussion_id == discussion_id)
+
+
+def _message_rows(discussion_id: int, message_type: Optional[str], include_streaming: bool):
+    # 发言Agent名称在写入时已保存到messages表，历史查询是单表的索引范围扫描
+    query = select(Message).where(Message.discussion_id == discussion_id)
+    if message_type is not None:
+        query = query.where(Message.message_type == message_type)
+    if not include_streaming:
+        query = query.where(Message.status != STATUS_STREAMING)
+    return query
+
+
+# 执行计划审计用的查询样本：名称 -> 语句
+HOT_QUERIES = {
+    "discussion_by_id": discussion_by_id(1),
+    "discussions_page_first": discussions_page(30),
+    "discussions_page_next": discussions_page(30, (datetime(2024, 1, 1), 100)),
+    "agents_in_order": agents_in_order(),
+    "message_history": message_history(1),
+    "message_history_with_streaming": message_history(1, include_streaming=True),
+    "message_history_agent_only": message_history(1, message_type="agent"),
+    "recent_message_history": recent_message_history(1, 15),
+    "recent_message_history_page": recent_message_history(
+        1, 50, include_streaming=True, cursor=(datetime(2024, 1, 1), 100)
+    ),
+    "messages_since": messages_since(1, 100, 200),
+    "archive_by_discussion": archive_by_discussion(1),
+}
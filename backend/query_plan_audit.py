@@ -0,0 +1,91 @@
+"""
+查询执行计划审计
+
+对 queries.HOT_QUERIES 中的热点查询逐条运行 EXPLAIN QUERY PLAN，
+出现全表扫描（SCAN 表 且未使用索引）或临时排序（USE TEMP B-TREE）时视为失败，
+退出码为1，可直接放进CI
+
+用法：
+    python query_plan_audit.py              # 基于模型在内存库中建表后审计
+    python query_plan_audit.py --database ./opinionroom.db   # 审计现有数据库（检查迁移是否已执行）
+"""
+import argparse
+import re
+import sqlite3
+import sys
+from typing import Dict, List, Tuple
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import sqlite
+from database import Base
+from queries import HOT_QUERIES
+
+# SCAN messages（后面没有 USING ... INDEX）即全表扫描
+FULL_SCAN_PATTERN = re.compile(r"^SCAN \w+(?!\w| USING (?:COVERING )?INDEX| USING INTEGER PRIMARY KEY)")
+TEMP_SORT_PATTERN = re.compile(r"USE TEMP B-TREE")
+
+
+def compile_query(statement) -> str:
+    """把SQLAlchemy语句编译成带字面量参数的SQLite SQL"""
+    return str(statement.compile(
+        dialect=sqlite.dialect(),
+        compile_kwargs={"literal_binds": True}
+    ))
+
+
+def explain(connection: sqlite3.Connection, sql: str) -> List[str]:
+    rows = connection.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return [row[-1] for row in rows]
+
+
+def audit(connection: sqlite3.Connection) -> Dict[str, Tuple[List[str], List[str]]]:
+    """返回 {查询名: (执行计划, 问题列表)}"""
+    report = {}
+    for name, statement in HOT_QUERIES.items():
+        plan = explain(connection, compile_query(statement))
+        problems = []
+        for detail in plan:
+            if FULL_SCAN_PATTERN.search(detail):
+                problems.append(f"全表扫描: {detail}")
+            elif TEMP_SORT_PATTERN.search(detail):
+                problems.append(f"临时排序: {detail}")
+        report[name] = (plan, problems)
+    return report
+
+
+def open_schema_database() -> sqlite3.Connection:
+    """按当前模型在内存库中建表"""
+    connection = sqlite3.connect(":memory:")
+    engine = create_engine("sqlite://", creator=lambda: connection)
+    Base.metadata.create_all(engine)
+    return connection
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="热点查询执行计划审计")
+    parser.add_argument("--database", help="审计指定的SQLite数据库文件（默认使用模型建表的内存库）")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.database) if args.database else open_schema_database()
+    report = audit(connection)
+    connection.close()
+
+    failed = 0
+    for name, (plan, problems) in report.items():
+        mark = "❌" if problems else "✅"
+        print(f"{mark} {name}")
+        for detail in plan:
+            print(f"     {detail}")
+        for problem in problems:
+            print(f"     -> {problem}")
+        failed += bool(problems)
+
+    print("=" * 60)
+    if failed:
+        print(f"❌ {failed}/{len(report)} 条热点查询未使用索引")
+        return 1
+    print(f"✅ {len(report)} 条热点查询全部使用索引")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
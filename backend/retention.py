@@ -0,0 +1,266 @@
+"""
+数据保留策略
+按配置定期删除过期的讨论：
+- 最后一次活动（最后一条消息，包括已归档的消息）早于 RETENTION_MAX_AGE_DAYS 天的讨论
+- 讨论总数超过 RETENTION_MAX_DISCUSSIONS 时，最早的讨论
+
+只删除状态在 RETENTION_STATUSES 中的讨论，正在生成的讨论不会被删除。
+
+删除使用集合SQL分批执行：每批最多 RETENTION_BATCH_SIZE 个讨论，
+消息按 RETENTION_MESSAGE_BATCH 行一个短事务删除，批次之间让出写锁，不阻塞正常请求。
+
+用法：
+    python retention.py              # 按配置执行一轮
+    python retention.py --dry-run    # 只统计将被删除的讨论
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+from dotenv import load_dotenv
+from sqlalchemy import select, delete, exists, tuple_, func
+from database import WriteSessionLocal, ReadSessionLocal, dispose_engines, Discussion, Message, MessageArchive
+from leases import (
+    running_discussions, hold_lease, acquire_lease, release_lease, new_token, run_lock_name,
+    LeaseBusy, RUN_LOCK_TTL_SECONDS
+)
+
+load_dotenv()
+
+# 是否在应用内运行后台清理任务（默认关闭，删除数据需要显式开启）
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+# 最后一次活动超过多少天的讨论被删除，0表示不按时间清理
+RETENTION_MAX_AGE_DAYS = int(os.getenv("RETENTION_MAX_AGE_DAYS", "0"))
+# 最多保留的讨论数（保留最新的），0表示不限制
+RETENTION_MAX_DISCUSSIONS = int(os.getenv("RETENTION_MAX_DISCUSSIONS", "0"))
+# 可被删除的讨论状态（逗号分隔），留空表示所有状态
+RETENTION_STATUSES = [
+    status.strip() for status in os.getenv("RETENTION_STATUSES", "completed").split(",") if status.strip()
+]
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "100"))
+RETENTION_MESSAGE_BATCH = int(os.getenv("RETENTION_MESSAGE_BATCH", "2000"))
+# 批次之间的停顿（秒），让出写连接
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.1"))
+
+# 多worker时只有一个进程执行清理
+RETENTION_LEASE = "job:retention"
+
+
+# ===== 删除 =====
+
+async def purge_discussions(discussion_ids: List[int], message_batch: int = RETENTION_MESSAGE_BATCH) -> int:
+    """
+    删除讨论及其消息和归档，返回删除的消息数
+
+    消息分批删除（每批一个短事务），最后在一个事务中删除剩余消息、归档和讨论本身
+    """
+    if not discussion_ids:
+        return 0
+    deleted = 0
+    while True:
+        async with WriteSessionLocal() as session:
+            batch = (
+                select(Message.id)
+                .where(Message.discussion_id.in_(discussion_ids))
+                .limit(message_batch)
+                .scalar_subquery()
+            )
+            result = await session.execute(
+                delete(Message).where(Message.id.in_(batch)).execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        deleted += result.rowcount or 0
+        if (result.rowcount or 0) < message_batch:
+            break
+        await asyncio.sleep(0)
+
+    async with WriteSessionLocal() as session:
+        # 分批删除期间可能有新写入的消息
+        result = await session.execute(
+            delete(Message).where(Message.discussion_id.in_(discussion_ids))
+            .execution_options(synchronize_session=False)
+        )
+        deleted += result.rowcount or 0
+        await session.execute(
+            delete(MessageArchive).where(MessageArchive.discussion_id.in_(discussion_ids))
+            .execution_options(synchronize_session=False)
+        )
+        await session.execute(
+            delete(Discussion).where(Discussion.id.in_(discussion_ids))
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    return deleted
+
+
+# ===== 候选讨论 =====
+
+def _eligible(query, statuses: List[str]):
+    if statuses:
+        query = query.where(Discussion.status.in_(statuses))
+    return query
+
+
+async def expired_discussions(max_age_days: int, statuses: List[str], limit: int) -> List[int]:
+    """
+    最后一次活动早于期限的讨论（讨论本身和所有消息都早于期限）
+
+    已归档的消息不在messages表中，按归档记录的最后一条消息时间判断
+    """
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    recent_message = exists().where(Message.discussion_id == Discussion.id).where(Message.created_at >= cutoff)
+    recent_archive = (
+        exists().where(MessageArchive.discussion_id == Discussion.id)
+        .where(MessageArchive.last_message_at >= cutoff)
+    )
+    query = _eligible(
+        select(Discussion.id).where(Discussion.created_at < cutoff).where(~recent_message).where(~recent_archive),
+        statuses
+    )
+    async with ReadSessionLocal() as session:
+        result = await session.execute(query.order_by(Discussion.created_at, Discussion.id).limit(limit))
+        return list(result.scalars())
+
+
+async def overflow_discussions(max_discussions: int, statuses: List[str], limit: int) -> List[int]:
+    """超出保留数量的最早的讨论"""
+    async with ReadSessionLocal() as session:
+        # 第max_discussions新的讨论，比它更早的都超出了保留数量
+        boundary = (await session.execute(
+            select(Discussion.created_at, Discussion.id)
+            .order_by(Discussion.created_at.desc(), Discussion.id.desc())
+            .offset(max_discussions - 1)
+            .limit(1)
+        )).first()
+        if boundary is None:
+            return []
+        query = _eligible(
+            select(Discussion.id).where(tuple_(Discussion.created_at, Discussion.id) < tuple_(*boundary)),
+            statuses
+        )
+        result = await session.execute(query.order_by(Discussion.created_at, Discussion.id).limit(limit))
+        return list(result.scalars())
+
+
+async def find_candidates(
+    max_age_days: int = RETENTION_MAX_AGE_DAYS,
+    max_discussions: int = RETENTION_MAX_DISCUSSIONS,
+    statuses: Optional[List[str]] = None,
+    limit: int = RETENTION_BATCH_SIZE
+) -> List[int]:
+    """下一批待删除的讨论ID（跳过正在生成的讨论）"""
+    statuses = RETENTION_STATUSES if statuses is None else statuses
+    candidates = []
+    if max_age_days > 0:
+        candidates += await expired_discussions(max_age_days, statuses, limit)
+    if max_discussions > 0 and len(candidates) < limit:
+        candidates += await overflow_discussions(max_discussions, statuses, limit)
+    running = await running_discussions()
+    return [discussion_id for discussion_id in dict.fromkeys(candidates) if discussion_id not in running][:limit]
+
+
+# ===== 执行 =====
+
+async def enforce_retention(
+    max_age_days: int = RETENTION_MAX_AGE_DAYS,
+    max_discussions: int = RETENTION_MAX_DISCUSSIONS,
+    statuses: Optional[List[str]] = None,
+    batch_size: int = RETENTION_BATCH_SIZE
+) -> dict:
+    """按策略分批删除，直到没有待删除的讨论，返回统计"""
+    report = {"discussions": 0, "messages": 0, "batches": 0}
+    while True:
+        candidates = await find_candidates(max_age_days, max_discussions, statuses, batch_size)
+        if not candidates:
+            break
+        # 删除期间持有各讨论的运行锁，避免和新开始的生成冲突（拿不到锁的讨论留到下一轮）
+        owner = new_token()
+        locked = [
+            discussion_id for discussion_id in candidates
+            if await acquire_lease(run_lock_name(discussion_id), owner, RUN_LOCK_TTL_SECONDS)
+        ]
+        try:
+            report["messages"] += await purge_discussions(locked)
+        finally:
+            for discussion_id in locked:
+                await release_lease(run_lock_name(discussion_id), owner)
+        report["discussions"] += len(locked)
+        report["batches"] += 1
+        if len(candidates) < batch_size:
+            break
+        await asyncio.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+    return report
+
+
+async def count_candidates(
+    max_age_days: int = RETENTION_MAX_AGE_DAYS,
+    max_discussions: int = RETENTION_MAX_DISCUSSIONS,
+    statuses: Optional[List[str]] = None
+) -> int:
+    """将被删除的讨论数（dry run）"""
+    candidates = await find_candidates(max_age_days, max_discussions, statuses, limit=10 ** 9)
+    return len(candidates)
+
+
+def policy_description(max_age_days: int, max_discussions: int, statuses: List[str]) -> str:
+    rules = []
+    if max_age_days > 0:
+        rules.append(f"超过 {max_age_days} 天无活动")
+    if max_discussions > 0:
+        rules.append(f"超出最新 {max_discussions} 个")
+    scope = "、".join(statuses) if statuses else "所有状态"
+    return f"{' 或 '.join(rules) or '未配置清理规则'}（{scope}）"
+
+
+async def retention_loop():
+    """后台清理任务（在应用生命周期中运行），多worker时由持有租约的进程执行"""
+    while True:
+        try:
+            async with hold_lease(RETENTION_LEASE):
+                report = await enforce_retention()
+            if report["discussions"]:
+                print(f"🧹 数据保留：删除 {report['discussions']} 个讨论 / {report['messages']} 条消息")
+        except LeaseBusy:
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️  数据保留任务失败: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL_HOURS * 3600)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="按保留策略删除过期讨论")
+    parser.add_argument("--days", type=int, default=RETENTION_MAX_AGE_DAYS, help="最后一次活动超过多少天（0不限）")
+    parser.add_argument("--max-discussions", type=int, default=RETENTION_MAX_DISCUSSIONS, help="最多保留的讨论数（0不限）")
+    parser.add_argument("--statuses", default=",".join(RETENTION_STATUSES), help="可删除的状态，逗号分隔，留空表示所有状态")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不删除")
+    args = parser.parse_args()
+    statuses = [status.strip() for status in args.statuses.split(",") if status.strip()]
+
+    print("=" * 60)
+    print(f"数据保留 - {policy_description(args.days, args.max_discussions, statuses)}")
+    print("=" * 60)
+    try:
+        if args.days <= 0 and args.max_discussions <= 0:
+            print("⚠️  未配置清理规则，设置 --days 或 --max-discussions")
+        elif args.dry_run:
+            count = await count_candidates(args.days, args.max_discussions, statuses)
+            print(f"将删除 {count} 个讨论")
+        else:
+            async with ReadSessionLocal() as session:
+                before = await session.scalar(select(func.count()).select_from(Discussion))
+            report = await enforce_retention(args.days, args.max_discussions, statuses)
+            print(
+                f"✅ 删除 {report['discussions']} 个讨论 / {report['messages']} 条消息"
+                f"（{report['batches']} 批），剩余 {before - report['discussions']} 个讨论"
+            )
+    finally:
+        await dispose_engines()
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
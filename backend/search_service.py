@@ -0,0 +1,324 @@
+"""
+讨论历史全文检索
+SQLite：FTS5（trigram分词）索引messages.content和discussions.topic/summary，按bm25相关度排序；
+PostgreSQL：pg_trgm的GIN索引做子串匹配，按命中次数（按长度归一）排序。
+两者都返回带高亮的摘要片段
+"""
+import html
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import text, bindparam, select, func, cast, or_, DateTime, Float
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_read_db, is_sqlite, is_postgres, DATABASE_URL, Discussion, Message
+from checkpoint import STATUS_STREAMING
+from models import SearchHit, SearchResults
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+# trigram分词下少于3个字符的词无法命中索引
+MIN_TERM_LENGTH = 3
+MAX_TERMS = 8
+# 摘要片段长度（trigram下约等于字符数）
+SNIPPET_TOKENS = 48
+SNIPPET_CHARS = 48
+
+# FTS5输出的高亮标记，转义正文后再替换为<mark>，避免消息内容中的HTML被渲染
+_MARK_OPEN = "\x02"
+_MARK_CLOSE = "\x03"
+
+
+MESSAGE_SEARCH_SQL = f"""
+WITH hits AS (
+    SELECT messages_fts.rowid AS id, messages_fts.rank AS rank
+    FROM messages_fts {{filter_join}}
+    WHERE messages_fts MATCH :query {{filters}}
+    ORDER BY messages_fts.rank
+    LIMIT :limit OFFSET :offset
+)
+SELECT m.id, m.discussion_id, m.message_type, m.created_at, d.topic, m.agent_name,
+       snippet(messages_fts, 0, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', {SNIPPET_TOKENS}),
+       hits.rank
+FROM hits
+JOIN messages_fts ON messages_fts.rowid = hits.id AND messages_fts MATCH :query
+JOIN messages m ON m.id = hits.id
+JOIN discussions d ON d.id = m.discussion_id
+ORDER BY hits.rank
+"""
+
+DISCUSSION_SEARCH_SQL = f"""
+WITH hits AS (
+    SELECT discussions_fts.rowid AS id, discussions_fts.rank AS rank
+    FROM discussions_fts {{filter_join}}
+    WHERE discussions_fts MATCH :query {{filters}}
+    ORDER BY discussions_fts.rank
+    LIMIT :limit OFFSET :offset
+)
+SELECT d.id, d.created_at,
+       highlight(discussions_fts, 0, '{_MARK_OPEN}', '{_MARK_CLOSE}'),
+       snippet(discussions_fts, 1, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', {SNIPPET_TOKENS}),
+       hits.rank
+FROM hits
+JOIN discussions_fts ON discussions_fts.rowid = hits.id AND discussions_fts MATCH :query
+JOIN discussions d ON d.id = hits.id
+ORDER BY hits.rank
+"""
+
+
+def split_terms(q: str) -> Tuple[List[str], List[str]]:
+    """
+    按空白拆词，返回 (可走索引的词, 短词)
+
+    trigram索引无法检索少于3个字符的词（如"估值"），这类词只在索引命中的结果上做子串过滤，
+    因此查询中至少要有一个不少于3个字符的词
+    """
+    terms = q.split()
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    if len(terms) > MAX_TERMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_TERMS} search terms are allowed")
+    indexed_terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    short_terms = [term for term in terms if len(term) < MIN_TERM_LENGTH]
+    if not indexed_terms:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At least one search term must be {MIN_TERM_LENGTH} or more characters"
+        )
+    return indexed_terms, short_terms
+
+
+def build_match_query(terms: List[str]) -> str:
+    """
+    FTS5查询：每个词作为短语精确匹配，多个词之间为AND
+
+    用户输入不直接作为FTS5语法，避免引号、括号、NEAR等导致语法错误
+    """
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def like_pattern(term: str) -> str:
+    """子串匹配的LIKE模式（转义通配符）"""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def render_highlight(fragment: Optional[str]) -> Optional[str]:
+    """转义片段中的HTML，并把高亮标记替换为<mark>"""
+    if fragment is None:
+        return None
+    return (
+        html.escape(fragment)
+        .replace(_MARK_OPEN, "<mark>")
+        .replace(_MARK_CLOSE, "</mark>")
+    )
+
+
+def mark_terms(fragment: str, terms: List[str]) -> str:
+    """用高亮标记包裹命中词（不区分大小写，长词优先）"""
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.I)
+    return pattern.sub(lambda m: f"{_MARK_OPEN}{m.group(0)}{_MARK_CLOSE}", fragment)
+
+
+def make_snippet(content: Optional[str], terms: List[str], width: int = SNIPPET_CHARS) -> Optional[str]:
+    """在正文中截取第一个命中位置附近的片段并标记命中词（PostgreSQL下代替FTS5的snippet）"""
+    if not content:
+        return None
+    lowered = content.lower()
+    positions = [pos for pos in (lowered.find(term.lower()) for term in terms) if pos >= 0]
+    if not positions:
+        return None
+    start = max(0, min(positions) - width // 3)
+    end = min(len(content), start + width)
+    fragment = mark_terms(content[start:end], terms)
+    return ("…" if start > 0 else "") + fragment + ("…" if end < len(content) else "")
+
+
+async def search_sqlite(
+    db: AsyncSession, scope: str, indexed_terms: List[str], short_terms: List[str],
+    discussion_id: Optional[int], since: Optional[datetime], until: Optional[datetime],
+    limit: int, offset: int
+) -> List[SearchHit]:
+    """FTS5检索，只为返回的这一页生成snippet"""
+    table = "m" if scope == "messages" else "d"
+    filters = []
+    params = {"query": build_match_query(indexed_terms), "limit": limit, "offset": offset}
+    for index, term in enumerate(short_terms):
+        if scope == "messages":
+            filters.append(f"AND m.content LIKE :term{index} ESCAPE '\\'")
+        else:
+            filters.append(
+                f"AND (d.topic LIKE :term{index} ESCAPE '\\' OR d.summary LIKE :term{index} ESCAPE '\\')"
+            )
+        params[f"term{index}"] = like_pattern(term)
+    if discussion_id is not None:
+        filters.append(f"AND {table}.{'discussion_id' if table == 'm' else 'id'} = :discussion_id")
+        params["discussion_id"] = discussion_id
+    if since is not None:
+        filters.append(f"AND {table}.created_at >= :since")
+        params["since"] = since
+    if until is not None:
+        filters.append(f"AND {table}.created_at < :until")
+        params["until"] = until
+
+    sql = MESSAGE_SEARCH_SQL if scope == "messages" else DISCUSSION_SEARCH_SQL
+    # 没有过滤条件时排序只需要读FTS索引，不回表
+    filter_join = ""
+    if filters:
+        filter_join = (
+            "JOIN messages m ON m.id = messages_fts.rowid" if scope == "messages"
+            else "JOIN discussions d ON d.id = discussions_fts.rowid"
+        )
+    statement = text(sql.format(filters=" ".join(filters), filter_join=filter_join)).bindparams(
+        *[bindparam(name, type_=DateTime) for name in ("since", "until") if name in params]
+    )
+    result = await db.execute(statement, params)
+
+    hits = []
+    for row in result.all():
+        if scope == "messages":
+            message_id, hit_discussion_id, message_type, created_at, topic, agent_name, snippet, rank = row
+            hits.append(SearchHit(
+                discussion_id=hit_discussion_id,
+                topic=html.escape(topic),
+                message_id=message_id,
+                agent_name=agent_name,
+                message_type=message_type,
+                snippet=render_highlight(snippet),
+                score=-rank,
+                created_at=created_at
+            ))
+        else:
+            hit_discussion_id, created_at, topic, snippet, rank = row
+            hits.append(SearchHit(
+                discussion_id=hit_discussion_id,
+                topic=render_highlight(topic),
+                snippet=render_highlight(snippet),
+                score=-rank,
+                created_at=created_at
+            ))
+    return hits
+
+
+def occurrence_score(column, terms: List[str]):
+    """相关度：各检索词出现次数之和，按正文长度的对数归一"""
+    occurrences = sum(
+        cast(func.length(column) - func.length(func.replace(func.lower(column), term.lower(), "")), Float)
+        / len(term)
+        for term in terms
+    )
+    return occurrences / (1 + func.ln(1 + func.length(column)))
+
+
+async def search_postgres(
+    db: AsyncSession, scope: str, indexed_terms: List[str], short_terms: List[str],
+    discussion_id: Optional[int], since: Optional[datetime], until: Optional[datetime],
+    limit: int, offset: int
+) -> List[SearchHit]:
+    """pg_trgm子串检索：先在索引上筛出并排好这一页的ID，再取正文生成snippet"""
+    terms = indexed_terms + short_terms
+    if scope == "messages":
+        model, text_column = Message, Message.content
+        conditions = [Message.status != STATUS_STREAMING]
+        conditions += [Message.content.ilike(like_pattern(term), escape="\\") for term in terms]
+        if discussion_id is not None:
+            conditions.append(Message.discussion_id == discussion_id)
+    else:
+        model, text_column = Discussion, Discussion.topic + " " + func.coalesce(Discussion.summary, "")
+        conditions = [
+            or_(
+                Discussion.topic.ilike(like_pattern(term), escape="\\"),
+                Discussion.summary.ilike(like_pattern(term), escape="\\")
+            )
+            for term in terms
+        ]
+        if discussion_id is not None:
+            conditions.append(Discussion.id == discussion_id)
+    if since is not None:
+        conditions.append(model.created_at >= since)
+    if until is not None:
+        conditions.append(model.created_at < until)
+
+    score = occurrence_score(text_column, terms).label("score")
+    hits_query = (
+        select(model.id, score)
+        .where(*conditions)
+        .order_by(score.desc(), model.id.desc())
+        .limit(limit)
+        .offset(offset)
+        .subquery()
+    )
+
+    hits = []
+    if scope == "messages":
+        result = await db.execute(
+            select(Message, Discussion.topic, hits_query.c.score)
+            .join(hits_query, hits_query.c.id == Message.id)
+            .join(Discussion, Discussion.id == Message.discussion_id)
+            .order_by(hits_query.c.score.desc(), Message.id.desc())
+        )
+        for message, topic, hit_score in result.all():
+            hits.append(SearchHit(
+                discussion_id=message.discussion_id,
+                topic=html.escape(topic),
+                message_id=message.id,
+                agent_name=message.agent_name,
+                message_type=message.message_type,
+                snippet=render_highlight(make_snippet(message.content, terms)),
+                score=hit_score,
+                created_at=message.created_at
+            ))
+    else:
+        result = await db.execute(
+            select(Discussion, hits_query.c.score)
+            .join(hits_query, hits_query.c.id == Discussion.id)
+            .order_by(hits_query.c.score.desc(), Discussion.id.desc())
+        )
+        for discussion, hit_score in result.all():
+            hits.append(SearchHit(
+                discussion_id=discussion.id,
+                topic=render_highlight(mark_terms(discussion.topic, terms)),
+                snippet=render_highlight(make_snippet(discussion.summary, terms)),
+                score=hit_score,
+                created_at=discussion.created_at
+            ))
+    return hits
+
+
+@router.get("", response_model=SearchResults)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    scope: str = Query("messages", pattern="^(messages|discussions)$"),
+    discussion_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    全文检索讨论历史
+
+    - scope=messages：检索消息内容，snippet为命中片段
+    - scope=discussions：检索讨论话题和总结，topic带高亮
+    - since/until按创建时间过滤；next_offset为空表示没有更多结果
+    """
+    if is_sqlite(DATABASE_URL):
+        backend = search_sqlite
+    elif is_postgres(DATABASE_URL):
+        backend = search_postgres
+    else:
+        raise HTTPException(status_code=501, detail="Full-text search requires SQLite or PostgreSQL")
+
+    indexed_terms, short_terms = split_terms(q)
+    # 多取一条用于判断是否还有下一页
+    hits = await backend(
+        db, scope, indexed_terms, short_terms, discussion_id, since, until, limit + 1, offset
+    )
+
+    next_offset = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_offset = offset + limit
+
+    return SearchResults(query=q, scope=scope, items=hits, next_offset=next_offset)
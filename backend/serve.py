@@ -0,0 +1,74 @@
+"""
+生产环境启动入口
+多worker进程运行，关闭时优雅退出：
+
+1. 停止接受新连接，立即断开直播观看者（观看连接不会自行结束）
+2. 等待进行中的生成流结束，最多 SHUTDOWN_DRAIN_SECONDS 秒
+3. 超时仍未结束的生成被取消，已输出内容保存为interrupted，可在前端续写
+
+各worker之间的互斥（讨论运行锁、行情抓取）和行情缓存通过数据库共享，见 leases.py。
+多worker时建议使用PostgreSQL，SQLite也可用（WAL模式下多进程读写安全，写入串行）
+
+用法：
+    python serve.py                 # 使用 WEB_CONCURRENCY 个worker
+    python serve.py --workers 4
+开发调试仍使用 python main.py（单进程、自动重载）
+"""
+import argparse
+import os
+import sys
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+from dotenv import load_dotenv
+from live_hub import live_hub
+
+load_dotenv()
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+# 关闭时等待生成流结束的最长时间（秒）
+SHUTDOWN_DRAIN_SECONDS = int(os.getenv("SHUTDOWN_DRAIN_SECONDS", "60"))
+
+
+class DrainingServer(uvicorn.Server):
+    """关闭时先断开直播观看者，再交给uvicorn等待其余连接结束"""
+
+    async def shutdown(self, sockets=None):
+        live_hub.begin_drain()
+        await super().shutdown(sockets=sockets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Opinion Room 生产环境启动")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY, help="worker进程数")
+    args = parser.parse_args()
+
+    # 子进程按 WEB_CONCURRENCY 分摊数据库连接池
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    config = uvicorn.Config(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=SHUTDOWN_DRAIN_SECONDS,
+        proxy_headers=True,
+        log_level="info"
+    )
+    server = DrainingServer(config=config)
+
+    print(f"🚀 启动 Opinion Room（{args.workers} 个worker）: http://{args.host}:{args.port}")
+    if args.workers > 1:
+        sock = config.bind_socket()
+        Multiprocess(config, target=server.run, sockets=[sock]).run()
+    else:
+        server.run()
+        if not server.started:
+            sys.exit(3)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+股票代码识别
+从讨论文本中识别提到的股票，返回按置信度排序的代码：
+
+- 词典（data/symbols.csv，可用 SYMBOL_DICTIONARY_EXTRA 追加自定义词典）包含美股、中概股、港股、A股、
+  指数和加密货币的代码、中英文名称和拼音，启动后首次使用时加载一次
+- 所有别名编译成一个 Aho-Corasick 自动机，对文本只扫描一遍即可找出全部匹配
+- 英文/数字别名要求两侧不是字母数字（中文紧挨着也能识别，"和NVDA的" 中的 NVDA 可以识别）；
+  美股代码只在原文为大写时识别
+- 置信度：每次提及按别名类型给分，多次提及合并为 1 - Π(1 - 分数)；
+  公司的主要中英文名称（"苹果"、"Apple"）提及一次即可识别，
+  有歧义的别名（产品名 "iPhone"、常用词 "理想"、代码 "NOW"）单独出现一次时低于阈值，不会被当作股票
+
+用法：
+    python symbols.py "特斯拉和NVDA最近的走势"
+    python symbols.py --benchmark            # 长文本识别耗时
+    python symbols.py --check                # 检查单次提及的识别结果
+"""
+import argparse
+import csv
+import os
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DICTIONARY_PATH = os.path.join(os.path.dirname(__file__), "data", "symbols.csv")
+# 额外的词典文件（格式同 data/symbols.csv），用于补充公司内部常讨论的代码
+SYMBOL_DICTIONARY_EXTRA = os.getenv("SYMBOL_DICTIONARY_EXTRA", "")
+# 返回给调用方的最低置信度
+SYMBOL_MIN_CONFIDENCE = float(os.getenv("SYMBOL_MIN_CONFIDENCE", "0.5"))
+
+# 各类别名单次提及的置信度
+WEIGHT_TICKER = 0.9
+WEIGHT_COMMON_TICKER = 0.35
+WEIGHT_CODE = 0.85
+WEIGHT_NAME = 0.9
+WEIGHT_AMBIGUOUS_NAME = 0.45
+
+KIND_TICKER = "ticker"
+KIND_CODE = "code"
+KIND_NAME = "name"
+
+
+@dataclass(frozen=True)
+class SymbolInfo:
+    symbol: str
+    market: str
+    name: str
+
+
+@dataclass(frozen=True)
+class Alias:
+    text: str  # 小写后的别名
+    info: SymbolInfo
+    kind: str
+    weight: float
+
+
+@dataclass
+class SymbolMatch:
+    """一个代码的识别结果"""
+    symbol: str
+    name: str
+    market: str
+    confidence: float = 0.0
+    mentions: int = 0
+    first_position: int = 0
+    aliases: List[str] = field(default_factory=list)
+
+
+# ===== Aho-Corasick 自动机 =====
+
+class Automaton:
+    """多模式串匹配：构建后对文本扫描一遍，产出所有 (结束位置, 模式)"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Alias]] = [[]]
+        self._root_pattern = re.compile("(?!)")
+
+    def add(self, word: str, value: Alias):
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(value)
+
+    def build(self):
+        """按BFS计算失败指针，并把失败链上的输出合并到每个状态"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._root_pattern = re.compile("[" + "".join(re.escape(char) for char in self._goto[0]) + "]")
+
+    def iter(self, text: str) -> Iterator[Tuple[int, Alias]]:
+        goto, fail, output = self._goto, self._fail, self._output
+        root = goto[0]
+        # 在根状态时用正则跳到下一个可能开始匹配的字符，长文本中大部分字符不需要逐个处理
+        skip = self._root_pattern.search
+        state = 0
+        index = 0
+        length = len(text)
+        while index < length:
+            if not state:
+                found = skip(text, index)
+                if found is None:
+                    return
+                index = found.start()
+            char = text[index]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0) if state else root.get(char, 0)
+            if output[state]:
+                for value in output[state]:
+                    yield index, value
+            index += 1
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+
+# ===== 词典 =====
+
+def _code_aliases(symbol: str, market: str) -> List[Tuple[str, str]]:
+    """代码本身作为别名：返回 (别名, 类型)"""
+    if market == "US":
+        if re.fullmatch(r"[A-Z]{2,5}(-[A-Z])?", symbol):
+            return [(symbol, KIND_TICKER)]
+        return []
+    if market == "HK":
+        code = symbol.split(".")[0]
+        return [(symbol, KIND_CODE), (code.zfill(5), KIND_CODE)]
+    if market in ("SS", "SZ"):
+        return [(symbol, KIND_CODE), (symbol.split(".")[0], KIND_CODE)]
+    return []
+
+
+def load_dictionary(path: str) -> List[Alias]:
+    aliases = []
+    with open(path, encoding="utf-8") as f:
+        rows = csv.reader(line for line in f if line.strip() and not line.startswith("#"))
+        for row in rows:
+            symbol, market, name, alias_text = (value.strip() for value in row[:4])
+            flags = set(row[4].split(";")) if len(row) > 4 and row[4] else set()
+            info = SymbolInfo(symbol, market, name)
+            for code, kind in _code_aliases(symbol, market):
+                if kind == KIND_TICKER:
+                    weight = WEIGHT_COMMON_TICKER if "common" in flags else WEIGHT_TICKER
+                else:
+                    weight = WEIGHT_CODE
+                aliases.append(Alias(code.lower(), info, kind, weight))
+            for alias in filter(None, (value.strip() for value in alias_text.split(";"))):
+                ambiguous = alias.endswith("~")
+                alias = alias.rstrip("~")
+                aliases.append(Alias(
+                    alias.lower(), info, KIND_NAME, WEIGHT_AMBIGUOUS_NAME if ambiguous else WEIGHT_NAME
+                ))
+    return aliases
+
+
+# ===== 识别 =====
+
+def _is_word_char(char: str) -> bool:
+    return char.isascii() and char.isalnum()
+
+
+def _fold(text: str) -> str:
+    """小写化并保持长度不变（个别字符小写后变长时保留原字符），匹配位置可以直接对应原文"""
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    return "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+
+class SymbolResolver:
+    """词典 + 自动机，首次使用时构建"""
+
+    def __init__(self, paths: Optional[List[str]] = None):
+        self.paths = paths or [DICTIONARY_PATH] + [
+            path for path in SYMBOL_DICTIONARY_EXTRA.split(os.pathsep) if path
+        ]
+        self._automaton: Optional[Automaton] = None
+        self.symbols: Dict[str, SymbolInfo] = {}
+
+    def _build(self) -> Automaton:
+        automaton = Automaton()
+        seen = set()
+        for path in self.paths:
+            for alias in load_dictionary(path):
+                # 代码和名称可能同形（META / Meta），按类型分别保留：代码只匹配大写，名称不区分大小写
+                key = (alias.text, alias.info.symbol, alias.kind)
+                if key in seen:
+                    continue
+                seen.add(key)
+                automaton.add(alias.text, alias)
+                self.symbols[alias.info.symbol] = alias.info
+        automaton.build()
+        return automaton
+
+    @property
+    def automaton(self) -> Automaton:
+        if self._automaton is None:
+            self._automaton = self._build()
+        return self._automaton
+
+    def _matches(self, text: str) -> List[Tuple[int, int, Alias]]:
+        """所有有效匹配 (起点, 终点, 别名)，重叠时保留最左最长的匹配"""
+        matches = []
+        for end, alias in self.automaton.iter(_fold(text)):
+            start = end - len(alias.text) + 1
+            end += 1
+            if alias.text[0].isascii() and alias.text[0].isalnum() and start > 0 and _is_word_char(text[start - 1]):
+                continue
+            if alias.text[-1].isascii() and alias.text[-1].isalnum() and end < len(text) and _is_word_char(text[end]):
+                continue
+            if alias.kind == KIND_TICKER and text[start:end] != alias.info.symbol:
+                continue
+            matches.append((start, end, alias))
+
+        matches.sort(key=lambda item: (item[0], -(item[1] - item[0])))
+        kept = []
+        covered_until = 0
+        for start, end, alias in matches:
+            if start < covered_until:
+                if not kept or (start, end) != kept[-1][:2]:
+                    continue
+                # 同一段文字对应多个别名：不同代码都保留，同一代码只保留分数最高的
+                same = next((i for i in range(len(kept) - 1, -1, -1)
+                             if kept[i][:2] == (start, end) and kept[i][2].info.symbol == alias.info.symbol), None)
+                if same is not None:
+                    if alias.weight > kept[same][2].weight:
+                        kept[same] = (start, end, alias)
+                    continue
+            kept.append((start, end, alias))
+            covered_until = max(covered_until, end)
+        return kept
+
+    def resolve(self, text: str, min_confidence: float = 0.0) -> List[SymbolMatch]:
+        """识别文本中的代码，按置信度从高到低（相同时按首次出现位置）排序"""
+        results: Dict[str, SymbolMatch] = {}
+        misses: Dict[str, float] = {}
+        for start, end, alias in self._matches(text):
+            info = alias.info
+            match = results.get(info.symbol)
+            if match is None:
+                match = results[info.symbol] = SymbolMatch(info.symbol, info.name, info.market, first_position=start)
+                misses[info.symbol] = 1.0
+            match.mentions += 1
+            misses[info.symbol] *= 1.0 - alias.weight
+            if text[start:end] not in match.aliases:
+                match.aliases.append(text[start:end])
+        for symbol, match in results.items():
+            match.confidence = round(1.0 - misses[symbol], 4)
+        ranked = sorted(results.values(), key=lambda match: (-match.confidence, match.first_position))
+        return [match for match in ranked if match.confidence >= min_confidence]
+
+    def extract(self, text: str, min_confidence: float = SYMBOL_MIN_CONFIDENCE) -> List[str]:
+        """识别出的代码列表（按置信度排序）"""
+        return [match.symbol for match in self.resolve(text, min_confidence)]
+
+
+# 全局实例
+symbol_resolver = SymbolResolver()
+
+
+# ===== 命令行 =====
+
+# 单次提及的预期识别结果（讨论话题通常只提到公司一次）
+CHECK_CASES = [
+    ("苹果今年表现", ["AAPL"]),
+    ("Apple and Microsoft earnings", ["AAPL", "MSFT"]),
+    ("特斯拉和NVDA最近的走势", ["TSLA", "NVDA"]),
+    ("小米汽车的交付量", ["1810.HK"]),
+    ("Meta的广告收入", ["META"]),
+    ("新款iPhone的销量", []),
+    ("NOW is the time to buy", []),
+    ("理想的估值水平", []),
+    ("美的设计", []),
+]
+
+def _naive_extract(aliases: List[Alias], text: str) -> set:
+    """对照：逐个别名做子串查找"""
+    lowered = text.lower()
+    return {alias.info.symbol for alias in aliases if alias.text in lowered}
+
+
+def benchmark(sizes: List[int]):
+    aliases = [alias for path in symbol_resolver.paths for alias in load_dictionary(path)]
+    started = time.perf_counter()
+    automaton = symbol_resolver.automaton
+    print(f"词典: {len(symbol_resolver.symbols)} 个代码 / {len(aliases)} 个别名，"
+          f"自动机 {len(automaton)} 个状态，构建 {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    names = [alias.text for alias in aliases if alias.kind == KIND_NAME][::7]
+    filler = "从估值和现金流的角度看，这家公司的增长逻辑需要更多数据验证。我们讨论一下风险敞口和仓位。"
+    for size in sizes:
+        parts, index = [], 0
+        while sum(map(len, parts)) < size:
+            parts.append(filler)
+            parts.append(names[index % len(names)])
+            index += 1
+        text = "".join(parts)[:size]
+        started = time.perf_counter()
+        found = symbol_resolver.resolve(text)
+        elapsed = time.perf_counter() - started
+        started = time.perf_counter()
+        _naive_extract(aliases, text)
+        naive = time.perf_counter() - started
+        print(f"{size // 1000:>5}K 字符: 识别 {len(found):>3} 个代码，"
+              f"自动机 {elapsed * 1000:7.2f}ms，逐别名查找 {naive * 1000:7.2f}ms")
+
+
+def check() -> bool:
+    """按 CHECK_CASES 检查默认阈值下的识别结果"""
+    ok = True
+    for text, expected in CHECK_CASES:
+        found = symbol_resolver.extract(text)
+        passed = found == expected
+        ok = ok and passed
+        print(f"{'✅' if passed else '❌'} {text!r}: {found}" + ("" if passed else f"（预期 {expected}）"))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="识别文本中的股票代码")
+    parser.add_argument("text", nargs="?", help="要识别的文本")
+    parser.add_argument("--benchmark", action="store_true", help="长文本识别耗时")
+    parser.add_argument("--check", action="store_true", help="检查单次提及的识别结果")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    if args.benchmark:
+        benchmark([10_000, 100_000, 1_000_000])
+    elif args.check:
+        passed = check()
+        print("=" * 60)
+        if not passed:
+            raise SystemExit(1)
+        return
+    elif args.text:
+        for match in symbol_resolver.resolve(args.text):
+            mark = "✅" if match.confidence >= SYMBOL_MIN_CONFIDENCE else "  "
+            print(f"{mark} {match.symbol:<10} {match.name:<20} 置信度 {match.confidence:.2f}  "
+                  f"提及 {match.mentions} 次: {', '.join(match.aliases)}")
+    else:
+        parser.print_help()
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
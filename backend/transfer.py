@@ -0,0 +1,75 @@
+"""
+讨论数据导入导出工具
+在不同环境之间迁移或备份讨论（NDJSON格式，文件名以 .gz 结尾时gzip压缩），
+与 /api/transfer/export、/api/transfer/import 接口使用相同的格式
+
+用法：
+    python transfer.py export backup.ndjson.gz                 # 导出全部
+    python transfer.py export one.ndjson --discussion 12       # 只导出指定讨论（可重复）
+    python transfer.py import backup.ndjson.gz
+"""
+import argparse
+import asyncio
+from database import init_db, dispose_engines
+from transfer_service import export_ndjson, iter_ndjson, Importer
+
+READ_CHUNK_SIZE = 256 * 1024
+
+
+async def read_file(path: str):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def export_file(path: str, discussion_ids):
+    written = 0
+    with open(path, "wb") as f:
+        async for chunk in export_ndjson(discussion_ids, compress=path.endswith(".gz")):
+            f.write(chunk)
+            written += len(chunk)
+    print(f"✅ 已导出到 {path}（{written / 1024 / 1024:.1f}MB）")
+
+
+async def import_file(path: str):
+    importer = Importer()
+    try:
+        report = await importer.run(iter_ndjson(read_file(path)))
+    except Exception as e:
+        report = importer.report
+        print(f"❌ 导入失败: {e}")
+        print(f"   已导入 {report['discussions']} 个讨论 / {report['messages']} 条消息（已提交，未回滚）")
+        raise SystemExit(1)
+    print(
+        f"✅ 导入完成：{report['discussions']} 个讨论 / {report['messages']} 条消息，"
+        f"新建Agent {report['agents_created']} 个，匹配已有Agent {report['agents_matched']} 个"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="讨论数据导入导出")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="导出到文件")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--discussion", type=int, action="append", help="只导出指定讨论ID（可重复）")
+    import_parser = subparsers.add_parser("import", help="从文件导入")
+    import_parser.add_argument("path")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    try:
+        await init_db()
+        if args.command == "export":
+            await export_file(args.path, args.discussion)
+        else:
+            await import_file(args.path)
+    finally:
+        await dispose_engines()
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
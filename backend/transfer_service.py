@@ -0,0 +1,340 @@
+"""
+讨论数据导入导出（NDJSON）
+每行一条JSON记录，type字段区分类型：
+
+    {"type": "header", "format": "opinionroom", "version": 1, "exported_at": "..."}
+    {"type": "agent", "id": 1, "name": "...", ...}
+    {"type": "discussion", "id": 7, "topic": "...", ...}
+    {"type": "message", "id": 31, "discussion_id": 7, ...}   # 紧跟在所属讨论之后
+
+导出按讨论分组（讨论之后是它的全部消息，已归档的消息解压后一并导出），
+导入时只需要记住当前批次的讨论ID映射，内存占用与数据总量无关。
+导出按主键分页读取，每页一个短事务，下载期间不占用数据库连接、也不保持读事务
+（导出不是一致性快照，导出期间新写入的数据可能部分包含在内）；
+导入分批插入、每批单独提交，不会长时间占用写锁。
+
+导入时所有记录使用新ID：Agent按名称匹配本库已有的Agent，没有则新建；
+讨论和消息总是新建（重复导入同一文件会得到两份讨论）
+"""
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+from dotenv import load_dotenv
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, insert, tuple_
+from database import ReadSessionLocal, WriteSessionLocal, Agent, Discussion, Message, MessageArchive
+from archive import load_archived_messages
+from agent_registry import agent_registry
+from checkpoint import STATUS_STREAMING, STATUS_INTERRUPTED
+
+load_dotenv()
+
+router = APIRouter(prefix="/api/transfer", tags=["transfer"])
+
+EXPORT_FORMAT = "opinionroom"
+EXPORT_VERSION = 1
+# 导出时每页读取的行数
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "1000"))
+# 导入时每批插入的记录数（每批一个事务）
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+GZIP_MAGIC = b"\x1f\x8b"
+DECOMPRESS_CHUNK_SIZE = 256 * 1024
+
+
+# ===== 导出 =====
+
+def _record(record_type: str, row) -> dict:
+    return {"type": record_type, **row}
+
+
+async def _next(rows):
+    try:
+        return await rows.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _fetch(query) -> list:
+    """在一个短事务中读取一页，读完即归还连接"""
+    async with ReadSessionLocal() as session:
+        return (await session.execute(query)).mappings().all()
+
+
+async def _page_messages(discussions_filter, first_id: int, last_id: int) -> AsyncIterator[dict]:
+    """讨论ID在 [first_id, last_id] 内的消息，按 (讨论ID, 时间, ID) 分页读取"""
+    key = None
+    while True:
+        query = select(Message.__table__).where(Message.discussion_id.between(first_id, last_id))
+        if discussions_filter is not None:
+            query = query.where(discussions_filter)
+        if key is not None:
+            query = query.where(tuple_(Message.discussion_id, Message.created_at, Message.id) > tuple_(*key))
+        rows = await _fetch(
+            query.order_by(Message.discussion_id, Message.created_at, Message.id).limit(EXPORT_FETCH_SIZE)
+        )
+        for row in rows:
+            yield row
+        if len(rows) < EXPORT_FETCH_SIZE:
+            return
+        key = (rows[-1]["discussion_id"], rows[-1]["created_at"], rows[-1]["id"])
+
+
+async def export_records(discussion_ids: Optional[List[int]] = None) -> AsyncIterator[dict]:
+    """按 header → agents → (discussion, messages...) 的顺序逐条产出记录"""
+    yield {
+        "type": "header", "format": EXPORT_FORMAT, "version": EXPORT_VERSION,
+        "exported_at": datetime.utcnow().isoformat()
+    }
+
+    discussions_query = select(Discussion.__table__)
+    archives_query = select(MessageArchive.discussion_id)
+    messages_filter = None
+    if discussion_ids:
+        discussions_query = discussions_query.where(Discussion.id.in_(discussion_ids))
+        archives_query = archives_query.where(MessageArchive.discussion_id.in_(discussion_ids))
+        messages_filter = Message.discussion_id.in_(discussion_ids)
+
+    # Agent数量很少，和归档的讨论ID一起读完后归还连接
+    async with ReadSessionLocal() as session:
+        agents = (await session.execute(select(Agent.__table__).order_by(Agent.id))).mappings().all()
+        archived = set((await session.execute(archives_query)).scalars())
+    for agent in agents:
+        yield _record("agent", agent)
+
+    # 每页讨论读出后，再分页读取这些讨论的消息并按讨论ID归并
+    last_discussion_id = 0
+    while True:
+        discussions = await _fetch(
+            discussions_query.where(Discussion.id > last_discussion_id)
+            .order_by(Discussion.id).limit(EXPORT_FETCH_SIZE)
+        )
+        if not discussions:
+            return
+        last_discussion_id = discussions[-1]["id"]
+
+        messages = _page_messages(messages_filter, discussions[0]["id"], last_discussion_id)
+        message = await _next(messages)
+        for discussion in discussions:
+            yield _record("discussion", discussion)
+            if discussion["id"] in archived:
+                # 归档的消息都早于messages表中剩余的消息
+                async with ReadSessionLocal() as session:
+                    items = await load_archived_messages(session, discussion["id"])
+                for item in items:
+                    yield _record("message", item)
+            while message is not None and message["discussion_id"] <= discussion["id"]:
+                if message["discussion_id"] == discussion["id"]:
+                    yield _record("message", message)
+                message = await _next(messages)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+async def export_ndjson(discussion_ids: Optional[List[int]] = None, compress: bool = False) -> AsyncIterator[bytes]:
+    """导出为NDJSON字节流，compress=True时输出gzip"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+    async for record in export_records(discussion_ids):
+        line = (json.dumps(record, ensure_ascii=False, default=_json_default) + "\n").encode("utf-8")
+        buffer.append(line)
+        size += len(line)
+        if size >= 64 * 1024:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+# ===== 导入 =====
+
+async def _decompressed(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """识别gzip并流式解压；限制每次解压的输出大小，高压缩比的输入也不会一次展开"""
+    decompressor = None
+    first = True
+    async for chunk in chunks:
+        if first:
+            if chunk.startswith(GZIP_MAGIC):
+                decompressor = zlib.decompressobj(31)
+            first = False
+        if decompressor is None:
+            yield chunk
+            continue
+        while chunk:
+            yield decompressor.decompress(chunk, DECOMPRESS_CHUNK_SIZE)
+            chunk = decompressor.unconsumed_tail
+    if decompressor is not None:
+        yield decompressor.flush()
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[dict]:
+    """逐行解析NDJSON字节流（自动识别gzip）"""
+    pending = b""
+    line_number = 0
+    async for chunk in _decompressed(chunks):
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield _parse_line(line, line_number)
+    line_number += 1
+    if pending.strip():
+        yield _parse_line(pending, line_number)
+
+
+def _parse_line(line: bytes, line_number: int) -> dict:
+    try:
+        record = json.loads(line)
+    except ValueError:
+        raise ValueError(f"Line {line_number}: invalid JSON")
+    if not isinstance(record, dict) or "type" not in record:
+        raise ValueError(f"Line {line_number}: missing record type")
+    return record
+
+
+def _row(record: dict, table) -> dict:
+    """只保留表中存在的列（兼容新版本导出的额外字段），解析时间"""
+    row = {key: value for key, value in record.items() if key in table.c and key != "id"}
+    if isinstance(row.get("created_at"), str):
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return row
+
+
+class Importer:
+    """
+    分批导入
+
+    讨论和消息先缓冲，攒够一批后在一个事务中插入：先插入讨论拿到新ID，再插入消息。
+    消息紧跟在讨论之后，跨批次时只需要记住上一批最后一个讨论的ID映射
+    """
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.agent_ids: Dict[int, int] = {}  # 文件中的Agent ID -> 本库ID（Agent数量很少）
+        self.pending_discussions: List[tuple] = []  # (文件中的ID, 行)
+        self.pending_messages: List[dict] = []
+        self.last_discussion_id: Optional[int] = None
+        self.carried: Dict[int, int] = {}  # 上一批最后一个讨论的ID映射
+        self.report = {"agents_created": 0, "agents_matched": 0, "discussions": 0, "messages": 0}
+
+    async def run(self, records: AsyncIterator[dict]) -> dict:
+        try:
+            async for record in records:
+                await self.add(record)
+            await self.flush()
+        finally:
+            if self.report["agents_created"]:
+                agent_registry.invalidate()
+        return self.report
+
+    async def add(self, record: dict):
+        record_type = record["type"]
+        if record_type == "header":
+            if record.get("format") != EXPORT_FORMAT or record.get("version", 0) > EXPORT_VERSION:
+                raise ValueError("Unsupported export format")
+        elif record_type == "agent":
+            await self._add_agent(record)
+        elif record_type == "discussion":
+            self.pending_discussions.append((record["id"], _row(record, Discussion.__table__)))
+            self.last_discussion_id = record["id"]
+        elif record_type == "message":
+            if self.last_discussion_id is None or record.get("discussion_id") != self.last_discussion_id:
+                raise ValueError(f"Message {record.get('id')} does not follow its discussion")
+            row = _row(record, Message.__table__)
+            row["agent_id"] = self.agent_ids.get(record.get("agent_id"))
+            if row.get("status") == STATUS_STREAMING:
+                row["status"] = STATUS_INTERRUPTED
+            self.pending_messages.append(row)
+        if len(self.pending_discussions) + len(self.pending_messages) >= self.batch_size:
+            await self.flush()
+
+    async def _add_agent(self, record: dict):
+        async with WriteSessionLocal() as session:
+            existing = (await session.execute(
+                select(Agent.id).where(Agent.name == record["name"]).limit(1)
+            )).scalar_one_or_none()
+            if existing is not None:
+                self.agent_ids[record["id"]] = existing
+                self.report["agents_matched"] += 1
+                return
+            result = await session.execute(
+                insert(Agent.__table__).returning(Agent.id), [_row(record, Agent.__table__)]
+            )
+            self.agent_ids[record["id"]] = result.scalar_one()
+            await session.commit()
+        self.report["agents_created"] += 1
+
+    async def flush(self):
+        if not self.pending_discussions and not self.pending_messages:
+            return
+        discussion_ids = dict(self.carried)
+        async with WriteSessionLocal() as session:
+            if self.pending_discussions:
+                result = await session.execute(
+                    insert(Discussion.__table__).returning(
+                        Discussion.id, sort_by_parameter_order=True
+                    ),
+                    [row for _, row in self.pending_discussions]
+                )
+                for (old_id, _), new_id in zip(self.pending_discussions, result.scalars().all()):
+                    discussion_ids[old_id] = new_id
+            if self.pending_messages:
+                for row in self.pending_messages:
+                    row["discussion_id"] = discussion_ids[row["discussion_id"]]
+                await session.execute(insert(Message.__table__), self.pending_messages)
+            await session.commit()
+        self.carried = {self.last_discussion_id: discussion_ids[self.last_discussion_id]}
+        self.report["discussions"] += len(self.pending_discussions)
+        self.report["messages"] += len(self.pending_messages)
+        self.pending_discussions = []
+        self.pending_messages = []
+
+
+async def import_records(records: AsyncIterator[dict], batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """导入记录，返回统计；出错时已提交的批次保留"""
+    return await Importer(batch_size).run(records)
+
+
+# ===== 接口 =====
+
+@router.get("/export")
+async def export_discussions(
+    discussion_id: Optional[List[int]] = Query(None),
+    gzip: bool = False
+):
+    """导出讨论、消息和Agent（NDJSON流，gzip=true时压缩）；不传discussion_id时导出全部"""
+    filename = f"opinionroom-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_ndjson(discussion_id, compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.post("/import")
+async def import_discussions(request: Request):
+    """导入导出文件（请求体为NDJSON，可gzip压缩），边接收边写入"""
+    importer = Importer()
+    try:
+        return await importer.run(iter_ndjson(request.stream()))
+    except (ValueError, KeyError, zlib.error) as e:
+        report = importer.report
+        raise HTTPException(
+            status_code=400,
+            detail=f"Import failed after {report['discussions']} discussions / {report['messages']} messages: {e}"
+        )
@@ -0,0 +1,134 @@
+"""
+进程内TTL缓存（LRU、过期后后台刷新、单飞）
+用在共享缓存（数据库）前面，避免每次请求都访问数据库和外部接口：
+
+- 条目在 ttl 秒内直接返回（hit）
+- 超过 ttl 但未超过 stale_ttl 时立即返回旧值，同时在后台刷新（stale）
+- 没有可用条目时等待加载（miss）；同一个key同时只有一次加载，其余请求等待同一个结果
+- 超过 max_size 时淘汰最久未使用的条目
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# 加载函数：返回 (值, 值产生的时间戳 time.time())，没有数据时返回None
+Loader = Callable[[], Awaitable[Optional[Tuple[Any, float]]]]
+
+
+class TTLCache:
+    """带过期刷新和单飞加载的LRU缓存"""
+
+    def __init__(self, max_size: int, ttl: float, stale_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.metrics = {
+            "hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0,
+            "refreshes": 0, "refresh_failures": 0, "evictions": 0
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def peek(self, key: str) -> Optional[Tuple[Any, float]]:
+        """不计入统计、不刷新LRU顺序地读取条目，返回 (值, 缓存时长秒)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return entry[0], time.time() - entry[1]
+
+    def put(self, key: str, value: Any, fetched_at: Optional[float] = None):
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        current = self._entries.get(key)
+        if current is not None and current[1] > fetched_at:
+            # 不用更旧的数据覆盖
+            return
+        self._entries[key] = (value, fetched_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def invalidate(self, key: Optional[str] = None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def get(self, key: str, load: Loader, seed: Optional[Loader] = None) -> Optional[Any]:
+        """
+        读取缓存
+
+        Args:
+            load: 从数据源加载（较慢）
+            seed: 内存中没有条目时先尝试的共享缓存（较快，可能返回过期数据）
+        """
+        entry = self._entries.get(key)
+        if entry is None and seed is not None:
+            seeded = await seed()
+            if seeded is not None:
+                self.put(key, *seeded)
+                entry = self._entries.get(key)
+
+        if entry is not None:
+            age = time.time() - entry[1]
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                self.metrics["hits"] += 1
+                return entry[0]
+            if age < self.stale_ttl:
+                self._entries.move_to_end(key)
+                self.metrics["stale_hits"] += 1
+                self._start_load(key, load)
+                return entry[0]
+
+        self.metrics["misses"] += 1
+        if key in self._inflight:
+            self.metrics["coalesced"] += 1
+        # shield：调用方超时取消时加载继续进行，结果仍会写入缓存
+        return await asyncio.shield(self._start_load(key, load))
+
+    async def refresh(self, key: str, load: Loader) -> Optional[Any]:
+        """主动刷新（预取），和正在进行的加载合并"""
+        return await asyncio.shield(self._start_load(key, load))
+
+    def _start_load(self, key: str, load: Loader) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, load))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+        return task
+
+    async def _load(self, key: str, load: Loader) -> Optional[Any]:
+        self.metrics["refreshes"] += 1
+        try:
+            loaded = await load()
+        except Exception as e:
+            print(f"⚠️  缓存加载失败 ({key}): {e}")
+            loaded = None
+        if loaded is None:
+            self.metrics["refresh_failures"] += 1
+            return None
+        self.put(key, *loaded)
+        return loaded[0]
+
+    async def aclose(self):
+        """取消进行中的加载"""
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.metrics["hits"] + self.metrics["stale_hits"] + self.metrics["misses"]
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "inflight": len(self._inflight),
+            **self.metrics,
+            "hit_rate": round((self.metrics["hits"] + self.metrics["stale_hits"]) / lookups, 4) if lookups else None
+        }
@@ -10,6 +10,24 @@ let editingAgentId = null;
 let currentAbortController = null;  // 用于中断请求
 let isPaused = false;
 
+// 分页与增量同步状态
+const DISCUSSION_PAGE_SIZE = 30;
+const MESSAGE_PAGE_SIZE = 50;
+let discussionsCache = [];          // 已加载的讨论列表
+let discussionsNextCursor = null;   // 下一页讨论的游标
+let currentMessages = [];           // 当前讨论已加载的消息
+let messagesSyncCursor = 0;         // 增量同步起点（since_message_id）
+let olderMessagesCursor = null;     // 更早消息的游标
+
+// 历史消息窗口化渲染（见 message_window.js）：只渲染视口附近的消息内容
+const EAGER_RENDER_MESSAGES = 3;    // 打开讨论时立即渲染的最后几条消息
+const LAZY_MESSAGE_TYPES = ['user', 'agent', 'summary'];
+let messageWindow = null;
+
+// 全文检索状态（query为空时侧栏显示讨论列表）
+const SEARCH_PAGE_SIZE = 20;
+let searchState = { query: '', items: [], nextOffset: null };
+
 // DOM元素（延迟初始化）
 let elements = {};
 
@@ -18,6 +36,7 @@ function initElements() {
     elements = {
         agentsList: document.getElementById('agentsList'),
         discussionsList: document.getElementById('discussionsList'),
+        searchInput: document.getElementById('searchInput'),
         messagesContainer: document.getElementById('messagesContainer'),
         welcomeScreen: document.getElementById('welcomeScreen'),
         messageInput: document.getElementById('messageInput'),
@@ -48,6 +67,7 @@ async function init() {
     try {
         // 初始化DOM元素
         initElements();
+        messageWindow = new MessageWindow(elements.messagesContainer, { render: renderMarkdown });
         
         // 检查关键元素
         const missingElements = [];
@@ -115,6 +135,19 @@ function setupEventListeners() {
         elements.messageInput.addEventListener('keydown', handleAutocompleteKeydown);
     }
     
+    if (elements.searchInput) {
+        elements.searchInput.addEventListener('keydown', (e) => {
+            if (e.key === 'Enter') {
+                e.preventDefault();
+                searchHistory(elements.searchInput.value.trim());
+            }
+        });
+        // 清空搜索框时回到讨论列表
+        elements.searchInput.addEventListener('search', () => {
+            if (!elements.searchInput.value.trim()) searchHistory('');
+        });
+    }
+    
     if (elements.addAgentBtn) {
         elements.addAgentBtn.addEventListener('click', () => openAgentModal());
     }
@@ -370,15 +403,42 @@ async function loadDefaultTeam() {
 
 async function loadDiscussions() {
     try {
-        const response = await fetch(`${API_BASE}/discussions`);
-        const discussions = await response.json();
-        renderDiscussions(discussions);
+        const response = await fetch(`${API_BASE}/discussions?limit=${DISCUSSION_PAGE_SIZE}`);
+        const page = await response.json();
+        discussionsCache = page.items;
+        discussionsNextCursor = page.next_cursor;
+        renderDiscussions(discussionsCache);
     } catch (error) {
         console.error('加载讨论历史失败:', error);
     }
 }
 
+async function loadMoreDiscussions() {
+    if (!discussionsNextCursor) return;
+    
+    try {
+        const response = await fetch(`${API_BASE}/discussions?limit=${DISCUSSION_PAGE_SIZE}&cursor=${encodeURIComponent(discussionsNextCursor)}`);
+        const page = await response.json();
+        discussionsCache = discussionsCache.concat(page.items);
+        discussionsNextCursor = page.next_cursor;
+        renderDiscussions(discussionsCache);
+    } catch (error) {
+        console.error('加载更多讨论失败:', error);
+    }
+}
+
+// 新建讨论后加入本地列表，不重新请求整个列表
+function addDiscussionToList(discussion) {
+    discussionsCache = [discussion, ...discussionsCache.filter(d => d.id !== discussion.id)];
+    renderDiscussions(discussionsCache);
+}
+
 function renderDiscussions(discussions) {
+    if (searchState.query) {
+        renderSearchResults();
+        return;
+    }
+    
     if (discussions.length === 0) {
         elements.discussionsList.innerHTML = '<p style="padding: 16px; color: var(--text-muted); text-align: center; font-size: 13px;">暂无历史讨论</p>';
         return;
@@ -390,15 +450,74 @@ function renderDiscussions(discussions) {
             <div class="discussion-topic">${escapeHtml(discussion.topic)}</div>
             <div class="discussion-date">${formatDate(discussion.created_at)}</div>
         </div>
-    `).join('');
+    `).join('') + (discussionsNextCursor
+        ? '<button class="load-more-btn" onclick="loadMoreDiscussions()">加载更多</button>'
+        : '');
+}
+
+// ===== 全文检索 =====
+
+async function searchHistory(query, offset = 0) {
+    if (!query) {
+        searchState = { query: '', items: [], nextOffset: null };
+        renderDiscussions(discussionsCache);
+        return;
+    }
+    
+    try {
+        const params = new URLSearchParams({ q: query, limit: SEARCH_PAGE_SIZE, offset });
+        const response = await fetch(`${API_BASE}/search?${params}`);
+        const data = await response.json();
+        if (!response.ok) {
+            showError(typeof data.detail === 'string' ? data.detail : '搜索失败');
+            return;
+        }
+        
+        searchState = {
+            query,
+            items: offset === 0 ? data.items : searchState.items.concat(data.items),
+            nextOffset: data.next_offset
+        };
+        renderSearchResults();
+    } catch (error) {
+        console.error('搜索失败:', error);
+        showError('搜索失败');
+    }
+}
+
+// topic和snippet由后端转义并用<mark>标记命中部分，可直接插入
+function renderSearchResults() {
+    if (searchState.items.length === 0) {
+        elements.discussionsList.innerHTML = '<p style="padding: 16px; color: var(--text-muted); text-align: center; font-size: 13px;">没有找到相关内容</p>';
+        return;
+    }
+    
+    elements.discussionsList.innerHTML = searchState.items.map(hit => `
+        <div class="discussion-item search-result ${hit.discussion_id === currentDiscussionId ? 'active' : ''}" 
+             onclick="loadDiscussion(${hit.discussion_id})">
+            <div class="discussion-topic">${hit.topic}</div>
+            ${hit.snippet ? `<div class="search-snippet">${hit.agent_name ? `<strong>${escapeHtml(hit.agent_name)}：</strong>` : ''}${hit.snippet}</div>` : ''}
+            <div class="discussion-date">${formatDate(hit.created_at)}</div>
+        </div>
+    `).join('') + (searchState.nextOffset !== null
+        ? '<button class="load-more-btn" onclick="loadMoreSearchResults()">更多结果</button>'
+        : '');
+}
+
+function loadMoreSearchResults() {
+    if (searchState.nextOffset === null) return;
+    searchHistory(searchState.query, searchState.nextOffset);
 }
 
 async function loadDiscussion(id) {
     try {
-        const response = await fetch(`${API_BASE}/discussions/${id}`);
+        const response = await fetch(`${API_BASE}/discussions/${id}?limit=${MESSAGE_PAGE_SIZE}`);
         const data = await response.json();
         
         currentDiscussionId = id;
+        currentMessages = data.messages;
+        messagesSyncCursor = data.sync_cursor;
+        olderMessagesCursor = data.next_cursor;
         elements.currentTopic.textContent = data.discussion.topic;
         elements.welcomeScreen.style.display = 'none';
         
@@ -411,7 +530,7 @@ async function loadDiscussion(id) {
         }
         
         // 更新讨论列表样式
-        await loadDiscussions();
+        renderDiscussions(discussionsCache);
         
         // 滚动到底部
         scrollToBottom();
@@ -422,53 +541,220 @@ async function loadDiscussion(id) {
 }
 
 function renderMessages(messages) {
-    const messagesHtml = messages.map(msg => {
-        if (msg.message_type === 'user') {
-            return `
-                <div class="message user">
-                    <div class="message-header">
-                        <div class="message-avatar">👤</div>
-                        <div class="message-meta">
-                            <div class="message-name">你</div>
-                        </div>
+    messageWindow.reset();
+    elements.messagesContainer.innerHTML = renderOlderMessagesButton() + messages.map(renderMessageHtml).join('');
+    const contents = observeMessageContents(messages);
+    // 底部的几条消息立即渲染，滚动到底部之后高度不再变化
+    contents.slice(-EAGER_RENDER_MESSAGES).forEach(contentDiv => messageWindow.renderNow(contentDiv));
+}
+
+// renderMessageHtml 只生成占位的内容区，按顺序交给 messageWindow 在进入视口时渲染
+function observeMessageContents(messages) {
+    const lazyMessages = messages.filter(msg => LAZY_MESSAGE_TYPES.includes(msg.message_type));
+    const contents = [...elements.messagesContainer.querySelectorAll('.message-content[data-lazy]')];
+    contents.forEach((contentDiv, index) => {
+        contentDiv.removeAttribute('data-lazy');
+        messageWindow.observe(contentDiv, lazyMessages[index].content);
+    });
+    return contents;
+}
+
+function renderOlderMessagesButton() {
+    return olderMessagesCursor
+        ? '<button class="load-more-btn" id="loadOlderBtn" onclick="loadOlderMessages()">加载更早的消息</button>'
+        : '';
+}
+
+function renderMessageHtml(msg) {
+    if (msg.message_type === 'user') {
+        return `
+            <div class="message user">
+                <div class="message-header">
+                    <div class="message-avatar">👤</div>
+                    <div class="message-meta">
+                        <div class="message-name">你</div>
                     </div>
-                    <div class="message-content">${renderMarkdown(msg.content)}</div>
                 </div>
-            `;
-        } else if (msg.message_type === 'agent') {
-            return `
-                <div class="message agent">
-                    <div class="message-header">
-                        <div class="message-avatar">${getAgentInitial(msg.agent_name)}</div>
-                        <div class="message-meta">
-                            <div class="message-name">${escapeHtml(msg.agent_name || 'Agent')}</div>
-                            <div class="message-role">AI分析师</div>
-                        </div>
+                <div class="message-content" data-lazy></div>
+            </div>
+        `;
+    } else if (msg.message_type === 'agent') {
+        return `
+            <div class="message agent" data-message-id="${msg.id}">
+                <div class="message-header">
+                    <div class="message-avatar">${getAgentInitial(msg.agent_name)}</div>
+                    <div class="message-meta">
+                        <div class="message-name">${escapeHtml(msg.agent_name || 'Agent')}</div>
+                        <div class="message-role">AI分析师</div>
                     </div>
-                    <div class="message-content">${renderMarkdown(msg.content)}</div>
                 </div>
-            `;
-        } else if (msg.message_type === 'summary') {
-            return `
-                <div class="message summary">
-                    <div class="message-header">
-                        <div class="message-avatar">📊</div>
-                        <div class="message-meta">
-                            <div class="message-name">智能总结</div>
-                        </div>
+                <div class="message-content" data-lazy></div>
+                ${renderMessageStatus(msg)}
+            </div>
+        `;
+    } else if (msg.message_type === 'summary') {
+        return `
+            <div class="message summary">
+                <div class="message-header">
+                    <div class="message-avatar">📊</div>
+                    <div class="message-meta">
+                        <div class="message-name">智能总结</div>
                     </div>
-                    <div class="message-content">${renderMarkdown(msg.content)}</div>
                 </div>
-            `;
+                <div class="message-content" data-lazy></div>
+            </div>
+        `;
+    }
+    return '';
+}
+
+// 加载更早的一页消息，插入到顶部并保持滚动位置
+async function loadOlderMessages() {
+    if (!currentDiscussionId || !olderMessagesCursor) return;
+    
+    try {
+        const response = await fetch(`${API_BASE}/discussions/${currentDiscussionId}?limit=${MESSAGE_PAGE_SIZE}&cursor=${encodeURIComponent(olderMessagesCursor)}`);
+        const data = await response.json();
+        
+        currentMessages = data.messages.concat(currentMessages);
+        olderMessagesCursor = data.next_cursor;
+        
+        const container = elements.messagesContainer;
+        const previousHeight = container.scrollHeight;
+        const oldButton = document.getElementById('loadOlderBtn');
+        if (oldButton) {
+            oldButton.remove();
+        }
+        container.insertAdjacentHTML('afterbegin', renderOlderMessagesButton() + data.messages.map(renderMessageHtml).join(''));
+        observeMessageContents(data.messages);
+        container.scrollTop += container.scrollHeight - previousHeight;
+    } catch (error) {
+        console.error('加载更早消息失败:', error);
+        showError('加载更早消息失败');
+    }
+}
+
+// 增量同步：只拉取上次同步之后的新消息
+async function syncNewMessages() {
+    if (!currentDiscussionId) return [];
+    
+    try {
+        const response = await fetch(`${API_BASE}/discussions/${currentDiscussionId}/messages?since_message_id=${messagesSyncCursor}`);
+        const delta = await response.json();
+        
+        const known = new Map(currentMessages.map((msg, index) => [msg.id, index]));
+        for (const msg of delta.messages) {
+            if (known.has(msg.id)) {
+                currentMessages[known.get(msg.id)] = msg;
+            } else {
+                currentMessages.push(msg);
+            }
         }
-        return '';
-    }).join('');
+        messagesSyncCursor = delta.sync_cursor;
+        return delta.messages;
+    } catch (error) {
+        console.error('同步新消息失败:', error);
+        return [];
+    }
+}
+
+function renderMessageStatus(msg) {
+    if (msg.status === 'interrupted') {
+        return `
+            <div class="message-interrupted">
+                <span>⚠️ 输出被中断</span>
+                <button onclick="resumeInterruptedMessage(${msg.id})">继续生成</button>
+            </div>
+        `;
+    }
+    if (msg.status === 'streaming') {
+        return '<div class="message-interrupted"><span>⏳ 正在生成...</span></div>';
+    }
+    return '';
+}
+
+async function resumeInterruptedMessage(messageId) {
+    if (!currentDiscussionId || isProcessing) return;
     
-    elements.messagesContainer.innerHTML = messagesHtml;
+    const messageDiv = elements.messagesContainer.querySelector(`[data-message-id="${messageId}"]`);
+    if (!messageDiv) return;
+    const contentDiv = messageDiv.querySelector('.message-content');
+    const statusDiv = messageDiv.querySelector('.message-interrupted');
+    // 续写期间由流式渲染接管内容区
+    messageWindow.release(contentDiv);
+    if (statusDiv) {
+        statusDiv.innerHTML = '<span>⏳ 正在续写...</span>';
+    }
+    
+    isProcessing = true;
+    try {
+        // 续写内容追加在已保存的内容之后
+        const message = currentMessages.find(m => m.id === messageId);
+        let rawContent = message ? message.content : '';
+        
+        const response = await fetch(`${API_BASE}/discussions/${currentDiscussionId}/messages/${messageId}/resume`, {
+            method: 'POST'
+        });
+        assertStreamResponse(response);
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let stream = null;
+        
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            
+            const chunk = decoder.decode(value);
+            const lines = chunk.split('\n');
+            
+            for (const line of lines) {
+                if (line.startsWith('data: ')) {
+                    try {
+                        const data = JSON.parse(line.slice(6));
+                        if (data.type === 'content') {
+                            if (!stream) {
+                                stream = new StreamingMarkdown(contentDiv, { render: renderMarkdown, initialText: rawContent });
+                            }
+                            rawContent += data.content;
+                            stream.append(data.content);
+                        } else if (data.type === 'error') {
+                            showError('续写失败: ' + data.message);
+                        }
+                    } catch (e) {
+                        console.error('解析SSE数据失败:', e);
+                    }
+                }
+            }
+        }
+        
+        if (stream) {
+            stream.finish();
+        }
+        if (message) {
+            message.content = rawContent;
+            message.status = 'completed';
+        }
+        if (statusDiv) {
+            statusDiv.remove();
+        }
+    } catch (error) {
+        console.error('续写失败:', error);
+        showError('续写失败：' + error.message);
+        if (statusDiv) {
+            statusDiv.innerHTML = `<span>⚠️ 输出被中断</span><button onclick="resumeInterruptedMessage(${messageId})">继续生成</button>`;
+        }
+    } finally {
+        isProcessing = false;
+    }
 }
 
 function startNewDiscussion() {
     currentDiscussionId = null;
+    currentMessages = [];
+    messagesSyncCursor = 0;
+    olderMessagesCursor = null;
+    messageWindow.reset();
     elements.currentTopic.textContent = '开始新的讨论';
     elements.messagesContainer.innerHTML = '<div class="welcome-screen" id="welcomeScreen" style="display: flex;"><div class="welcome-content"><h1>欢迎使用 Opinion Room</h1><p>多智能体AI讨论平台</p><div class="welcome-steps"><div class="step"><div class="step-number">1</div><p>添加AI分析师并定义他们的角色</p></div><div class="step"><div class="step-number">2</div><p>输入投资话题开始讨论</p></div><div class="step"><div class="step-number">3</div><p>观看AI分析师们的精彩讨论</p></div></div></div></div>';
     elements.welcomeScreen = document.getElementById('welcomeScreen');
@@ -477,7 +763,7 @@ function startNewDiscussion() {
     elements.sendBtnText.textContent = '开始讨论';
     
     // 更新讨论列表样式
-    loadDiscussions();
+    renderDiscussions(discussionsCache);
 }
 
 // ===== 消息发送 =====
@@ -516,6 +802,10 @@ async function handleSendMessage() {
             });
             const discussion = await response.json();
             currentDiscussionId = discussion.id;
+            currentMessages = [];
+            messagesSyncCursor = 0;
+            olderMessagesCursor = null;
+            addDiscussionToList(discussion);
             elements.currentTopic.textContent = discussion.topic;
             elements.welcomeScreen.style.display = 'none';
             
@@ -529,7 +819,7 @@ async function handleSendMessage() {
         elements.messageInput.value = '';
         elements.sendBtnText.textContent = '继续提问';
         elements.summarizeBtn.style.display = 'block';
-        await loadDiscussions();
+        await syncNewMessages();
     } catch (error) {
         if (error.name === 'AbortError') {
             console.log('请求已中断');
@@ -568,6 +858,10 @@ async function handleMentionMessage(agentName, question) {
             });
             const discussion = await response.json();
             currentDiscussionId = discussion.id;
+            currentMessages = [];
+            messagesSyncCursor = 0;
+            olderMessagesCursor = null;
+            addDiscussionToList(discussion);
             elements.currentTopic.textContent = discussion.topic;
             elements.welcomeScreen.style.display = 'none';
         } catch (error) {
@@ -587,7 +881,7 @@ async function handleMentionMessage(agentName, question) {
         await askSpecificAgent(agent.id, question);
         elements.messageInput.value = '';
         elements.sendBtnText.textContent = '继续提问';
-        await loadDiscussions();
+        await syncNewMessages();
     } catch (error) {
         console.error('@提及失败:', error);
         showError('@提及失败：' + error.message);
@@ -604,6 +898,7 @@ async function askSpecificAgent(agentId, content) {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ agent_id: agentId, content })
     });
+    assertStreamResponse(response);
     
     const reader = response.body.getReader();
     const decoder = new TextDecoder();
@@ -612,6 +907,7 @@ async function askSpecificAgent(agentId, content) {
     let currentMessageDiv = null;
     let currentContentDiv = null;
     let currentRawContent = '';
+    let currentStream = null;  // 当前消息的增量Markdown渲染器
     
     // 先显示用户消息
     const agent = currentAgents.find(a => a.id === agentId);
@@ -634,6 +930,7 @@ async function askSpecificAgent(agentId, content) {
                     if (data.type === 'agent_start') {
                         currentAgentId = data.agent_id;
                         currentRawContent = '';
+                        currentStream = null;
                         currentMessageDiv = appendAgentMessage(data.agent_name, data.agent_role);
                         currentContentDiv = currentMessageDiv.querySelector('.message-content');
                         currentContentDiv.innerHTML = '<div class="typing-indicator"><div class="typing-dot"></div><div class="typing-dot"></div><div class="typing-dot"></div></div>';
@@ -643,14 +940,24 @@ async function askSpecificAgent(agentId, content) {
                             typingIndicator.remove();
                         }
                         
+                        if (!currentStream) {
+                            currentStream = createMarkdownStream(currentContentDiv, currentRawContent);
+                        }
                         currentRawContent += data.content;
-                        currentContentDiv.innerHTML = renderMarkdown(currentRawContent);
-                        scrollToBottom();
+                        currentStream.append(data.content);
                     } else if (data.type === 'agent_end') {
+                        if (currentStream) {
+                            currentStream.finish();
+                            currentStream = null;
+                        }
                         currentAgentId = null;
                         currentContentDiv = null;
                         currentRawContent = '';
                     } else if (data.type === 'error') {
+                        if (currentStream) {
+                            currentStream.cancel();
+                            currentStream = null;
+                        }
                         if (currentContentDiv) {
                             currentContentDiv.textContent = '错误: ' + data.message;
                         }
@@ -691,6 +998,7 @@ async function streamDiscussion(action, content = null) {
     
     try {
         const response = await fetch(url, options);
+        assertStreamResponse(response);
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
         
@@ -698,6 +1006,7 @@ async function streamDiscussion(action, content = null) {
         let currentMessageDiv = null;
         let currentContentDiv = null;
         let currentRawContent = '';  // 累积原始文本用于Markdown渲染
+        let currentStream = null;  // 当前消息的增量Markdown渲染器
         
         while (true) {
             const { done, value } = await reader.read();
@@ -753,6 +1062,7 @@ async function streamDiscussion(action, content = null) {
                         } else if (data.type === 'agent_start') {
                             currentAgentId = data.agent_id;
                             currentRawContent = '';  // 重置累积内容
+                            currentStream = null;
                             const roundInfo = data.round ? ` (第${data.round}轮)` : '';
                             currentMessageDiv = appendAgentMessage(data.agent_name, data.agent_role + roundInfo);
                             currentContentDiv = currentMessageDiv.querySelector('.message-content');
@@ -764,15 +1074,25 @@ async function streamDiscussion(action, content = null) {
                                 typingIndicator.remove();
                             }
                             
-                            // 累积内容并重新渲染Markdown
+                            // 累积内容，增量渲染Markdown
+                            if (!currentStream) {
+                                currentStream = createMarkdownStream(currentContentDiv, currentRawContent);
+                            }
                             currentRawContent += data.content;
-                            currentContentDiv.innerHTML = renderMarkdown(currentRawContent);
-                            scrollToBottom();
+                            currentStream.append(data.content);
                         } else if (data.type === 'agent_end') {
+                            if (currentStream) {
+                                currentStream.finish();
+                                currentStream = null;
+                            }
                             currentAgentId = null;
                             currentContentDiv = null;
                             currentRawContent = '';
                         } else if (data.type === 'error') {
+                            if (currentStream) {
+                                currentStream.cancel();
+                                currentStream = null;
+                            }
                             if (currentContentDiv) {
                                 currentContentDiv.textContent = '错误: ' + data.message + ' (正在重试...)';
                             }
@@ -841,6 +1161,7 @@ async function generateSummary() {
         const response = await fetch(`${API_BASE}/discussions/${currentDiscussionId}/summarize`, {
             method: 'POST'
         });
+        assertStreamResponse(response);
         
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
@@ -861,7 +1182,7 @@ async function generateSummary() {
         const contentDiv = messageDiv.querySelector('.message-content');
         scrollToBottom();
         
-        let summaryContent = '';  // 累积总结内容
+        let summaryStream = null;  // 总结内容的增量Markdown渲染器
         
         while (true) {
             const { done, value } = await reader.read();
@@ -876,16 +1197,13 @@ async function generateSummary() {
                         const data = JSON.parse(line.slice(6));
                         
                         if (data.type === 'content') {
-                            // 移除加载动画
-                            const typingIndicator = contentDiv.querySelector('.typing-indicator');
-                            if (typingIndicator) {
-                                typingIndicator.remove();
+                            // 首个内容替换加载动画
+                            if (!summaryStream) {
+                                summaryStream = createMarkdownStream(contentDiv);
                             }
                             
-                            // 累积内容并重新渲染Markdown
-                            summaryContent += data.content;
-                            contentDiv.innerHTML = renderMarkdown(summaryContent);
-                            scrollToBottom();
+                            // 累积内容，增量渲染Markdown
+                            summaryStream.append(data.content);
                         }
                     } catch (e) {
                         console.error('解析SSE数据失败:', e);
@@ -894,10 +1212,13 @@ async function generateSummary() {
             }
         }
         
+        if (summaryStream) {
+            summaryStream.finish();
+        }
         elements.summarizeBtn.textContent = '生成总结';
     } catch (error) {
         console.error('生成总结失败:', error);
-        showError('生成总结失败');
+        showError('生成总结失败：' + error.message);
     } finally {
         isProcessing = false;
         elements.summarizeBtn.disabled = false;
@@ -924,6 +1245,11 @@ function renderMarkdown(text) {
     }
 }
 
+// 流式输出的Markdown渲染器（见 markdown_stream.js）：每帧最多渲染一次，只重新解析最后未完成的块
+function createMarkdownStream(contentDiv, initialText = '') {
+    return new StreamingMarkdown(contentDiv, { render: renderMarkdown, onRender: scrollToBottom, initialText });
+}
+
 function getAgentInitial(name) {
     return name ? name.charAt(0).toUpperCase() : 'A';
 }
@@ -962,6 +1288,16 @@ function showError(message) {
     alert(message); // 简单实现，可以改为更优雅的提示
 }
 
+// 生成类接口：409表示该讨论正在其他窗口或请求中生成
+function assertStreamResponse(response) {
+    if (response.status === 409) {
+        throw new Error('该讨论正在生成中，请稍后再试');
+    }
+    if (!response.ok) {
+        throw new Error(`请求失败 (${response.status})`);
+    }
+}
+
 // ===== @自动完成功能 =====
 
 let autocompleteIndex = -1;
@@ -1109,131 +1445,31 @@ async function resumeDiscussion() {
 async function triggerDataEnhancement() {
     if (!currentDiscussionId) return;
     
-    try {
-        // 获取所有消息
-        const response = await fetch(`${API_BASE}/discussions/${currentDiscussionId}`);
-        const data = await response.json();
-        
-        // 提取所有Agent消息中的股票代码
-        const allText = data.messages
-            .filter(msg => msg.message_type === 'agent')
-            .map(msg => msg.content)
-            .join(' ');
-        
-        const symbols = extractStockSymbols(allText);
-        
-        if (symbols.length > 0) {
-            elements.enhanceBtn.disabled = true;
-            elements.enhanceBtn.textContent = '📊 加载中...';
-            await enhanceWithStockData(symbols);
-            elements.enhanceBtn.disabled = false;
-            elements.enhanceBtn.textContent = '📊 数据增强';
-        } else {
-            showError('未检测到股票代码，请确保讨论中包含股票名称或代码');
-        }
-    } catch (error) {
-        console.error('数据增强失败:', error);
-        showError('数据增强失败');
-        elements.enhanceBtn.disabled = false;
-        elements.enhanceBtn.textContent = '📊 数据增强';
-    }
+    elements.enhanceBtn.disabled = true;
+    elements.enhanceBtn.textContent = '📊 加载中...';
+    // 股票代码由后端从讨论主题和发言中识别（创建讨论时已开始预取行情）
+    await enhanceWithStockData([]);
+    elements.enhanceBtn.disabled = false;
+    elements.enhanceBtn.textContent = '📊 数据增强';
 }
 
-async function autoEnhanceWithData() {
+async function enhanceWithStockData(symbols = []) {
     if (!currentDiscussionId) return;
     
-    try {
-        // 获取所有消息
-        const response = await fetch(`${API_BASE}/discussions/${currentDiscussionId}`);
-        const data = await response.json();
-        
-        // 提取所有Agent消息中的股票代码
-        const allText = data.messages
-            .filter(msg => msg.message_type === 'agent')
-            .map(msg => msg.content)
-            .join(' ');
-        
-        // 使用简单的正则提取股票代码
-        const symbols = extractStockSymbols(allText);
-        
-        if (symbols.length > 0) {
-            // 调用数据增强API
-            await enhanceWithStockData(symbols);
-        }
-    } catch (error) {
-        console.error('自动增强失败:', error);
-    }
-}
-
-function extractStockSymbols(text) {
-    // 扩展股票代码映射
-    const stockMap = {
-        "特斯拉": "TSLA", "苹果": "AAPL", "微软": "MSFT", "英伟达": "NVDA",
-        "谷歌": "GOOGL", "亚马逊": "AMZN", "Meta": "META", "脸书": "META",
-        "Netflix": "NFLX", "奈飞": "NFLX", "阿里巴巴": "BABA", "腾讯": "TCEHY",
-        "比亚迪": "BYDDF", "蔚来": "NIO", "理想": "LI", "小鹏": "XPEV",
-        "特斯拉": "TSLA", "苹果公司": "AAPL", "微软公司": "MSFT"
-    };
-    
-    // 常见误识别词黑名单（扩展）
-    const blacklist = new Set([
-        "THE", "AND", "FOR", "ARE", "BUT", "NOT", "YOU", "ALL", "CAN", "HER", "WAS", 
-        "ONE", "OUR", "OUT", "DAY", "GET", "HAS", "HIM", "HIS", "HOW", "ITS", "MAY", 
-        "NEW", "NOW", "OLD", "SEE", "TWO", "WAY", "WHO", "BOY", "DID", "LET", "PUT", 
-        "SAY", "SHE", "TOO", "USE", "AI", "IT", "API", "CEO", "CFO", "CTO", "USA", 
-        "UK", "EU", "USD", "CNY", "GDP", "CPI", "PMI", "ETF", "IPO", "SEC", "FDA"
-    ]);
-    
-    // 常见股票代码白名单（美股主要股票）
-    const whitelist = new Set([
-        "AAPL", "MSFT", "GOOGL", "AMZN", "META", "TSLA", "NVDA", "NFLX", "BABA",
-        "JPM", "V", "JNJ", "WMT", "PG", "MA", "UNH", "HD", "DIS", "PYPL", "BAC",
-        "XOM", "VZ", "ADBE", "CMCSA", "NKE", "CSCO", "PFE", "MRK", "ABT", "TMO"
-    ]);
-    
-    const symbols = [];
-    const upperText = text.toUpperCase();
-    
-    // 提取美股代码（2-5个大写字母）
-    const codePattern = /\b([A-Z]{2,5})\b/g;
-    const matches = upperText.matchAll(codePattern);
-    
-    for (const match of matches) {
-        const code = match[1];
-        // 优先检查白名单，如果在白名单中直接添加
-        if (whitelist.has(code)) {
-            symbols.push(code);
-        }
-        // 否则检查是否在黑名单中，如果不在且长度>=2，可能是股票代码
-        else if (!blacklist.has(code) && code.length >= 2 && code.length <= 5) {
-            // 进一步验证：如果代码出现在常见股票上下文中（如"$AAPL"或"AAPL stock"）
-            const context = text.substring(Math.max(0, match.index - 10), Math.min(text.length, match.index + code.length + 10));
-            if (context.includes('$') || context.toLowerCase().includes('stock') || context.toLowerCase().includes('股价')) {
-                symbols.push(code);
-            }
-        }
-    }
-    
-    // 提取中文名称
-    for (const [chinese, symbol] of Object.entries(stockMap)) {
-        if (text.includes(chinese) && !symbols.includes(symbol)) {
-            symbols.push(symbol);
-        }
-    }
-    
-    // 去重并限制数量
-    return [...new Set(symbols)].slice(0, 10);
-}
-
-async function enhanceWithStockData(symbols) {
-    if (!currentDiscussionId || symbols.length === 0) return;
-    
     try {
         const response = await fetch(`${API_BASE}/discussions/${currentDiscussionId}/enhance-with-data`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ symbols })
         });
+        if (response.status === 400) {
+            const error = await response.json().catch(() => ({}));
+            if (error.detail === 'No stock symbols detected') {
+                showError('未检测到股票代码，请确保讨论中包含股票名称或代码');
+                return;
+            }
+        }
+        assertStreamResponse(response);
         
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
@@ -1242,6 +1478,7 @@ async function enhanceWithStockData(symbols) {
         let currentMessageDiv = null;
         let currentContentDiv = null;
         let currentRawContent = '';
+        let currentStream = null;  // 当前消息的增量Markdown渲染器
         
         while (true) {
             const { done, value } = await reader.read();
@@ -1264,6 +1501,7 @@ async function enhanceWithStockData(symbols) {
                         } else if (data.type === 'agent_start') {
                             currentAgentId = data.agent_id;
                             currentRawContent = '';
+                            currentStream = null;
                             currentMessageDiv = appendAgentMessage(data.agent_name, data.agent_role + ' (数据验证)');
                             currentContentDiv = currentMessageDiv.querySelector('.message-content');
                             currentContentDiv.innerHTML = '<div class="typing-indicator"><div class="typing-dot"></div><div class="typing-dot"></div><div class="typing-dot"></div></div>';
@@ -1272,10 +1510,16 @@ async function enhanceWithStockData(symbols) {
                             if (typingIndicator) {
                                 typingIndicator.remove();
                             }
+                            if (!currentStream) {
+                                currentStream = createMarkdownStream(currentContentDiv, currentRawContent);
+                            }
                             currentRawContent += data.content;
-                            currentContentDiv.innerHTML = renderMarkdown(currentRawContent);
-                            scrollToBottom();
+                            currentStream.append(data.content);
                         } else if (data.type === 'agent_end') {
+                            if (currentStream) {
+                                currentStream.finish();
+                                currentStream = null;
+                            }
                             currentAgentId = null;
                             currentContentDiv = null;
                             currentRawContent = '';
@@ -1292,8 +1536,11 @@ async function enhanceWithStockData(symbols) {
                 }
             }
         }
+        
+        await syncNewMessages();
     } catch (error) {
         console.error('数据增强失败:', error);
+        showError('数据增强失败：' + error.message);
     }
 }
 
@@ -1305,6 +1552,10 @@ window.loadDefaultTeam = loadDefaultTeam;
 window.quickChangeModel = quickChangeModel;
 window.loadDiscussion = loadDiscussion;
 window.selectAgent = selectAgent;
+window.resumeInterruptedMessage = resumeInterruptedMessage;
+window.loadMoreDiscussions = loadMoreDiscussions;
+window.loadOlderMessages = loadOlderMessages;
+window.loadMoreSearchResults = loadMoreSearchResults;
 
 // 初始化应用（等待DOM加载完成）
 if (document.readyState === 'loading') {
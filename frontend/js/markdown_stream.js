@@ -0,0 +1,112 @@
+// ===== 流式Markdown增量渲染 =====
+//
+// 流式输出时每个content事件都对全部文本重新 marked.parse，长回复的总耗时是O(n²)。
+// StreamingMarkdown 把已经结束的块（空行之后出现了新块，且不在代码块中）渲染一次后固定下来，
+// 之后只重新解析最后一个未完成的块；多个content事件合并到下一帧（requestAnimationFrame）渲染。
+// 结束时对全文做一次完整渲染，最终结果与 renderMarkdown 一致（例如被拆开的松散列表）。
+
+class StreamingMarkdown {
+    /**
+     * @param {HTMLElement} element 渲染目标（内容会被替换）
+     * @param {Object} options
+     * @param {Function} options.render Markdown -> HTML，默认 marked.parse
+     * @param {Function} options.onRender 每次渲染后调用（例如滚动到底部）
+     * @param {string} options.initialText 已有的文本（续写时）
+     */
+    constructor(element, { render = null, onRender = null, initialText = '' } = {}) {
+        this.element = element;
+        this.render = render || ((text) => marked.parse(text));
+        this.onRender = onRender;
+        this.text = '';
+        this.committed = 0;     // 已固定渲染的文本长度
+        this.scanFrom = 0;      // 下一个未扫描的行首
+        this.fence = null;      // 当前所在代码块的围栏（``` 或 ~~~），null表示不在代码块中
+        this.afterBlank = false;
+        this.frame = null;
+
+        this.element.innerHTML = '';
+        this.stableEl = document.createElement('div');
+        this.tailEl = document.createElement('div');
+        this.element.append(this.stableEl, this.tailEl);
+
+        if (initialText) {
+            this.append(initialText);
+        }
+    }
+
+    append(chunk) {
+        this.text += chunk;
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => this.flush());
+        }
+    }
+
+    /** 立即渲染（不等下一帧） */
+    flush() {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        const boundary = this.scan();
+        if (boundary > this.committed) {
+            this.stableEl.insertAdjacentHTML('beforeend', this.render(this.text.slice(this.committed, boundary)));
+            this.committed = boundary;
+        }
+        const tail = this.text.slice(this.committed);
+        this.tailEl.innerHTML = tail ? this.render(tail) : '';
+        if (this.onRender) {
+            this.onRender();
+        }
+    }
+
+    /** 输出结束：对全文完整渲染一次 */
+    finish() {
+        this.cancel();
+        this.element.innerHTML = this.render(this.text);
+        if (this.onRender) {
+            this.onRender();
+        }
+    }
+
+    /** 放弃未渲染的更新（出错时由调用方改写内容） */
+    cancel() {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+    }
+
+    /**
+     * 扫描新的完整行，返回最后一个可以固定的块边界：
+     * 空行之后、顶格开始的新块的行首（不在代码块中；缩进的行可能属于上一个列表项）
+     */
+    scan() {
+        let boundary = this.committed;
+        let lineStart = this.scanFrom;
+        let lineEnd = this.text.indexOf('\n', lineStart);
+        while (lineEnd !== -1) {
+            const line = this.text.slice(lineStart, lineEnd);
+            if (this.fence) {
+                if (line.trim().startsWith(this.fence) && line.trim().replace(/[`~]/g, '') === '') {
+                    this.fence = null;
+                }
+                this.afterBlank = false;
+            } else if (line.trim() === '') {
+                this.afterBlank = true;
+            } else {
+                if (this.afterBlank && !/^\s/.test(line)) {
+                    boundary = lineStart;
+                }
+                this.afterBlank = false;
+                const open = line.match(/^ {0,3}(`{3,}|~{3,})/);
+                if (open) {
+                    this.fence = open[1];
+                }
+            }
+            lineStart = lineEnd + 1;
+            lineEnd = this.text.indexOf('\n', lineStart);
+        }
+        this.scanFrom = lineStart;
+        return boundary;
+    }
+}
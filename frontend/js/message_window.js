@@ -0,0 +1,117 @@
+// ===== 消息列表窗口化渲染 =====
+//
+// 打开长讨论时，一次性对所有消息 marked.parse 并插入DOM需要数秒，滚动也很卡。
+// MessageWindow 管理历史消息的内容区域：
+// - 消息先以占位的形式插入（只有头部，内容区按文本长度估算高度），不解析Markdown
+// - 内容区进入视口附近时才渲染Markdown，渲染结果缓存，之后再进入视口直接复用
+// - 远离视口的内容区记下实际高度后清空，DOM中只保留视口附近的消息内容
+// - 视口上方的消息高度变化时修正滚动位置，页面内容不会跳动
+
+class MessageWindow {
+    /**
+     * @param {HTMLElement} container 滚动容器
+     * @param {Object} options
+     * @param {Function} options.render Markdown -> HTML，默认 marked.parse
+     * @param {string} options.renderMargin 距视口多远开始渲染
+     * @param {string} options.releaseMargin 距视口多远释放内容（应大于 renderMargin，避免来回渲染）
+     */
+    constructor(container, { render = null, renderMargin = '800px 0px', releaseMargin = '3000px 0px' } = {}) {
+        this.container = container;
+        this.render = render || ((text) => marked.parse(text));
+        this.items = new Map();     // 内容区元素 -> { text, html, rendered }
+        this.renderObserver = new IntersectionObserver((entries) => this.onRender(entries), {
+            root: container,
+            rootMargin: renderMargin
+        });
+        this.releaseObserver = new IntersectionObserver((entries) => this.onRelease(entries), {
+            root: container,
+            rootMargin: releaseMargin
+        });
+    }
+
+    /** 登记一个占位的内容区，进入视口附近时再渲染 */
+    observe(contentEl, text) {
+        const item = { text, html: null, rendered: false };
+        this.items.set(contentEl, item);
+        contentEl.style.minHeight = `${this.estimateHeight(text)}px`;
+        this.renderObserver.observe(contentEl);
+        this.releaseObserver.observe(contentEl);
+    }
+
+    /** 立即渲染（打开讨论时底部可见的消息，避免滚动到底部后高度再变化） */
+    renderNow(contentEl) {
+        const item = this.items.get(contentEl);
+        if (item && !item.rendered) {
+            this.show(contentEl, item);
+        }
+    }
+
+    /** 不再管理该内容区（例如续写时交给流式渲染），保证内容已渲染 */
+    release(contentEl) {
+        this.renderNow(contentEl);
+        this.renderObserver.unobserve(contentEl);
+        this.releaseObserver.unobserve(contentEl);
+        this.items.delete(contentEl);
+    }
+
+    /** 切换讨论时清空 */
+    reset() {
+        this.renderObserver.disconnect();
+        this.releaseObserver.disconnect();
+        this.items.clear();
+    }
+
+    onRender(entries) {
+        for (const entry of entries) {
+            const item = this.items.get(entry.target);
+            if (entry.isIntersecting && item && !item.rendered) {
+                this.keepPosition(entry.target, () => this.show(entry.target, item));
+            }
+        }
+    }
+
+    onRelease(entries) {
+        for (const entry of entries) {
+            const item = this.items.get(entry.target);
+            if (!entry.isIntersecting && item && item.rendered) {
+                this.hide(entry.target, item);
+            }
+        }
+    }
+
+    show(contentEl, item) {
+        if (item.html === null) {
+            item.html = this.render(item.text);
+        }
+        contentEl.innerHTML = item.html;
+        contentEl.style.minHeight = '';
+        item.rendered = true;
+    }
+
+    hide(contentEl, item) {
+        // 按实际高度占位（border-box），释放前后布局不变
+        contentEl.style.minHeight = `${contentEl.offsetHeight}px`;
+        contentEl.innerHTML = '';
+        item.rendered = false;
+    }
+
+    /** 元素在视口上方时，把它的高度变化加到滚动位置上 */
+    keepPosition(contentEl, update) {
+        const above = contentEl.getBoundingClientRect().top < this.container.getBoundingClientRect().top;
+        const before = contentEl.offsetHeight;
+        update();
+        if (above) {
+            this.container.scrollTop += contentEl.offsetHeight - before;
+        }
+    }
+
+    /** 按文本行数粗略估算渲染后的高度（内边距 + 每行行高） */
+    estimateHeight(text) {
+        const charsPerLine = Math.max(20, Math.floor((this.container.clientWidth - 160) / 15));
+        let lines = 0;
+        for (const line of text.split('\n')) {
+            lines += Math.max(1, Math.ceil(line.length / charsPerLine));
+        }
+        return 40 + lines * 27;
+    }
+}